@@ -0,0 +1,10 @@
+"""
+Benchmarks of the vsutil helpers.
+
+Only ``std`` filters on BlankClip inputs are used, so this runs on any machine with VapourSynth installed.
+
+    $ python -m benchmarks --output results.json
+    $ python -m benchmarks --compare results.json --threshold 0.1
+
+The standalone scripts in this package (``decorators.py``, ``import_time.py``) look at single aspects in more detail.
+"""
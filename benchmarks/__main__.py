@@ -0,0 +1,78 @@
+"""
+Runs the benchmark suite, writes the results to JSON, and compares them against earlier results.
+
+    $ python -m benchmarks --output baseline.json
+    $ python -m benchmarks --compare baseline.json --threshold 0.1
+
+When comparing, the exit status is 1 if any case got slower by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+from typing import Any, Dict, List
+
+# Lower is better for call_ns, higher is better for fps.
+METRICS = {'call_ns': 1, 'fps': -1}
+
+
+def compare(baseline: Dict[str, Dict[str, float]], current: Dict[str, Dict[str, float]], threshold: float
+            ) -> List[str]:
+    """Returns a description of every metric that regressed by more than `threshold` (relative)."""
+    regressions = []
+    for name, result in current.items():
+        for metric, sign in METRICS.items():
+            old, new = baseline.get(name, {}).get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * sign
+            if change > threshold:
+                regressions.append(f'{name} {metric}: {old:.1f} -> {new:.1f} ({change:+.1%} worse)')
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('select', nargs='*', help='only run cases whose names start with one of these')
+    parser.add_argument('--output', '-o', help='write the results to this JSON file')
+    parser.add_argument('--compare', '-c', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', '-t', type=float, default=0.1,
+                        help='relative slowdown that counts as a regression (default: 0.1)')
+    parser.add_argument('--frames', '-f', type=int, default=200, help='frames to render per clip, 0 to skip rendering')
+    args = parser.parse_args(argv)
+
+    import vapoursynth as vs
+
+    import vsutil
+
+    from . import suite
+
+    results = suite.run(args.select, args.frames)
+    report: Dict[str, Any] = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'vapoursynth': vs.core.version_number(),
+            'vsutil': vsutil.__version__,
+            'threads': vs.core.num_threads,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,68 @@
+"""
+Per-call overhead of :func:`vsutil.disallow_variable_format` and friends.
+
+Compares the previous implementation, which re-inspected the signature on every call,
+with the current precompiled wrappers and with trusted mode.
+
+    $ python benchmarks/decorators.py
+"""
+import inspect
+import timeit
+from functools import wraps
+from typing import Any, Callable
+
+import vapoursynth as vs
+
+import vsutil
+
+
+def _legacy_disallow_variable_format(function: Callable) -> Callable:
+    """The decorator as it was implemented before the wrappers were precompiled."""
+    def _check(x: Any) -> bool:
+        return isinstance(x, vs.VideoNode) and x.format is None
+
+    @wraps(function)
+    def _wrapper(*args: Any, **kwargs: Any) -> Any:
+        for obj in [*args, *kwargs.values()]:
+            if _check(obj):
+                raise ValueError(f"{function.__name__}: 'Variable-format clips not supported.'")
+
+        for name, param in inspect.signature(function).parameters.items():
+            if param.default is not inspect.Parameter.empty and _check(param.default):
+                raise ValueError(
+                    f"{function.__name__}: 'Variable-format clip not allowed in default argument `{name}`.'"
+                )
+
+        return function(*args, **kwargs)
+
+    return _wrapper
+
+
+def main(number: int = 100_000) -> None:
+    clip = vs.core.std.BlankClip(format=vs.YUV420P8)
+
+    def get_lowest_value(clip: vs.VideoNode, chroma: bool = False) -> float:
+        return 0.
+
+    cases = {
+        'undecorated': get_lowest_value,
+        'legacy': _legacy_disallow_variable_format(get_lowest_value),
+        'precompiled': vsutil.disallow_variable_format(get_lowest_value),
+    }
+
+    baseline = min(timeit.repeat(lambda: get_lowest_value(clip, True), number=number, repeat=5))
+    for name, fn in cases.items():
+        best = min(timeit.repeat(lambda: fn(clip, True), number=number, repeat=5))
+        print(f'{name:>12}: {best / number * 1e9:8.1f} ns/call ({(best - baseline) / number * 1e9:+8.1f} ns overhead)')
+
+    previous = vsutil.set_trusted_mode(True)
+    try:
+        fn = cases['precompiled']
+        best = min(timeit.repeat(lambda: fn(clip, True), number=number, repeat=5))
+        print(f'{"trusted":>12}: {best / number * 1e9:8.1f} ns/call ({(best - baseline) / number * 1e9:+8.1f} ns overhead)')
+    finally:
+        vsutil.set_trusted_mode(previous)
+
+
+if __name__ == '__main__':
+    main()
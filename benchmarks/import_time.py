@@ -0,0 +1,58 @@
+"""
+Start-up time of ``import vsutil`` in a cold interpreter.
+
+Every case runs in a fresh process, so nothing is cached in ``sys.modules``.
+Only importing the helpers that don't need VapourSynth shouldn't load it at all.
+
+    $ python benchmarks/import_time.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES: Dict[str, str] = {
+    'interpreter': 'pass',
+    'import vsutil': 'import vsutil',
+    'vsutil.get_w': 'import vsutil; vsutil.get_w(720)',
+    'vsutil.Range': 'from vsutil import Range',
+    'import vapoursynth': 'import vapoursynth',
+    'vsutil.depth': 'import vsutil; vsutil.depth',
+    'vapoursynth core': 'import vapoursynth; vapoursynth.core.num_threads',
+}
+
+_TIMER = '''
+import sys, time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start, 'vapoursynth' in sys.modules)
+'''
+
+
+def measure(code: str, repeat: int) -> Dict[str, object]:
+    times = []
+    loaded = False
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _TIMER.format(code=code)], cwd=_ROOT,
+                                check=True, capture_output=True, text=True).stdout.split()
+        times.append(float(output[0]))
+        loaded = output[1] == 'True'
+    return {'median': statistics.median(times), 'min': min(times), 'loads_vapoursynth': loaded}
+
+
+def main(repeat: int = 15) -> None:
+    for name, code in CASES.items():
+        try:
+            result = measure(code, repeat)
+        except subprocess.CalledProcessError:
+            print(f'{name:>20}: failed')
+            continue
+        print(f'{name:>20}: {result["median"] * 1e3:8.2f} ms median, {result["min"] * 1e3:8.2f} ms min'
+              f'{" (loads VapourSynth)" if result["loads_vapoursynth"] else ""}')
+
+
+if __name__ == '__main__':
+    main()
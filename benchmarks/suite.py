@@ -0,0 +1,101 @@
+"""
+Benchmark cases of the suite run by ``python -m benchmarks``.
+
+Every case measures the time it takes to build the graph, i.e. the per-call overhead of the helper,
+and, for helpers that return a clip, how fast that clip renders.
+"""
+import timeit
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import vapoursynth as vs
+
+import vsutil
+
+WIDTH, HEIGHT = 1920, 1080
+FORMATS = [vs.GRAY8, vs.YUV420P8, vs.YUV420P16, vs.YUV444PS, vs.RGB24]
+
+
+class Case(NamedTuple):
+    name: str
+    call: Callable[[], object]
+    # Set for helpers that return a clip that's worth rendering.
+    render: bool = False
+
+
+def _blank(fmt: int, length: int = 1000) -> vs.VideoNode:
+    return vs.core.std.BlankClip(format=fmt, width=WIDTH, height=HEIGHT, length=length)
+
+
+def cases() -> Iterator[Case]:
+    for fmt in FORMATS:
+        clip = _blank(fmt)
+        name = clip.format.name
+        yuv = clip.format.color_family == vs.YUV
+
+        yield Case(f'depth/{name}->10', lambda clip=clip: vsutil.depth(clip, 10), True)
+        yield Case(f'depth/{name}->32', lambda clip=clip: vsutil.depth(clip, 32), True)
+        yield Case(f'plane/{name}', lambda clip=clip: vsutil.plane(clip, 0), True)
+        if clip.format.num_planes > 1:
+            planes = vsutil.split(clip)
+            family = clip.format.color_family
+            yield Case(f'split/{name}', lambda clip=clip: vsutil.split(clip))
+            yield Case(f'join/{name}', lambda planes=planes, family=family: vsutil.join(planes, family), True)
+        yield Case(f'insert_clip/{name}', lambda clip=clip: vsutil.insert_clip(clip, clip[:100], 450), True)
+        yield Case(f'frame2clip/{name}', lambda frame=clip.get_frame(0): vsutil.frame2clip(frame))
+        yield Case(f'info/{name}', lambda clip=clip: vsutil.get_subsampling(clip) if yuv else vsutil.get_depth(clip))
+
+    yield Case('scale_value/8->10', lambda: vsutil.scale_value(235, 8, 10))
+    yield Case('scale_value/8->32/chroma', lambda: vsutil.scale_value(240, 8, 32, scale_offsets=True, chroma=True))
+    yield Case('get_w', lambda: vsutil.get_w(1080))
+    yield Case('get_w/mod', lambda: vsutil.get_w(1080, 4 / 3, mod=4))
+
+    clip = _blank(vs.YUV420P8)
+
+    @vsutil.disallow_variable_format
+    def format_checked(clip: vs.VideoNode, chroma: bool = False) -> bool:
+        return chroma
+
+    @vsutil.disallow_variable_resolution
+    def resolution_checked(clip: vs.VideoNode, chroma: bool = False) -> bool:
+        return chroma
+
+    @vsutil.disallow_variable_format(only_first=True)
+    def first_checked(clip: vs.VideoNode, *args: vs.VideoNode) -> bool:
+        return True
+
+    yield Case('decorators/format', lambda: format_checked(clip, True))
+    yield Case('decorators/resolution', lambda: resolution_checked(clip, chroma=True))
+    yield Case('decorators/only_first', lambda: first_checked(clip, clip))
+
+
+def time_call(call: Callable[[], object], repeat: int = 5) -> float:
+    """Returns the best time per call in seconds."""
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def time_render(clip: vs.VideoNode, frames: int) -> float:
+    """Returns the frames per second of rendering the first `frames` frames of `clip`."""
+    iterator = vsutil.frames.FrameIterator(clip, range(min(frames, clip.num_frames)), vs.core.num_threads)
+    for _ in iterator:
+        pass
+    return iterator.fps
+
+
+def run(select: Optional[List[str]] = None, frames: int = 200, log: Callable[[str], object] = print
+        ) -> Dict[str, Dict[str, float]]:
+    """Runs the cases whose names start with one of `select` (default: all of them).
+
+    :return:  Dictionary mapping the names of the cases to the measured ``call_ns`` and, if rendered, ``fps``.
+    """
+    results: Dict[str, Dict[str, float]] = {}
+    for case in cases():
+        if select and not any(case.name.startswith(prefix) for prefix in select):
+            continue
+        result = {'call_ns': time_call(case.call) * 1e9}
+        if case.render and frames:
+            result['fps'] = time_render(case.call(), frames)
+        results[case.name] = result
+        log(f'{case.name:<40} {result["call_ns"]:12.1f} ns/call' + (f' {result["fps"]:10.1f} fps' if 'fps' in result else ''))
+    return results
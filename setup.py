@@ -35,7 +35,7 @@ class DiscoverTest(test):
 setup(
     name='vsutil',
     version=meta['__version__'],
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks', 'benchmarks.*']),
     package_data={
         'vsutil': ['py.typed']
     },
@@ -47,6 +47,9 @@ setup(
     install_requires=[
         "vapoursynth"
     ],
+    extras_require={
+        'numpy': ["numpy"],
+    },
     cmdclass={
         'test': DiscoverTest
     },
@@ -1,12 +1,58 @@
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+import unittest.mock
 
 import vapoursynth as vs
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import vsutil
 
 
 MODULE_FUNCTION = vsutil.function("std", "BlankClip")
 
+
+def chunked_source() -> vs.VideoNode:
+    """Clip for test_render_chunked, which worker processes import from this module."""
+    return vs.core.std.Splice([vs.core.std.BlankClip(format=vs.YUV420P8, width=8, height=4, color=[i, 128, 128], length=1)
+                               for i in range(30)])
+
+
+def variable_format_source() -> vs.VideoNode:
+    """Clip for test_render_chunked that can't be rendered to a stream."""
+    return vs.core.std.Splice([vs.core.std.BlankClip(format=vs.YUV420P8, length=1),
+                               vs.core.std.BlankClip(format=vs.GRAY8, length=1)], mismatch=True)
+
+
+def crashing_source() -> vs.VideoNode:
+    """Clip for test_render_chunked whose worker processes crash once at frames 4 and 22."""
+    clip = chunked_source()
+
+    def crash(n: int) -> vs.VideoNode:
+        flag = os.path.join(os.environ['VSUTIL_TEST_CRASH_DIR'], str(n))
+        if n in (4, 22) and not os.path.exists(flag):
+            open(flag, 'w').close()
+            os._exit(1)
+        return clip
+    return vs.core.std.FrameEval(clip, crash)
+
+
+def ring_consumer(ring, queue) -> None:
+    """Reads the frames of a FrameRing in another process for test_frame_ring."""
+    with ring:
+        queue.put([(n, [plane.copy() for plane in planes]) for n, planes in ring])
+
+
 class VsUtilTests(unittest.TestCase):
     CLASS_FUNCTION = vsutil.function("std", "BlankClip")
 
@@ -72,6 +118,23 @@ class VsUtilTests(unittest.TestCase):
         frame = diff.get_frame(frameno)
         self.assertEqual(frame.props.PlaneStatsDiff, 0)
 
+    def test_lazy_exports(self):
+        for module in vsutil._mods:
+            self.assertEqual(vsutil._exports[module], getattr(vsutil, module).__all__)
+        self.assertEqual(len(vsutil.__all__), len(set(vsutil.__all__)))
+        self.assertIs(vsutil.depth, vsutil.clips.depth)
+        self.assertEqual(set(dir(vsutil)), {*vsutil.__all__, *vsutil._mods, '__author__', '__version__'})
+
+        # The deferred VapourSynth module caches attributes after the first access.
+        deferred = vsutil._vapoursynth.vs
+        self.assertIs(deferred.VideoNode, vs.VideoNode)
+        self.assertIs(vars(deferred)['VideoNode'], vs.VideoNode)
+
+    def test_import_without_vapoursynth(self):
+        code = ('import sys, vsutil; vsutil.get_w(720); vsutil.scale_value(16, 8, 10); vsutil.Range.FULL; '
+                'vsutil.get_depth; vsutil.FrameRing; sys.exit("vapoursynth" in sys.modules)')
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)) or '.')
+
     def test_subsampling(self):
         self.assertEqual('444', vsutil.get_subsampling(self.YUV444P8_CLIP))
         self.assertEqual('440', vsutil.get_subsampling(self.YUV440P8_CLIP))
@@ -90,6 +153,22 @@ class VsUtilTests(unittest.TestCase):
         self.assertEqual(8, vsutil.get_depth(self.YUV420P8_CLIP))
         self.assertEqual(10, vsutil.get_depth(self.YUV420P10_CLIP))
 
+    def test_format_info(self):
+        format_info = vsutil.get_format_info(self.YUV420P10_CLIP)
+        self.assertIs(vsutil.get_format_info(vs.YUV420P10), format_info)
+        self.assertIs(vsutil.get_format_info(self.YUV420P10_CLIP.get_frame(0)), format_info)
+        self.assertEqual(format_info.subsampling, '420')
+        self.assertEqual((format_info.bits_per_sample, format_info.bytes_per_sample), (10, 2))
+        self.assertEqual((format_info.lowest, format_info.neutral, format_info.peak), ((0., 0.), (512., 512.), (1023., 1023.)))
+        self.assertEqual(format_info.plane_size(160, 120, 2), (80, 60))
+
+        float_info = vsutil.get_format_info(vs.YUV444PS)
+        self.assertEqual((float_info.lowest, float_info.neutral, float_info.peak), ((0., -0.5), (0.5, 0.), (1., 0.5)))
+        self.assertIsNone(vsutil.get_format_info(vs.RGB24).subsampling)
+
+        with self.assertRaisesRegex(ValueError, 'Variable-format'):
+            vsutil.get_format_info(self.VARIABLE_FORMAT_CLIP)
+
     def test_plane_size(self):
         self.assertEqual((160, 120), vsutil.get_plane_size(self.YUV420P8_CLIP, 0))
         self.assertEqual((80, 60), vsutil.get_plane_size(self.YUV420P8_CLIP, 1))
@@ -123,6 +202,23 @@ class VsUtilTests(unittest.TestCase):
         with self.assertRaises(ValueError):
             vsutil.insert_clip(self.BLACK_SAMPLE_CLIP, self.BLACK_SAMPLE_CLIP, 90)
 
+    def test_replace_ranges(self):
+        white = self.WHITE_SAMPLE_CLIP
+        replaced = vsutil.replace_ranges(self.BLACK_SAMPLE_CLIP, {(90, 100): white[:10], (0, 5): white[:5], (10, 20): white[:10]})
+        self.assert_same_metadata(self.BLACK_SAMPLE_CLIP, replaced)
+        for n, expected in [(0, white), (4, white), (5, self.BLACK_SAMPLE_CLIP), (10, white), (20, self.BLACK_SAMPLE_CLIP), (99, white)]:
+            self.assert_same_frame(replaced, expected, n)
+
+        self.assertIs(vsutil.replace_ranges(self.BLACK_SAMPLE_CLIP, {(0, 100): white}), white)
+        self.assertIs(vsutil.replace_ranges(self.BLACK_SAMPLE_CLIP, {}), self.BLACK_SAMPLE_CLIP)
+
+        with self.assertRaisesRegex(ValueError, 'overlap'):
+            vsutil.replace_ranges(self.BLACK_SAMPLE_CLIP, {(0, 10): white[:10], (5, 15): white[:10]})
+        with self.assertRaisesRegex(ValueError, 'out of bounds'):
+            vsutil.replace_ranges(self.BLACK_SAMPLE_CLIP, {(95, 105): white[:10]})
+        with self.assertRaisesRegex(ValueError, 'must be 10 frames long'):
+            vsutil.replace_ranges(self.BLACK_SAMPLE_CLIP, {(0, 10): white[:5]})
+
     def test_fallback(self):
         self.assertEqual(vsutil.fallback(None, 'a value'), 'a value')
         self.assertEqual(vsutil.fallback('a value', 'another value'), 'a value')
@@ -152,6 +248,476 @@ class VsUtilTests(unittest.TestCase):
         clip = vsutil.frame2clip(frame)
         self.assert_same_frame(self.WHITE_SAMPLE_CLIP, clip)
 
+    def test_frames2clip(self):
+        frames = [self.BLACK_SAMPLE_CLIP.get_frame(0), self.WHITE_SAMPLE_CLIP.get_frame(0)]
+        clip = vsutil.frames2clip(frames)
+        self.assertEqual(clip.num_frames, 2)
+        self.assert_same_format(clip, self.BLACK_SAMPLE_CLIP)
+        self.assert_same_frame(clip, self.BLACK_SAMPLE_CLIP, 0)
+        self.assert_same_frame(clip, self.WHITE_SAMPLE_CLIP[0] * 2, 1)
+
+        mixed = vsutil.frames2clip([self.YUV420P8_CLIP.get_frame(0), self.RGB24_CLIP.get_frame(0)])
+        self.assertIsNone(mixed.format)
+        self.assertEqual(mixed.get_frame(1).format.id, vs.RGB24)
+
+        with self.assertRaises(ValueError):
+            vsutil.frames2clip([])
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_frame_to_array(self):
+        frame = self.YUV420P10_CLIP.get_frame(0)
+        y, u, v = vsutil.frame_to_array(frame)
+        self.assertEqual(y.shape, (120, 160))
+        self.assertEqual(u.shape, (60, 80))
+        self.assertEqual(y.dtype, numpy.uint16)
+        self.assertTrue((u == 128).all())
+        self.assertFalse(y.flags.writeable)
+        self.assertEqual(vsutil.frame_to_array(frame, 2).shape, (60, 80))
+        with self.assertRaises(ValueError):
+            vsutil.frame_to_array(frame, 3)
+
+        writable = frame.copy()
+        view = vsutil.frame_to_array(writable, 0)
+        view[:] = 1023
+        self.assertIs(vsutil.array_to_frame([view, u, v], writable), writable)
+
+        out = vsutil.array_to_frame([numpy.full((120, 160), 1023, numpy.uint16), u, v], frame)
+        self.assertIsNot(out, frame)
+        self.assertTrue((vsutil.frame_to_array(out, 0) == 1023).all())
+        self.assertTrue((vsutil.frame_to_array(frame, 0) == 0).all())
+        with self.assertRaisesRegex(ValueError, 'expected 3 planes'):
+            vsutil.array_to_frame([y], frame)
+
+    def test_iter_frames(self):
+        clip = vsutil.insert_clip(self.BLACK_SAMPLE_CLIP, self.WHITE_SAMPLE_CLIP[:10], 50)
+        frames = vsutil.iter_frames(clip, 45, 65, prefetch=4)
+
+        averages = [f.props.PlaneStatsAverage for f in vsutil.iter_frames(vs.core.std.PlaneStats(clip), 45, 65, prefetch=4)]
+        self.assertEqual(averages, [0.0] * 5 + [1.0] * 10 + [0.0] * 5)
+
+        with frames:
+            next(frames)
+        self.assertEqual(frames.frames_done, 1)
+        self.assertEqual(list(frames), [])
+
+        # Iterators that are dropped without closing them wait for their requests as well.
+        for _ in vsutil.iter_frames(clip, prefetch=4):
+            break
+        frames = vsutil.iter_frames(clip, prefetch=4)
+        next(frames)
+        pending = list(frames._pending)
+        self.assertEqual(len(pending), 4)
+        del frames
+        self.assertTrue(all(future.done() for future in pending))
+
+        self.assertEqual(len(list(vsutil.iter_frames(clip))), clip.num_frames)
+        with self.assertRaises(ValueError):
+            vsutil.iter_frames(clip, 10, 5)
+        with self.assertRaises(ValueError):
+            vsutil.iter_frames(clip, prefetch=0)
+
+    def test_async_frames(self):
+        clip = vs.core.std.PlaneStats(vsutil.insert_clip(self.BLACK_SAMPLE_CLIP, self.WHITE_SAMPLE_CLIP[:10], 50))
+
+        async def main():
+            frame = await vsutil.aget_frame(clip, 50)
+            self.assertEqual(frame.props.PlaneStatsAverage, 1.0)
+
+            semaphore = asyncio.Semaphore(2)
+            averages = [f.props.PlaneStatsAverage
+                        async for f in vsutil.aiter_frames(clip, 45, 65, prefetch=4, semaphore=semaphore)]
+            self.assertEqual(averages, [0.0] * 5 + [1.0] * 10 + [0.0] * 5)
+
+            async for frame in vsutil.aiter_frames(clip, prefetch=4, semaphore=semaphore):
+                break
+            task = asyncio.ensure_future(vsutil.aget_frame(clip, 0, semaphore=semaphore))
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            # Requests still in flight release the semaphore once they're rendered.
+            for _ in range(100):
+                if semaphore._value == 2:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(semaphore._value, 2)
+
+            with self.assertRaises(ValueError):
+                await vsutil.aget_frame(clip, clip.num_frames)
+            with self.assertRaises(ValueError):
+                async for _ in vsutil.aiter_frames(clip, prefetch=0):
+                    pass
+
+        asyncio.run(main())
+
+    def test_bench(self):
+        threads = vs.core.num_threads
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            result = vsutil.bench(self.BLACK_SAMPLE_CLIP, frames=20, warmup=5, threads=[1, 2], output=path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), result)
+
+        self.assertEqual(vs.core.num_threads, threads)
+        self.assertEqual((result['frames'], result['warmup']), (20, 5))
+        self.assertEqual([run['threads'] for run in result['runs']], [1, 2])
+        self.assertEqual(result['runs'][0]['efficiency'], 1.)
+        latency = result['runs'][1]['latency_ms']
+        self.assertLessEqual(latency['p50'], latency['p95'])
+        self.assertLessEqual(latency['p95'], latency['p99'])
+
+        with self.assertRaises(ValueError):
+            vsutil.bench(self.BLACK_SAMPLE_CLIP, frames=100, warmup=1)
+        # The runs of a clip don't render the same frames twice.
+        with self.assertRaises(ValueError):
+            vsutil.bench(self.BLACK_SAMPLE_CLIP, frames=45, warmup=10, threads=[1, 2])
+
+        clips = []
+
+        def factory():
+            clips.append(vs.core.std.BlankClip(self.BLACK_SAMPLE_CLIP))
+            return clips[-1]
+        result = vsutil.bench(factory, frames=45, warmup=10, threads=[1, 2])
+        self.assertEqual(len(clips), 2)
+        self.assertEqual(result['clip']['num_frames'], 100)
+        self.assertEqual(vsutil.bench(factory, threads=[1])['frames'], 100)
+
+    def test_recipe(self):
+        def pipeline(src):
+            with vsutil.record() as recorder:
+                y = vsutil.depth(vsutil.get_y(src), 16)
+                planes = vsutil.split(src)
+                joined = vsutil.join([planes[0], planes[2], planes[1]])
+                trimmed = vsutil.function('std', 'Trim')(vsutil.join(planes), 0, 9)
+                replaced = vsutil.replace_ranges(joined, {(10, 20): trimmed})
+            return recorder, y, replaced
+
+        recorder, y, replaced = pipeline(self.YUV444P8_CLIP)
+        recipe = recorder.recipe(y, replaced)
+        self.assertEqual(recipe.inputs, 1)
+        self.assertEqual(pipeline(self.YUV444P8_CLIP)[0].recipe(y, replaced).digest, recipe.digest)
+        self.assertEqual(recorder.recipe(y).inputs, 1)
+        self.assertLess(len(recorder.recipe(y).data['steps']), len(recipe.data['steps']))
+
+        loaded = vsutil.Recipe.from_json(recipe.to_json())
+        self.assertEqual(loaded, recipe)
+        rebuilt_y, rebuilt_replaced = loaded.build(self.YUV444P8_CLIP)
+        self.assert_same_metadata(rebuilt_y, y)
+        self.assert_same_metadata(rebuilt_replaced, replaced)
+        self.assert_same_frame(rebuilt_replaced, replaced, 15)
+        with self.assertRaises(ValueError):
+            loaded.build()
+
+        with vsutil.record() as recorder:
+            blank = vsutil.function('std', 'BlankClip')(format=vs.GRAY8, length=5)
+            inverted = vsutil.function('std', 'Lut')(blank, lut=list(range(255, -1, -1)))
+            modified = vsutil.function('std', 'ModifyFrame')(blank, blank, lambda n, f: f)
+        self.assertEqual(recorder.recipe(inverted).inputs, 0)
+        self.assertEqual(recorder.recipe(inverted)().num_frames, 5)
+        with self.assertRaises(ValueError):
+            recorder.recipe(modified)
+        self.assertEqual(vsutil.func._call_hooks, [])
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_find_cut_points(self):
+        scenes = [(0, 30), (30, 70), (70, 100), (100, 150), (150, 200)]
+        clip = vs.core.std.Splice([
+            (self.WHITE_SAMPLE_CLIP if i % 2 else self.BLACK_SAMPLE_CLIP)[:end - start]
+            for i, (start, end) in enumerate(scenes)
+        ])
+        self.assertEqual(vsutil.find_cut_points(clip, 50), [0, 30, 70, 100, 150])
+        self.assertEqual(vsutil.find_cut_points(clip, 100), [0, 100])
+        # Without scene changes in range, chunks are cut at the largest difference.
+        self.assertEqual(vsutil.find_cut_points(self.BLACK_SAMPLE_CLIP, 40, tolerance=0.), [0, 40, 80])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'source.mkv')
+            with open(source, 'wb') as f:
+                f.write(b'v1')
+            self.assertEqual(vsutil.find_cut_points(clip, 50, source_path=source), [0, 30, 70, 100, 150])
+            with numpy.load(source + '.cuts.npz') as index:
+                diffs, key = index['diffs'], index['key']
+            self.assertEqual(diffs.shape, (200,))
+            self.assertEqual(list(numpy.flatnonzero(diffs)), [30, 70, 100, 150])
+
+            # The index is used instead of analyzing the clip again.
+            numpy.savez(source + '.cuts.npz', diffs=numpy.zeros(200), key=key)
+            self.assertEqual(vsutil.find_cut_points(clip, 50, source_path=source, tolerance=0.), [0, 50, 100, 150])
+
+            # ...unless the width or the source changed.
+            self.assertEqual(vsutil.find_cut_points(clip, 50, source_path=source, width=64), [0, 30, 70, 100, 150])
+            numpy.savez(source + '.cuts.npz', diffs=numpy.zeros(200), key=key)
+            with open(source, 'wb') as f:
+                f.write(b'v2!')
+            self.assertEqual(vsutil.find_cut_points(clip, 50, source_path=source), [0, 30, 70, 100, 150])
+
+            # The results are returned even if the index can't be written.
+            with self.assertWarnsRegex(UserWarning, 'index could not be written'):
+                unwritable = os.path.join(tmp, 'missing', 'source.mkv')
+                self.assertEqual(vsutil.find_cut_points(clip, 50, source_path=unwritable), [0, 30, 70, 100, 150])
+
+    def test_render_chunked(self):
+        clip = chunked_source()
+        frames = []
+        progress = []
+        vsutil.render_chunked(chunked_source, lambda n, data: frames.append((n, data)), 4, 2,
+                              progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual([n for n, _ in frames], list(range(30)))
+        self.assertEqual([data[0] for _, data in frames], list(range(30)))
+        self.assertEqual(len(frames[0][1]), 8 * 4 * 3 // 2)
+        self.assertEqual(progress[-1], (30, 30))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.y4m')
+            vsutil.render_chunked(chunked_source, path, workers=2, boundaries=[0, 7, 20])
+            with open(path, 'rb') as f:
+                data = f.read()
+        self.assertEqual(data, vsutil.render._y4m_header(clip) + b''.join(b'FRAME\n' + d for _, d in frames))
+        self.assertTrue(data.startswith(b'YUV4MPEG2 W8 H4 F'))
+
+        # Chunks waiting while another one crashes the worker aren't counted as failed.
+        frames.clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['VSUTIL_TEST_CRASH_DIR'] = tmp
+            try:
+                vsutil.render_chunked(crashing_source, lambda n, data: frames.append((n, data)),
+                                      chunks=10, workers=1, retries=1)
+            finally:
+                del os.environ['VSUTIL_TEST_CRASH_DIR']
+            self.assertEqual(sorted(os.listdir(tmp)), ['22', '4'])
+        self.assertEqual([n for n, _ in frames], list(range(30)))
+        self.assertEqual([data[0] for _, data in frames], list(range(30)))
+
+        with self.assertRaises(ValueError):
+            vsutil.render_chunked(chunked_source, lambda n, data: None, boundaries=[0, 30])
+        with self.assertRaises(ValueError):
+            vsutil.render_chunked(chunked_source, lambda n, data: None, chunks=0)
+        with self.assertRaises(ValueError):
+            vsutil.render_chunked(chunked_source, lambda n, data: None, y4m=True)
+        with self.assertRaisesRegex(ValueError, 'Variable-format'):
+            vsutil.render_chunked(variable_format_source, lambda n, data: None, workers=1)
+
+    def test_write_y4m(self):
+        clip = chunked_source()
+        data = [b''.join(memoryview(f[p]).tobytes() for p in range(3)) for f in vsutil.iter_frames(clip)]
+        self.assertEqual(len(data[0]), 8 * 4 * 3 // 2)
+
+        progress = []
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.y4m')
+            vsutil.write_y4m(clip, path, prefetch=2, progress=lambda *args: progress.append(args))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), vsutil.render._y4m_header(clip) + b''.join(b'FRAME\n' + d for d in data))
+        self.assertEqual([done for done, _, _ in progress], list(range(1, 31)))
+        self.assertEqual(progress[-1][1], 30)
+
+        raw = io.BytesIO()
+        vsutil.write_raw(clip, raw)
+        self.assertEqual(raw.getvalue(), b''.join(data))
+
+        # Buffered files keep writing at the right position afterwards.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.raw')
+            with open(path, 'wb') as f:
+                f.write(b'head')
+                vsutil.write_raw(clip, f)
+                self.assertEqual(f.tell(), 4 + len(b''.join(data)))
+                f.write(b'tail')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'head' + b''.join(data) + b'tail')
+
+        raw = io.BytesIO()
+        vsutil.write_raw(self.RGB24_CLIP[:2], raw)
+        self.assertEqual(len(raw.getvalue()), 2 * 640 * 480 * 3)
+        with self.assertRaisesRegex(ValueError, 'write_y4m'):
+            vsutil.write_y4m(self.RGB24_CLIP, raw)
+        for clip in (self.YUV410P8_CLIP, self.YUV440P8_CLIP):
+            with self.assertRaisesRegex(ValueError, 'write_y4m: Y4M does not support the subsampling'):
+                vsutil.write_y4m(clip, raw)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_frame_ring(self):
+        clip = chunked_source()
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        with vsutil.FrameRing(clip, slots=3) as ring:
+            self.assertEqual([(w, h) for w, h, _ in ring.planes], [(8, 4), (4, 2), (4, 2)])
+            consumer = context.Process(target=ring_consumer, args=(ring, queue))
+            consumer.start()
+            ring.feed(5, 20, prefetch=2)
+            frames = queue.get(timeout=60)
+            consumer.join()
+        self.assertEqual([n for n, _ in frames], list(range(5, 20)))
+        for n, planes in frames:
+            for expected, plane in zip(vsutil.frame_to_array(clip.get_frame(n)), planes):
+                numpy.testing.assert_array_equal(plane, expected)
+
+        with vsutil.FrameRing(clip, slots=1) as ring:
+            ring.put(clip.get_frame(0), 0)
+            with self.assertRaises(TimeoutError):
+                ring.put(clip.get_frame(1), 1, timeout=0.1)
+            n, planes = ring.get()
+            self.assertEqual(n, 0)
+            with self.assertRaises(ValueError):
+                planes[0][0, 0] = 1
+
+        # The end of the stream doesn't wait for the consumer to free a slot, e.g. if it's gone.
+        with vsutil.FrameRing(clip, slots=1) as ring:
+            ring.put(clip.get_frame(0), 0)
+            ring.finish()
+
+        with self.assertRaises(ValueError):
+            vsutil.FrameRing(clip, slots=0)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_get_props(self):
+        clip = vs.core.std.PlaneStats(vsutil.insert_clip(self.BLACK_SAMPLE_CLIP, self.WHITE_SAMPLE_CLIP[:10], 50))
+        clip = vs.core.std.SetFrameProp(clip, '_Combed', intval=1)
+        clip = vsutil.replace_ranges(clip, {(0, 10): vs.core.std.RemoveFrameProps(clip[:10], '_Combed')})
+
+        props = vsutil.get_props(clip, ['PlaneStatsAverage', '_Combed', 'Missing'], range(0, 60, 5), prefetch=3)
+        self.assertEqual(props['PlaneStatsAverage'].dtype, numpy.float64)
+        self.assertEqual(props['PlaneStatsAverage'].tolist(), [0.0] * 10 + [1.0] * 2)
+        self.assertTrue(numpy.isnan(props['_Combed'][:2]).all())
+        self.assertTrue((props['_Combed'][2:] == 1).all())
+        self.assertTrue(numpy.isnan(props['Missing']).all())
+
+        props = vsutil.get_props(clip, ['_Combed'], fill=0)
+        self.assertEqual(props['_Combed'].dtype, numpy.int64)
+        self.assertEqual(len(props['_Combed']), clip.num_frames)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_cache_clip(self):
+        clip = vs.core.std.SetFrameProp(vsutil.insert_clip(self.BLACK_SAMPLE_CLIP, self.WHITE_SAMPLE_CLIP[:10], 50),
+                                        'Marker', intval=7)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'clip.cache')
+
+            cached = vsutil.cache_clip(clip, path, max_size=4 * 4 * 64 * 1024, block_frames=4)
+            self.assert_same_metadata(clip, cached)
+            for n in (0, 55, 0, 55, 99):
+                self.assert_same_frame(clip, cached, n)
+
+            # A second instance serves the frames from the file written by the first one.
+            replay = vsutil.cache_clip(vs.core.std.BlankClip(clip), path, max_size=4 * 4 * 64 * 1024, block_frames=4)
+            self.assert_same_frame(clip, replay, 55)
+            self.assertEqual(replay.get_frame(55).props['Marker'], 7)
+
+            # Cached frames are served without creating nodes.
+            created = []
+
+            class Std:
+                def __getattr__(self, name):
+                    function = getattr(vs.core.std, name)
+                    return lambda *args, **kwargs: created.append(name) or function(*args, **kwargs)
+
+            class Proxy:
+                core = type('Core', (), {'std': Std()})()
+
+                def __getattr__(self, name):
+                    return getattr(vs, name)
+
+            with unittest.mock.patch.object(vsutil.cache, 'vs', Proxy()):
+                replay = vsutil.cache_clip(vs.core.std.BlankClip(clip), path, max_size=4 * 4 * 64 * 1024, block_frames=4)
+                nodes = len(created)
+                for n in (0, 55, 99):
+                    self.assert_same_frame(clip, replay, n)
+            self.assertEqual(len(created), nodes)
+
+            with self.assertRaisesRegex(ValueError, 'different clip'):
+                vsutil.cache_clip(self.YUV444P8_CLIP, path)
+            with self.assertRaisesRegex(ValueError, 'at least two blocks'):
+                vsutil.cache_clip(clip, os.path.join(tmp, 'small.cache'), max_size=1)
+
+            big_props = vs.core.std.SetFrameProp(clip, 'Big', data='x' * 5000)
+            with self.assertWarnsRegex(UserWarning, 'not cached'):
+                cached = vsutil.cache_clip(big_props, os.path.join(tmp, 'big.cache'))
+                self.assert_same_frame(big_props, cached, 0)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_memoize(self):
+        clip = vs.core.std.SetFrameProp(chunked_source(), 'Marker', intval=7)
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'source.txt')
+            with open(source, 'w') as file:
+                file.write('v1')
+
+            store = vsutil.FrameStore(os.path.join(tmp, 'store'))
+            memoized = vsutil.memoize(clip, store, 'chain', sources=[source])
+            self.assert_same_metadata(clip, memoized)
+            for n in (0, 5, 0, 5):
+                self.assert_same_frame(clip, memoized, n)
+            self.assertEqual(store.info().misses, 2)
+            frame_size = store.info().currsize // 2
+
+            # Another graph with the same key is served from the store.
+            replay = vsutil.memoize(vs.core.std.BlankClip(clip), store, 'chain', sources=[source])
+            self.assert_same_frame(clip, replay, 5)
+            self.assertEqual(replay.get_frame(5).props['Marker'], 7)
+            self.assertGreater(store.info().hits, 0)
+
+            # Changing the source invalidates the stored frames.
+            with open(source, 'w') as file:
+                file.write('v2!')
+            changed = vsutil.memoize(vs.core.std.BlankClip(clip), store, 'chain', sources=[source])
+            self.assert_same_frame(vs.core.std.BlankClip(clip), changed, 5)
+
+            small = vsutil.FrameStore(os.path.join(tmp, 'small'), max_size=frame_size * 4)
+            for _ in vsutil.iter_frames(vsutil.memoize(clip, small, 'chain')):
+                pass
+            self.assertLessEqual(small.info().currsize, frame_size * 4)
+            self.assertGreater(small.info().evictions, 0)
+
+            with self.assertRaises(ValueError):
+                vsutil.memoize(clip, store, 1)
+
+            # Rewriting a stored frame doesn't count its size twice.
+            size = store.info().currsize
+            store.write(vsutil.cache._fingerprint(clip, 'chain', [source]), 5, clip.get_frame(5))
+            self.assertEqual(store.info().currsize, size)
+
+            # Without a key, clips of different graphs don't share frames.
+            enable_graph_inspection = getattr(vs.core, 'enable_graph_inspection', None)
+            if enable_graph_inspection is not None:
+                enable_graph_inspection(True)
+                try:
+                    white = vs.core.std.BlankClip(clip, color=[255, 128, 128])
+                    black = vs.core.std.BlankClip(clip, color=[0, 128, 128])
+                    self.assert_same_frame(white, vsutil.memoize(white, store), 0)
+                    self.assert_same_frame(black, vsutil.memoize(black, store), 0)
+                finally:
+                    enable_graph_inspection(False)
+
+    def test_dump_props(self):
+        props = {'int': 1, 'float': [0.5, 1.5], 'str': 'text', 'bytes': b'\x00\xff', 'node': self.BLACK_SAMPLE_CLIP}
+        loaded = vsutil.cache._load_props(vsutil.cache._dump_props(props))
+        self.assertEqual(loaded, {'int': 1, 'float': [0.5, 1.5], 'str': 'text', 'bytes': b'\x00\xff'})
+        with self.assertRaisesRegex(ValueError, 'version'):
+            vsutil.cache._load_props(b'{"version": 0, "props": {}}')
+
+    def test_dedup(self):
+        frames = [0, 0, 0, 1, 1, 2, 3, 3, 1]
+        clip = vsutil.clips._remap_frames(chunked_source(), frames)
+        self.assertEqual(clip.num_frames, len(frames))
+        for n, source in enumerate(frames):
+            self.assert_same_frame(clip[n], chunked_source()[source])
+
+        duplicates = vsutil.find_duplicates(clip)
+        self.assertEqual(duplicates, [0, 0, 0, 3, 3, 5, 6, 6, 3])
+        self.assertEqual(vsutil.find_duplicates(clip, luma_width=4, prefetch=1), duplicates)
+
+        unique, expand = vsutil.dedup(clip)
+        self.assertEqual(unique.num_frames, 4)
+        expanded = expand(unique)
+        self.assert_same_metadata(expanded, clip)
+        for n in range(clip.num_frames):
+            self.assert_same_frame(expanded, clip, n)
+
+        with self.assertRaises(ValueError):
+            expand(clip)
+        with self.assertRaises(ValueError):
+            vsutil.dedup(clip, [0, 0, 1, 2, 3, 4, 5, 6, 7])
+
     def test_is_image(self):
         """These are basically tests for the mime types, but I want the coverage. rooDerp"""
         self.assertEqual(vsutil.is_image('something.png'), True)
@@ -279,6 +845,37 @@ class VsUtilTests(unittest.TestCase):
         self.assertEqual(vsutil.scale_value(0.5, 32, 8, range_in=1, range=0, scale_offsets=True, chroma=True), 240)
         self.assertEqual(vsutil.scale_value((255 - 128) / 255, 32, 8, range_in=1, range=1, scale_offsets=True, chroma=True), 255)
 
+        # sequences and arrays
+        self.assertEqual(vsutil.scale_value([16, 235], 8, 32, range_in=0, scale_offsets=True), [0.0, 1.0])
+        self.assertEqual(vsutil.scale_value((16, 240), 8, 8, range_in=0), (16, 240))
+        with self.assertRaises(ValueError):
+            vsutil.scale_value(1, 8, 16, range_in=2)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_scale_value_array(self):
+        values = numpy.arange(256)
+        for args in [(8, 10, 0, 1, True, False), (8, 32, 0, None, True, True), (8, 8, 1, 1, False, False)]:
+            scaled = vsutil.scale_value(values, *args)
+            self.assertEqual(scaled.tolist(), [vsutil.scale_value(int(v), *args) for v in values])
+        self.assertEqual(values.tolist(), list(range(256)))
+
+        # Unsigned integers must not wrap around when the offset is subtracted.
+        for dtype, depth in [(numpy.uint8, 8), (numpy.uint16, 16)]:
+            values = numpy.array([0, 16 << (depth - 8), 235 << (depth - 8)], dtype)
+            for args in [(depth, 32, 0, None, True, False), (depth, 32, 0, None, True, True), (depth, 8, 0, 1, True, False)]:
+                scaled = vsutil.scale_value(values, *args)
+                self.assertEqual(scaled.tolist(), [vsutil.scale_value(int(v), *args) for v in values])
+                self.assertEqual(vsutil.scale_value(values[1], *args), vsutil.scale_value(int(values[1]), *args))
+
+        # Floats keep their dtype, including NumPy scalars.
+        values = numpy.array([0.25, 0.5], numpy.float32)
+        scaled = vsutil.scale_value(values, 32, 16)
+        self.assertEqual(scaled.dtype, numpy.float32)
+        self.assertEqual(scaled.tolist(), [vsutil.scale_value(0.25, 32, 16), vsutil.scale_value(0.5, 32, 16)])
+        scaled = vsutil.scale_value(numpy.float32(0.5), 32, 8, range=1, scale_offsets=True, chroma=True)
+        self.assertIsInstance(scaled, numpy.float32)
+        self.assertEqual(scaled, numpy.float32(vsutil.scale_value(0.5, 32, 8, range=1, scale_offsets=True, chroma=True)))
+
     def test_get_lowest_value(self):
         FLOAT_CLIP = self.YUV420P8_CLIP.resize.Point(format=self.YUV420P8_CLIP.format.replace(bits_per_sample=32, sample_type=vs.FLOAT))
 
@@ -344,6 +941,103 @@ class VsUtilTests(unittest.TestCase):
 
         self.assert_same_format(vsutil.depth(l_float_16_clip, 16, sample_type=vs.INTEGER), l_int_16_clip)
 
+    def test_depth_fusion(self):
+        src = self.YUV420P8_CLIP
+        self.assertIs(vsutil.depth(vsutil.depth(src, 16), 8), src)
+        self.assertIs(vsutil.depth(vsutil.depth(src, 32), 8), src)
+        self.assertIsNot(vsutil.depth(vsutil.depth(src, 16), 8, fuse=False), src)
+        converted = vsutil.depth(src, 16)
+        self.assertIs(vsutil.depth(converted, 16), converted)
+
+        fused = vsutil.depth(vsutil.depth(src, 16), 10)
+        self.assert_same_format(fused, self.YUV420P10_CLIP)
+        self.assert_same_frame(fused, vsutil.depth(src, 10))
+
+        # Downsampling is lossy, so it's only skipped on request.
+        lossy = vsutil.depth(self.YUV420P10_CLIP, 8)
+        self.assertIsNot(vsutil.depth(lossy, 10), self.YUV420P10_CLIP)
+        self.assertIs(vsutil.depth(lossy, 10, fuse=True), self.YUV420P10_CLIP)
+
+        # A skipped range conversion still determines the output range.
+        full = vsutil.depth(src, 16, range_in=vsutil.Range.LIMITED, range=vsutil.Range.FULL)
+        self.assert_same_frame(vsutil.depth(full, 10, fuse=True),
+                               vsutil.depth(src, 10, range_in=vsutil.Range.LIMITED, range=vsutil.Range.FULL))
+
+        # Ordered dithering can alter exact values, so it's not fused implicitly.
+        self.assertIsNot(vsutil.depth(vsutil.depth(src, 16), 8, dither_type=vsutil.Dither.ORDERED), src)
+
+    def test_expr_compile(self):
+        x, y = vsutil.var('x'), vsutil.var(1)
+        compile_expr = vsutil.expression._compile
+        self.assertEqual(compile_expr(x + y), 'x y +')
+        self.assertEqual(compile_expr(x * (2 + 3) + 0), 'x 5 *')
+        self.assertEqual(compile_expr(vsutil.where(x > 1, x, 0) != 2), 'x 1 > x 0 ? 2 = not')
+        self.assertEqual(compile_expr((x + y) * (x + y)), 'x y + dup swap *')
+        self.assertEqual(compile_expr((x + y) * (x - y) / (x + y + 1)), 'x y + dup x y - * swap 1 + /')
+        self.assertEqual(compile_expr(vsutil.scaled(235), 10), '940')
+        self.assertEqual(compile_expr(vsutil.scaled(128, scale_offsets=True, range_in=vsutil.Range.FULL), 32, True), '0')
+        with self.assertRaises(TypeError):
+            bool(x > y)
+
+    def test_expr(self):
+        black, white = self.BLACK_SAMPLE_CLIP, self.WHITE_SAMPLE_CLIP
+        average = vsutil.expr([black, white], lambda x, y: (x + y) / 2, planes=0)
+        self.assert_same_metadata(average, black)
+        self.assertEqual(average.std.PlaneStats().get_frame(0).props.PlaneStatsAverage, 128 / 255)
+
+        threshold = vsutil.expr(self.YUV420P10_CLIP, lambda x: vsutil.where(x < vsutil.scaled(16), vsutil.scaled(16), x))
+        self.assert_same_format(threshold, self.YUV420P10_CLIP)
+        self.assertEqual(threshold.std.PlaneStats().get_frame(0).props.PlaneStatsMin, 64)
+
+        with self.assertRaises(ValueError):
+            vsutil.expr(self.VARIABLE_FORMAT_CLIP, vsutil.var(0))
+        with self.assertRaises(ValueError):
+            vsutil.expr(black, [vsutil.var(0)])
+
+    def test_expr_fusion(self):
+        src = vsutil.depth(self.WHITE_SAMPLE_CLIP, 32)
+        first = vsutil.expr(src, lambda x: x * 2)
+        second = vsutil.expr([first, src], lambda x, y: x - y, planes=0)
+        step = vsutil.expression._expr_history[second]
+        self.assertEqual(step.clips, (src,))
+        self.assertEqual(vsutil.expression._emit(step.planes[0]), 'x 2 * x -')
+        self.assertEqual(vsutil.expression._emit(step.planes[1]), 'x 2 *')
+        self.assert_same_frame(second, vsutil.expr(src, [vsutil.var(0), vsutil.var(0) * 2, vsutil.var(0) * 2]))
+
+        # Integer intermediate clips are rounded and clamped, so they're only inlined on request.
+        clipped = vsutil.expr(self.WHITE_SAMPLE_CLIP, lambda x: x * 2)
+        self.assertEqual(vsutil.expression._expr_history[vsutil.expr(clipped, lambda x: x / 2)].clips, (clipped,))
+        fused = vsutil.expr(clipped, lambda x: x / 2, fuse=True)
+        self.assertEqual(vsutil.expression._expr_history[fused].clips, (self.WHITE_SAMPLE_CLIP,))
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_make_lut(self):
+        def invert(x):
+            return 255 - x
+
+        inverted = vsutil.make_lut(self.BLACK_SAMPLE_CLIP, invert, planes=0)
+        self.assert_same_metadata(inverted, self.BLACK_SAMPLE_CLIP)
+        self.assert_same_frame(inverted, self.WHITE_SAMPLE_CLIP)
+        self.assertEqual(list(vsutil.expression._lut_cache[invert]), [(vs.YUV420P8,)])
+        table = vsutil.expression._lut_cache[invert][(vs.YUV420P8,)]
+        self.assertEqual(table.dtype, numpy.uint8)
+        self.assertEqual(table[:3].tolist(), [255, 254, 253])
+
+        # Two clips are broadcast against each other, and results are rounded and clamped.
+        table = vsutil.expression._build_lut([self.BLACK_SAMPLE_CLIP, self.YUV420P8_CLIP], lambda x, y: x - y / 2)
+        self.assertEqual(len(table), 256 * 256)
+        self.assertEqual(table[3 << 8 | 10], 9)
+        self.assertEqual(table[255 << 8 | 10], 0)
+
+        averaged = vsutil.make_lut([self.BLACK_SAMPLE_CLIP, self.WHITE_SAMPLE_CLIP], lambda x, y: (x + y) / 2, planes=0)
+        self.assertEqual(averaged.std.PlaneStats().get_frame(0).props.PlaneStatsAverage, 128 / 255)
+
+        # Float clips are evaluated with std.Expr.
+        float_clip = vsutil.depth(self.WHITE_SAMPLE_CLIP, 32)
+        halved = vsutil.make_lut(float_clip, lambda x: vsutil.clamp(x, 0, 1) / 2, planes=0)
+        self.assertIn(halved, vsutil.expression._expr_history)
+        self.assertEqual(halved.std.PlaneStats().get_frame(0).props.PlaneStatsAverage, 0.5)
+
     def test_readable_enums(self):
         self.assertEqual(vsutil.types._readable_enums(vsutil.Range), '<vsutil.Range.LIMITED: 0>, <vsutil.Range.FULL: 1>')
 
@@ -382,6 +1076,37 @@ class VsUtilTests(unittest.TestCase):
     def test_decorators(self):
         with self.assertRaisesRegex(ValueError, 'Variable-format'):
             vsutil.get_subsampling(self.VARIABLE_FORMAT_CLIP)
+        with self.assertRaisesRegex(ValueError, 'Variable-format'):
+            vsutil.get_peak_value(clip=self.VARIABLE_FORMAT_CLIP)
+
+        @vsutil.disallow_variable_format
+        def with_default(clip: vs.VideoNode = self.VARIABLE_FORMAT_CLIP, planes: int = 0) -> bool:
+            return True
+
+        with self.assertRaisesRegex(ValueError, 'default argument `clip`'):
+            with_default(self.YUV420P8_CLIP)
+
+        @vsutil.disallow_variable_resolution(only_first=True)
+        def only_first(clip: vs.VideoNode, other: vs.VideoNode) -> bool:
+            return True
+
+        variable_size = vs.core.std.Splice([self.BLACK_SAMPLE_CLIP, self.SMALLER_SAMPLE_CLIP], mismatch=True)
+        self.assertTrue(only_first(self.YUV420P8_CLIP, variable_size))
+        with self.assertRaisesRegex(ValueError, 'Variable-'):
+            only_first(variable_size, self.YUV420P8_CLIP)
+
+    def test_trusted_mode(self):
+        @vsutil.disallow_variable_format
+        def accepts_anything(clip: vs.VideoNode) -> bool:
+            return True
+
+        self.assertFalse(vsutil.set_trusted_mode(True))
+        try:
+            self.assertTrue(accepts_anything(self.VARIABLE_FORMAT_CLIP))
+        finally:
+            self.assertTrue(vsutil.set_trusted_mode(False))
+        with self.assertRaisesRegex(ValueError, 'Variable-format'):
+            accepts_anything(self.VARIABLE_FORMAT_CLIP)
 
     def test_function(self):
         # It should work generally.
@@ -405,3 +1130,41 @@ class VsUtilTests(unittest.TestCase):
         self.assertEqual(alias_func.name, orig_func.name)
         self.assertEqual(alias_func.signature, orig_func.signature)
         self.assertEqual(alias_func.return_signature, orig_func.return_signature)
+
+    def test_function_cache(self):
+        vsutil.function.cache_clear()
+        alias_func = vsutil.function("std", "BlankClip")
+        alias_func()
+        alias_func()
+        hits, misses, size = vsutil.function.cache_info()
+        self.assertEqual((hits, misses, size), (1, 1, 1))
+
+        with self.assertRaises(AttributeError):
+            vsutil.function("std", "DoesNotExist")()
+        self.assertEqual(vsutil.function.cache_info().currsize, 1)
+
+        # Cached functions are dropped together with their environment.
+        token = vsutil.func._environment_token()
+        self.assertIsNotNone(token)
+        self.assertEqual(vsutil.func._environment_token(), token)
+        self.assertIn(token, vsutil.func._resolved)
+
+    def test_function_interning(self):
+        vsutil.function.intern_clear()
+        previous = vsutil.function.set_interning(True, maxsize=2)
+        try:
+            y = vsutil.plane(self.YUV420P8_CLIP, 0)
+            self.assertIs(vsutil.get_y(self.YUV420P8_CLIP), y)
+            self.assertIsNot(vsutil.plane(self.YUV420P8_CLIP, 1), y)
+            self.assertIsNot(vsutil.plane(self.YUV444P8_CLIP, 0), y)
+            self.assertEqual(vsutil.split(self.YUV420P8_CLIP), vsutil.split(self.YUV420P8_CLIP))
+
+            hits, misses, maxsize, size = vsutil.function.intern_info()
+            self.assertEqual((hits, misses, maxsize, size), (2, 4, 2, 2))
+        finally:
+            vsutil.function.set_interning(previous)
+            vsutil.function.intern_clear()
+
+        self.assertIsNot(vsutil.plane(self.YUV420P8_CLIP, 0), vsutil.plane(self.YUV420P8_CLIP, 0))
+        self.assertIs(vsutil.function("std", "ShufflePlanes", intern=True)(self.YUV420P8_CLIP, 0, vs.GRAY),
+                      vsutil.function("std", "ShufflePlanes", intern=True)(self.YUV420P8_CLIP, 0, vs.GRAY))
@@ -1,19 +1,62 @@
 """
 VSUtil. A collection of general-purpose VapourSynth functions to be reused in modules and scripts.
 """
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Dict, List
 
-# export all public function directly
-from .clips import *
-from .func import *
-from .info import *
-from .types import *
+# Submodules are only imported when one of their functions is first accessed,
+# so that VapourSynth isn't loaded by tools that only use e.g. `Range` or `get_w`.
+# Every name exported by a submodule must be listed here.
+_exports: Dict[str, List[str]] = {
+    'cache': ['FrameStore', 'cache_clip', 'memoize'],
+    'clips': ['dedup', 'depth', 'frame2clip', 'frames2clip', 'get_y', 'insert_clip', 'join', 'plane', 'replace_ranges',
+              'split'],
+    'expression': ['clamp', 'expr', 'make_lut', 'maximum', 'minimum', 'scaled', 'var', 'where'],
+    'frames': ['aget_frame', 'aiter_frames', 'array_to_frame', 'frame_to_array', 'iter_frames'],
+    'func': ['disallow_variable_format', 'disallow_variable_resolution', 'set_trusted_mode', 'fallback', 'iterate',
+             'function'],
+    'info': ['FormatInfo', 'find_duplicates', 'get_depth', 'get_format_info', 'get_plane_size', 'get_props',
+             'get_subsampling', 'get_w', 'is_image', 'scale_value', 'get_lowest_value', 'get_neutral_value', 'get_peak_value'],
+    'recipe': ['Recipe', 'record'],
+    'ring': ['FrameRing'],
+    'render': ['bench', 'find_cut_points', 'render_chunked', 'write_raw', 'write_y4m'],
+    'types': ['Dither', 'Range', 'EXPR_VARS', 'resolve_enum'],
+}
 
 # for wildcard imports
-_mods = ['clips', 'func', 'info', 'types']
+_mods = list(_exports)
+
+__all__ = [name for names in _exports.values() for name in names]
+
+_modules = {name: module for module, names in _exports.items() for name in names}
+
+if TYPE_CHECKING:
+    from .cache import *
+    from .clips import *
+    from .expression import *
+    from .frames import *
+    from .func import *
+    from .info import *
+    from .recipe import *
+    from .render import *
+    from .ring import *
+    from .types import *
+
+
+def __getattr__(name: str) -> Any:
+    if name in _modules:
+        value = getattr(import_module(f'{__name__}.{_modules[name]}'), name)
+    elif name in _exports:
+        value = import_module(f'{__name__}.{name}')
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted({*__all__, *_mods, '__author__', '__version__'})
 
-__all__ = []
-for _pkg in _mods:
-    __all__ += __import__(__name__ + '.' + _pkg, fromlist=_mods).__all__
 
 try:
     from ._metadata import __author__, __version__
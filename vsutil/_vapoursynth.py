@@ -0,0 +1,28 @@
+"""
+Deferred import of VapourSynth for modules that also contain functions which don't need it.
+"""
+import importlib
+import sys
+from types import ModuleType
+from typing import Any
+
+__all__ = ['is_loaded', 'vs']
+
+
+class _DeferredModule(ModuleType):
+    """Stand-in for the :mod:`vapoursynth` module that imports it on the first attribute access."""
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(importlib.import_module(self.__name__), name)
+        # Only the first access of every name goes through here, later ones are plain attribute reads.
+        # The module's attributes (classes, constants, and the `core` proxy) never change, so they can be copied.
+        setattr(self, name, value)
+        return value
+
+
+def is_loaded() -> bool:
+    """Whether VapourSynth has been imported, i.e. whether any of its objects can exist yet."""
+    return 'vapoursynth' in sys.modules
+
+
+vs: Any = _DeferredModule('vapoursynth')
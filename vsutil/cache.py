@@ -0,0 +1,645 @@
+"""
+Functions that cache rendered frames on disk.
+"""
+__all__ = ['FrameStore', 'cache_clip', 'memoize']
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import warnings
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import vapoursynth as vs
+
+from . import frames, func, info
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+    import msvcrt
+
+_MAGIC = b'VSUCACHE'
+_VERSION = 2
+# magic, version, format id, width, height, number of frames, frames per block, number of slots, frame size
+_HEADER = struct.Struct('<8s7IQ')
+_CLOCK_OFFSET = 64
+_PLANE_ALIGNMENT = 64
+_DATA_ALIGNMENT = 4096
+# Space reserved at the end of every frame for its serialized properties, including a 4 byte length prefix.
+_PROPS_SIZE = 4096
+
+
+def _align(value: int, alignment: int) -> int:
+    return -(-value // alignment) * alignment
+
+
+class _FileLock:
+    """Reader-writer lock that excludes other threads of this process and, through the file, other processes.
+
+    Threads of this process share the file's lock, so they're coordinated here:
+    the first reader takes a shared lock on the file and the last one releases it,
+    while a writer waits for all readers and takes an exclusive lock.
+    Waiting writers keep new readers out, so they can't starve.
+    """
+
+    def __init__(self, fileobj: Any) -> None:
+        self._file = fileobj
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def _lock_file(self, shared: bool) -> None:
+        fd = self._file.fileno()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            return
+        # Windows has no shared locks, so readers of different processes exclude each other.
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK only retries for 10 seconds.
+                continue
+
+    def _unlock_file(self) -> None:
+        fd = self._file.fileno()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    @contextmanager
+    def __call__(self, shared: bool = False) -> Iterator[None]:
+        if shared:
+            with self._condition:
+                while self._writing or self._writers_waiting:
+                    self._condition.wait()
+                if not self._readers:
+                    # Other threads wait for this as well, as they need the file's lock just the same.
+                    self._lock_file(shared=True)
+                self._readers += 1
+            try:
+                yield
+            finally:
+                with self._condition:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._unlock_file()
+                        self._condition.notify_all()
+        else:
+            with self._condition:
+                self._writers_waiting += 1
+                try:
+                    while self._writing or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._writers_waiting -= 1
+                self._writing = True
+            try:
+                self._lock_file(shared=False)
+                try:
+                    yield
+                finally:
+                    self._unlock_file()
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+
+def _plane_layout(clip: vs.VideoNode) -> Tuple[List[Tuple[int, int, int]], int]:
+    """Returns offset, width, and height of every plane within a frame, and the size of a frame."""
+    planes = []
+    offset = 0
+    for planeno in range(clip.format.num_planes):
+        width, height = info.get_plane_size(clip, planeno)
+        planes.append((offset, width, height))
+        offset = _align(offset + width * height * clip.format.bytes_per_sample, _PLANE_ALIGNMENT)
+    return planes, offset + _PROPS_SIZE
+
+
+# Version of the serialized frame properties.
+_PROPS_VERSION = 1
+
+
+def _dump_props(props: Any) -> bytes:
+    """Serializes frame properties as JSON, with bytes as hexadecimal strings.
+    Nodes, frames, and functions are skipped."""
+    def encode(value: Any) -> Any:
+        if isinstance(value, (list, tuple)):
+            return [encode(v) for v in value]
+        if isinstance(value, (bytes, bytearray)):
+            return {'bytes': bytes(value).hex()}
+        if isinstance(value, (int, float, str)):
+            return value
+        raise TypeError
+
+    serializable: Dict[str, Any] = {}
+    for key, value in props.items():
+        try:
+            serializable[key] = encode(value)
+        except TypeError:
+            continue
+    return json.dumps({'version': _PROPS_VERSION, 'props': serializable}, separators=(',', ':')).encode()
+
+
+def _load_props(data: bytes) -> Dict[str, Any]:
+    """Deserializes frame properties returned by :func:`_dump_props`."""
+    def decode(value: Any) -> Any:
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        if isinstance(value, dict):
+            return bytes.fromhex(value['bytes'])
+        return value
+
+    loaded = json.loads(data)
+    if loaded.get('version') != _PROPS_VERSION:
+        raise ValueError(f'unsupported version {loaded.get("version")!r} of stored frame properties.')
+    return {key: decode(value) for key, value in loaded['props'].items()}
+
+
+class _FrameCacheFile:
+    """
+    Memory-mapped cache file.
+
+    Frames are grouped into blocks of `block_frames` consecutive frames, which are stored in slots.
+    Without a size limit every block has its own slot, otherwise the least recently used block is evicted
+    when a frame of a block without a slot is stored.
+
+    Layout (little endian):
+        header, padded to 64 bytes
+        uint64 clock, incremented on every access
+        int32 slot of every block (-1 if not cached)
+        int32 block of every slot (-1 if free), aligned to 8 bytes
+        uint64 last access of every slot
+        uint8 whether every frame is present
+        frame data aligned to 4096 bytes, `block_frames` frames per slot
+    """
+
+    def __init__(self, path: str, clip: vs.VideoNode, block_frames: int, max_size: Optional[int]) -> None:
+        self.np = np = func._require_numpy(cache_clip)
+        self.clip = clip
+        self.planes, self.frame_size = _plane_layout(clip)
+        self.block_frames = block_frames
+
+        num_blocks = -(-clip.num_frames // block_frames)
+        num_slots = num_blocks
+        if max_size is not None:
+            num_slots = min(num_blocks, max_size // (block_frames * self.frame_size))
+            if num_slots < 2:
+                raise ValueError('cache_clip: max_size must fit at least two blocks of frames.')
+
+        self.header = _HEADER.pack(_MAGIC, _VERSION, clip.format.id, clip.width, clip.height,
+                                   clip.num_frames, block_frames, num_slots, self.frame_size)
+
+        block_slot = _CLOCK_OFFSET + 8
+        slot_block = _align(block_slot + 4 * num_blocks, 8)
+        slot_tick = slot_block + 4 * num_slots
+        present = slot_tick + 8 * num_slots
+        self.data_offset = _align(present + clip.num_frames, _DATA_ALIGNMENT)
+        size = self.data_offset + num_slots * block_frames * self.frame_size
+
+        if not os.path.exists(path):
+            self._create(path, size, block_slot, slot_block, num_blocks, num_slots)
+
+        self.file = open(path, 'r+b')
+        self.lock = _FileLock(self.file)
+        with self.lock(shared=True):
+            valid = self.file.read(_HEADER.size) == self.header and os.fstat(self.file.fileno()).st_size == size
+        if not valid:
+            self.file.close()
+            raise ValueError(f'cache_clip: {path} is a cache of a different clip or was created with other settings.')
+        self.mm = mmap.mmap(self.file.fileno(), size)
+
+        self.clock = np.ndarray((1,), np.uint64, self.mm, _CLOCK_OFFSET)
+        self.block_slot = np.ndarray((num_blocks,), np.int32, self.mm, block_slot)
+        self.slot_block = np.ndarray((num_slots,), np.int32, self.mm, slot_block)
+        self.slot_tick = np.ndarray((num_slots,), np.uint64, self.mm, slot_tick)
+        self.present = np.ndarray((clip.num_frames,), np.uint8, self.mm, present)
+
+    def _create(self, path: str, size: int, block_slot: int, slot_block: int, num_blocks: int, num_slots: int) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.vsutil-cache-')
+        try:
+            with os.fdopen(fd, 'r+b') as f:
+                f.truncate(size)
+                f.write(self.header)
+                f.seek(block_slot)
+                f.write(b'\xff' * (4 * num_blocks))
+                f.seek(slot_block)
+                f.write(b'\xff' * (4 * num_slots))
+            try:
+                # Unlike a rename, this fails instead of replacing a file another process created in the meantime.
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # The file system doesn't support hard links.
+                if not os.path.exists(path):
+                    os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def _tick(self, slot: int) -> None:
+        self.clock[0] += 1
+        self.slot_tick[slot] = self.clock[0]
+
+    def _frame_views(self, n: int, slot: int) -> Tuple[List[Any], int]:
+        np = self.np
+        base = self.data_offset + (slot * self.block_frames + n % self.block_frames) * self.frame_size
+        dtype = frames._plane_dtype(np, self.clip.format)
+        views = [np.ndarray((height, width), dtype, self.mm, base + offset) for offset, width, height in self.planes]
+        return views, base + self.frame_size - _PROPS_SIZE
+
+    def read(self, n: int, f: vs.VideoFrame) -> Optional[vs.VideoFrame]:
+        """Returns a copy of `f` with the cached data of frame `n`, or ``None`` if it isn't cached."""
+        with self.lock(shared=True):
+            if not self.present[n]:
+                return None
+            slot = int(self.block_slot[n // self.block_frames])
+            fout = f.copy()
+            views, props = self._frame_views(n, slot)
+            for dst, src in zip(frames.frame_to_array(fout), views):
+                self.np.copyto(dst, src)
+            length, = struct.unpack_from('<I', self.mm, props)
+            fout.props.clear()
+            fout.props.update(_load_props(self.mm[props + 4:props + 4 + length]))
+            # Readers update the access times without excluding each other.
+            # Lost updates only make the eviction order slightly less accurate.
+            self._tick(slot)
+            return fout
+
+    def write(self, n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+        props = _dump_props(f.props)
+        if len(props) > _PROPS_SIZE - 4:
+            warnings.warn(f'cache_clip: the properties of frame {n} take more than {_PROPS_SIZE - 4} bytes, '
+                          'so it is not cached.')
+            return f
+
+        block = n // self.block_frames
+        with self.lock():
+            slot = int(self.block_slot[block])
+            if slot < 0:
+                free = self.np.flatnonzero(self.slot_block < 0)
+                slot = int(free[0]) if free.size else int(self.np.argmin(self.slot_tick))
+                evicted = int(self.slot_block[slot])
+                if evicted >= 0:
+                    self.block_slot[evicted] = -1
+                    self.present[evicted * self.block_frames:(evicted + 1) * self.block_frames] = 0
+                self.slot_block[slot] = block
+                self.block_slot[block] = slot
+
+            views, props_offset = self._frame_views(n, slot)
+            for dst, src in zip(views, frames.frame_to_array(f)):
+                self.np.copyto(dst, src)
+            struct.pack_into('<I', self.mm, props_offset, len(props))
+            self.mm[props_offset + 4:props_offset + 4 + len(props)] = props
+            self.present[n] = 1
+            self._tick(slot)
+        return f
+
+
+@func.disallow_variable_format
+@func.disallow_variable_resolution
+def _cached_clip(clip: vs.VideoNode,
+                 read: Callable[[int, vs.VideoFrame], Optional[vs.VideoFrame]],
+                 write: Callable[[int, vs.VideoFrame], vs.VideoFrame],
+                 ) -> vs.VideoNode:
+    """Returns a clip that serves the frames `read` returns from a copy of a blank frame,
+    and renders the others and passes them through `write`."""
+    blank = vs.core.std.BlankClip(clip, keep=True)
+    miss = vs.core.std.ModifyFrame(clip, clip, write)
+    # Frames read by select() until the hit node serves them.
+    # The frame is read right away rather than by the hit node, so another process can't evict it in between.
+    pending: Dict[int, vs.VideoFrame] = {}
+
+    def serve(n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+        fout = pending.pop(n, None)
+        if fout is None:
+            # Another request of the same frame took it already.
+            fout = read(n, f)
+            if fout is None:
+                raise RuntimeError(f'frame {n} was evicted from the cache while it was being served.')
+        return fout
+
+    hit = vs.core.std.ModifyFrame(blank, blank, serve)
+
+    def select(n: int, f: vs.VideoFrame) -> vs.VideoNode:
+        fout = read(n, f)
+        if fout is None:
+            return miss
+        pending[n] = fout
+        return hit
+
+    return vs.core.std.FrameEval(blank, select, prop_src=blank)
+
+
+def cache_clip(clip: vs.VideoNode,
+               path: str,
+               /,
+               *,
+               eager: bool = False,
+               max_size: Optional[int] = None,
+               block_frames: int = 32,
+               ) -> vs.VideoNode:
+    """Caches the rendered frames of a clip in a file, so they don't have to be rendered again,
+    even by other processes or later runs of the same script.
+
+    Frames are rendered and written to the cache when they're first requested.
+    Frames already in the cache are read from a memory-mapped view of the file.
+    The file is validated against the clip's format, size, and length,
+    but not against its contents, so the path should change when the filter chain changes.
+
+    Multiple processes can safely use the same cache file at once.
+    Frame properties are cached as well, except for nodes, frames, and functions.
+    Frames whose properties take more than about 4 KB are not cached, with a warning.
+
+    Requires NumPy.
+
+    >>> filtered = cache_clip(expensive_filter_chain(src), 'episode01.cache')
+
+    :param clip:          Clip to cache.
+    :param path:          Path of the cache file. It's created if it doesn't exist.
+    :param eager:         Render and cache all frames right away.
+    :param max_size:      Maximum size of the cache file in bytes.
+                          When it's full, the least recently used ranges of frames are evicted.
+    :param block_frames:  Number of consecutive frames that are stored and evicted together.
+
+    :return:              Clip that serves frames from the cache.
+    """
+    if block_frames < 1:
+        raise ValueError('cache_clip: block_frames must be at least 1.')
+
+    cache = _FrameCacheFile(path, clip, block_frames, max_size)
+
+    cached = _cached_clip(clip, cache.read, cache.write)
+
+    if eager:
+        for _ in frames.iter_frames(cached):
+            pass
+
+    return cached
+
+
+StoreInfo = namedtuple('StoreInfo', ['hits', 'misses', 'evictions', 'currsize', 'maxsize'])
+
+
+class FrameStore:
+    """Directory of rendered frames addressed by a hash of the graph and the frame number, used by :func:`memoize`.
+
+    When the total size of the stored frames exceeds `max_size`,
+    the least recently used frames are deleted until it's below 90 % of it.
+    Multiple processes can use the same directory at once.
+
+    :param path:      Directory of the store. It's created if it doesn't exist.
+    :param max_size:  Maximum total size of the stored frames in bytes. Unlimited by default.
+    """
+
+    def __init__(self, path: str, max_size: Optional[int] = None) -> None:
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _entries(self) -> Iterator[Tuple[str, float, int]]:
+        """Yields path, last access, and size of every stored frame."""
+        for directory in os.scandir(self.path):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.startswith('.'):
+                    # Frame that's still being written.
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def _entry_path(self, fingerprint: str, n: int) -> str:
+        address = hashlib.sha256(f'{fingerprint}:{n}'.encode()).hexdigest()
+        return os.path.join(self.path, address[:2], address[2:])
+
+    def info(self) -> StoreInfo:
+        """Returns the number of frames served from the store, rendered, and evicted so far by this process,
+        and the current and maximum size of the store in bytes."""
+        with self._lock:
+            return StoreInfo(self._hits, self._misses, self._evictions, self._size, self.max_size)
+
+    def clear(self) -> None:
+        """Deletes all stored frames."""
+        for path, _, _ in list(self._entries()):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def read(self, fingerprint: str, n: int, f: vs.VideoFrame) -> Optional[vs.VideoFrame]:
+        """Returns a copy of `f` with the stored data of frame `n`, or ``None`` if it isn't stored."""
+        np = func._require_numpy(memoize)
+        path = self._entry_path(fingerprint, n)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # Refresh the last access for the eviction order.
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted in the meantime, but the data was read already.
+            pass
+
+        fout = f.copy()
+        props_length, = struct.unpack_from('<I', data)
+        offset = 4 + props_length
+        for dst in frames.frame_to_array(fout):
+            np.copyto(dst, np.frombuffer(data, dst.dtype, dst.size, offset).reshape(dst.shape))
+            offset += dst.nbytes
+        fout.props.clear()
+        fout.props.update(_load_props(data[4:4 + props_length]))
+        with self._lock:
+            self._hits += 1
+        return fout
+
+    def write(self, fingerprint: str, n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+        np = func._require_numpy(memoize)
+        path = self._entry_path(fingerprint, n)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        props = _dump_props(f.props)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(struct.pack('<I', len(props)))
+                file.write(props)
+                for plane in frames.frame_to_array(f):
+                    file.write(np.ascontiguousarray(plane))
+                size = file.tell()
+            try:
+                # Another process may have stored the frame in the meantime, which is replaced rather than added.
+                size -= os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        with self._lock:
+            self._misses += 1
+            self._size += size
+            evict = self.max_size is not None and self._size > self.max_size
+        if evict:
+            self._evict()
+        return f
+
+    def _evict(self) -> None:
+        assert self.max_size is not None
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        size = sum(entry[2] for entry in entries)
+        evicted = 0
+        for path, _, entry_size in entries:
+            if size <= self.max_size * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            size -= entry_size
+            evicted += 1
+        with self._lock:
+            self._size = size
+            self._evictions += evicted
+
+
+_stores: Dict[str, FrameStore] = {}
+
+
+def _describe_graph(clip: vs.VideoNode, sources: List[str]) -> Optional[Any]:
+    """Returns the filters that create `clip` and their arguments,
+    or ``None`` if the graph can't be inspected (see ``core.enable_graph_inspection``).
+
+    Arguments that are paths of existing files are appended to `sources`.
+    """
+    def describe(node: Any) -> Any:
+        try:
+            name, inputs = node._name, node._inputs
+        except (AttributeError, vs.Error):
+            raise LookupError
+        if inputs is None:
+            raise LookupError
+        return {'filter': name, 'args': {key: encode(value) for key, value in inputs.items()}}
+
+    def encode(value: Any) -> Any:
+        if isinstance(value, (list, tuple)):
+            return [encode(v) for v in value]
+        if isinstance(value, vs.RawNode):
+            return describe(value)
+        if isinstance(value, (bytes, bytearray)):
+            return {'bytes': bytes(value).hex()}
+        if isinstance(value, str):
+            if os.path.isfile(value):
+                sources.append(value)
+            return value
+        if isinstance(value, (int, float)) or value is None:
+            return value
+        # Frames and functions, which are described by their type and name only.
+        return {'type': type(value).__name__, 'name': getattr(value, '__qualname__', None)}
+
+    try:
+        return describe(clip)
+    except LookupError:
+        return None
+
+
+def _fingerprint(clip: vs.VideoNode, key: Optional[str], sources: Sequence[str]) -> str:
+    sources = list(sources)
+    description = {
+        'version': _PROPS_VERSION,
+        'key': key,
+        'graph': _describe_graph(clip, sources) if key is None else None,
+        'format': clip.format.id,
+        'size': [clip.width, clip.height],
+        'num_frames': clip.num_frames,
+        'fps': [clip.fps.numerator, clip.fps.denominator],
+        'sources': [],
+    }
+    for source in sorted(set(os.path.abspath(source) for source in sources)):
+        stat = os.stat(source)
+        description['sources'].append([source, stat.st_mtime_ns, stat.st_size])
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+@func.disallow_variable_format
+@func.disallow_variable_resolution
+def memoize(clip: vs.VideoNode,
+            store: Union[str, FrameStore],
+            /,
+            key: Any = None,
+            *,
+            sources: Sequence[str] = (),
+            ) -> vs.VideoNode:
+    """Stores the rendered frames of a clip in a :class:`FrameStore`, so later runs that build the same graph
+    are served from the store instead of rendering them again.
+
+    Unlike :func:`cache_clip`, frames are addressed by a fingerprint of the graph and the frame number,
+    rather than by file, so it doesn't matter what comes after the memoized clip,
+    and any number of clips can share a store with a common size limit.
+
+    The fingerprint covers the format, size, length, and frame rate of `clip`, the size and modification time of
+    `sources`, and either `key` or, without a key, the graph itself. Files the graph reads, like the source video,
+    are passed as `sources`, so that the stored frames are invalidated when they change.
+
+    Without a key, the graph is described by the name and arguments of every filter, which requires
+    ``core.enable_graph_inspection()`` to be called before the graph is built. Arguments that are paths of existing
+    files are added to `sources` automatically. Functions, e.g. of ``std.FrameEval``, are only described by their name,
+    so changing their code doesn't invalidate the stored frames.
+    If the graph can't be inspected, different graphs producing clips of the same format and length share frames,
+    so a key should be passed then, e.g. the :attr:`Recipe.digest` of the clip's :class:`Recipe`
+    or a description of the filters and their settings.
+
+    Requires NumPy.
+
+    >>> with record() as recorder:
+    ...     filtered = expensive_filter_chain(src)
+    >>> filtered = memoize(filtered, 'frames', recorder.recipe(filtered, src).digest, sources=['episode01.mkv'])
+
+    :param clip:     Clip to memoize.
+    :param store:    A :class:`FrameStore` or the path of its directory.
+                     Stores created from paths are shared within the process and have no size limit.
+    :param key:      Identifier of the graph of `clip`. A string or :class:`Recipe`.
+                     Derived from the graph by default.
+    :param sources:  Paths of the files `clip` depends on.
+
+    :return:         Clip that serves frames from the store.
+    """
+    if isinstance(store, str):
+        path = os.path.abspath(store)
+        if path not in _stores:
+            _stores[path] = FrameStore(path)
+        store = _stores[path]
+    if key is not None and not isinstance(key, str):
+        key = getattr(key, 'digest', None)
+        if key is None:
+            raise ValueError('memoize: key must be a string or a Recipe.')
+    fingerprint = _fingerprint(clip, key, sources)
+
+    return _cached_clip(clip,
+                        lambda n, f: store.read(fingerprint, n, f),
+                        lambda n, f: store.write(fingerprint, n, f))
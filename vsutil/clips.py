@@ -1,9 +1,10 @@
 """
 Functions that modify/return a clip.
 """
-__all__ = ['depth', 'frame2clip', 'get_y', 'insert_clip', 'join', 'plane', 'split']
+__all__ = ['dedup', 'depth', 'frame2clip', 'frames2clip', 'get_y', 'insert_clip', 'join', 'plane', 'replace_ranges', 'split']
 
-from typing import Any, List, Optional, Sequence, Union, cast
+import weakref
+from typing import Any, Callable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union, cast
 
 import vapoursynth as vs
 
@@ -11,6 +12,54 @@ from . import func, info, types
 
 core = vs.core
 
+_Loop = func.function('std', 'Loop')
+_Point = func.function('resize', 'Point')
+_ShufflePlanes = func.function('std', 'ShufflePlanes')
+_Splice = func.function('std', 'Splice')
+_SplitPlanes = func.function('std', 'SplitPlanes')
+_Trim = func.function('std', 'Trim')
+
+
+def dedup(clip: vs.VideoNode,
+          /,
+          duplicates: Optional[Sequence[int]] = None,
+          *,
+          luma_width: Optional[int] = None,
+          ) -> Tuple[vs.VideoNode, Callable[[vs.VideoNode], vs.VideoNode]]:
+    """Removes duplicate frames, so that expensive filtering only has to process unique frames.
+
+    Returns a clip of the unique frames and a function that expands a processed version of that clip
+    back to the original timeline by repeating the processed frames in place of their duplicates.
+
+    >>> unique, expand = dedup(src)
+    >>> filtered = expand(expensive_filter_chain(unique))
+
+    Duplicates get the frame properties of the frame they duplicate.
+
+    :param clip:        Input clip.
+    :param duplicates:  The result of :func:`find_duplicates` for `clip`. Computed if not given.
+    :param luma_width:  Passed to :func:`find_duplicates` if `duplicates` isn't given.
+
+    :return:            Clip of the unique frames and the function that expands a clip of the same length.
+    """
+    sources = list(duplicates) if duplicates is not None else info.find_duplicates(clip, luma_width=luma_width)
+    if len(sources) != clip.num_frames:
+        raise ValueError(f'dedup: expected one entry per frame ({clip.num_frames}), got {len(sources)}.')
+
+    unique = [n for n, source in enumerate(sources) if source == n]
+    positions = {n: i for i, n in enumerate(unique)}
+    try:
+        expansion = [positions[source] for source in sources]
+    except KeyError as error:
+        raise ValueError(f'dedup: frame {error.args[0]} is a duplicate of a duplicate.') from None
+
+    def expand(processed: vs.VideoNode) -> vs.VideoNode:
+        if processed.num_frames != len(unique):
+            raise ValueError(f'dedup: expected a clip with {len(unique)} frames, got {processed.num_frames}.')
+        return _remap_frames(processed, expansion)
+
+    return _remap_frames(clip, unique), expand
+
 
 @func.disallow_variable_format
 def depth(clip: vs.VideoNode,
@@ -21,6 +70,7 @@ def depth(clip: vs.VideoNode,
           range: Optional[Union[int, types.Range]] = None,
           range_in: Optional[Union[int, types.Range]] = None,
           dither_type: Optional[Union[types.Dither, str]] = None,
+          fuse: Optional[bool] = None,
           ) -> vs.VideoNode:
     """A bit depth converter only using ``vapoursynth.core.resize()`` and ``vapoursynth.Format.replace()``.
     By default, outputs ``vapoursynth.FLOAT`` sample type for 32-bit and ``vapoursynth.INTEGER`` for anything else.
@@ -35,6 +85,12 @@ def depth(clip: vs.VideoNode,
     >>> src2_8.format.name
     'RGB24'
 
+    Converting a clip returned by this function again converts straight from its source instead,
+    as long as the result is identical to converting twice. Round trips return the source itself.
+
+    >>> depth(depth(src_8, 16), 8) is src_8
+    True
+
     :param clip:         Input clip.
     :param bitdepth:     Desired `bits_per_sample` of output clip.
     :param sample_type:  Desired `sample_type` of output clip. Allows overriding default float/integer behavior.
@@ -48,6 +104,11 @@ def depth(clip: vs.VideoNode,
         converting between ranges, or upsampling full range input.
         Defaults to :attr:`Dither.NONE`, or round to nearest, otherwise.
         See `_should_dither()` comments for more information.
+    :param fuse:         Whether to fuse consecutive conversions of clips returned by this function
+                         into a single conversion from the original clip.
+                         ``None`` (default) only fuses them if the result is bit-identical,
+                         ``True`` always fuses them, even if a lossy intermediate conversion is skipped,
+                         ``False`` never fuses them.
 
     :return:             Converted clip with desired bit depth and sample type. ``ColorFamily`` will be same as input.
     """
@@ -62,12 +123,29 @@ def depth(clip: vs.VideoNode,
     if (curr_depth, clip.format.sample_type, range_in) == (bitdepth, sample_type, range):
         return clip
 
+    step = None if fuse is False else _get_depth_step(clip)
+    if step is not None:
+        source_range_in = func.fallback(range_in, step.range_in)
+        if fuse or (step.lossless and _fuses_exactly(
+            (curr_depth, clip.format.sample_type, range_in),
+            (info.get_depth(step.source), step.source.format.sample_type, source_range_in),
+            bitdepth, sample_type, range, dither_type
+        )):
+            # Without an explicit output range, the output keeps the range the skipped conversion converted to.
+            return depth(step.source, bitdepth, sample_type, range=func.fallback(range, step.range),
+                         range_in=source_range_in, dither_type=dither_type, fuse=False)
+
     should_dither = _should_dither(curr_depth, bitdepth, range_in, range, clip.format.sample_type, sample_type)
     dither_type = func.fallback(dither_type, types.Dither.ERROR_DIFFUSION if should_dither else types.Dither.NONE)
 
     new_format = clip.format.replace(bits_per_sample=bitdepth, sample_type=sample_type).id
 
-    return clip.resize.Point(format=new_format, range=range, range_in=range_in, dither_type=dither_type)
+    converted = _Point(clip, format=new_format, range=range, range_in=range_in, dither_type=dither_type)
+    _set_depth_step(converted, _DepthStep(
+        clip, range_in, range,
+        _is_lossless(curr_depth, bitdepth, range_in, range, clip.format.sample_type, sample_type)
+    ))
+    return converted
 
 
 _unused: Any = []
@@ -85,17 +163,47 @@ def frame2clip(frame: vs.VideoFrame, /, *, enforce_cache=_unused) -> vs.VideoNod
         import warnings
         warnings.warn("enforce_cache is deprecated.", DeprecationWarning)
 
+    return frames2clip([frame.copy()])
+
+
+def frames2clip(frames: Sequence[vs.VideoFrame], /) -> vs.VideoNode:
+    """Converts a sequence of VapourSynth frames to a clip with one frame per element.
+
+    The frames are served from the sequence without being copied, so writable frames
+    must not be modified after being passed to this function.
+    Frames of different formats or sizes result in a variable format and/or variable size clip.
+
+    >>> frames = [src.get_frame(n) for n in keyframes]
+    >>> clip = frames2clip(frames)
+    >>> clip.num_frames == len(keyframes)
+    True
+
+    :param frames:  The frames to convert.
+
+    :return:        A clip of ``len(frames)`` frames that yields ``frames[n]`` as its `n`-th frame.
+    """
+    frames = list(frames)
+    if not frames:
+        raise ValueError('frames2clip: at least one frame is required.')
+
+    first = frames[0]
+    variable = {}
+    if any(f.format.id != first.format.id for f in frames):
+        variable['varformat'] = True
+    if any((f.width, f.height) != (first.width, first.height) for f in frames):
+        variable['varsize'] = True
+
     bc = core.std.BlankClip(
-        width=frame.width,
-        height=frame.height,
-        length=1,
+        width=first.width,
+        height=first.height,
+        length=len(frames),
         fpsnum=1,
         fpsden=1,
-        format=frame.format.id
+        format=first.format.id,
+        keep=True,
+        **variable
     )
-    frame = frame.copy()
-    result = bc.std.ModifyFrame([bc], lambda n, f: frame.copy())
-    return result
+    return bc.std.ModifyFrame([bc], lambda n, f: frames[n])
 
 
 @func.disallow_variable_format
@@ -126,16 +234,9 @@ def insert_clip(clip: vs.VideoNode, /, insert: vs.VideoNode, start_frame: int) -
 
     :return:             Longer clip with frames replaced by the shorter clip.
     """
-    if start_frame == 0:
-        return insert + clip[insert.num_frames:]
-    pre = clip[:start_frame]
-    frame_after_insert = start_frame + insert.num_frames
-    if frame_after_insert > clip.num_frames:
+    if start_frame + insert.num_frames > clip.num_frames:
         raise ValueError('Inserted clip is too long.')
-    if frame_after_insert == clip.num_frames:
-        return pre + insert
-    post = clip[start_frame + insert.num_frames:]
-    return pre + insert + post
+    return replace_ranges(clip, {(start_frame, start_frame + insert.num_frames): insert})
 
 
 def join(planes: Sequence[vs.VideoNode], family: vs.ColorFamily = vs.YUV) -> vs.VideoNode:
@@ -152,7 +253,7 @@ def join(planes: Sequence[vs.VideoNode], family: vs.ColorFamily = vs.YUV) -> vs.
     :return:        Merged clip of the supplied `planes`.
     """
     return planes[0] if len(planes) == 1 and family == vs.GRAY \
-        else core.std.ShufflePlanes(planes, [0, 0, 0], family)
+        else _ShufflePlanes(planes, [0, 0, 0], family)
 
 
 @func.disallow_variable_format
@@ -171,7 +272,71 @@ def plane(clip: vs.VideoNode, planeno: int, /) -> vs.VideoNode:
     """
     if clip.format.num_planes == 1 and planeno == 0:
         return clip
-    return core.std.ShufflePlanes(clip, planeno, vs.GRAY)
+    return _ShufflePlanes(clip, planeno, vs.GRAY)
+
+
+def replace_ranges(clip: vs.VideoNode,
+                   replacements: Mapping[Tuple[int, int], vs.VideoNode],
+                   /,
+                   *,
+                   mismatch: bool = False,
+                   ) -> vs.VideoNode:
+    """Replaces any number of frame ranges of a clip with other clips at once.
+
+    Unlike repeatedly calling :func:`insert_clip`, this creates a single flat splice,
+    so the cost of requesting a frame doesn't grow with the number of replacements.
+
+    >>> fixed = replace_ranges(src, {(100, 124): fixed_op, (2000, 2010): fixed_scene})
+
+    :param clip:          Clip to replace frames of.
+    :param replacements:  Mapping of half-open ``(start, end)`` frame ranges to the clips replacing them.
+                          Every replacement must be exactly ``end - start`` frames long and ranges must not overlap.
+    :param mismatch:      Allow replacements with a different format or size than `clip`.
+
+    :return:              Clip of the same length with the given frame ranges replaced.
+    """
+    pieces: List[vs.VideoNode] = []
+    prev_start, prev_end = 0, 0
+
+    for (start, end), replacement in sorted(replacements.items(), key=lambda item: item[0]):
+        if not 0 <= start < end <= clip.num_frames:
+            raise ValueError(f'replace_ranges: range ({start}, {end}) is out of bounds.')
+        if start < prev_end:
+            raise ValueError(f'replace_ranges: ranges ({prev_start}, {prev_end}) and ({start}, {end}) overlap.')
+        if replacement.num_frames != end - start:
+            raise ValueError(f'replace_ranges: replacement for range ({start}, {end}) must be {end - start} frames long.')
+
+        if start > prev_end:
+            pieces.append(_Trim(clip, prev_end, start - 1))
+        pieces.append(replacement)
+        prev_start, prev_end = start, end
+
+    if prev_end < clip.num_frames:
+        pieces.append(_Trim(clip, prev_end) if prev_end else clip)
+
+    return pieces[0] if len(pieces) == 1 else _Splice(pieces, mismatch=mismatch)
+
+
+def _remap_frames(clip: vs.VideoNode, frames: Sequence[int]) -> vs.VideoNode:
+    """Returns a clip with the given frames of `clip`.
+
+    Runs of consecutive frames become trims, runs of the same frame loops, which are spliced together.
+    """
+    pieces: List[vs.VideoNode] = []
+    i = 0
+    while i < len(frames):
+        j = i
+        if i + 1 < len(frames) and frames[i + 1] == frames[i]:
+            while j + 1 < len(frames) and frames[j + 1] == frames[i]:
+                j += 1
+            pieces.append(_Loop(_Trim(clip, frames[i], frames[i]), j - i + 1))
+        else:
+            while j + 1 < len(frames) and frames[j + 1] == frames[j] + 1:
+                j += 1
+            first, last = frames[i], frames[j]
+            pieces.append(clip if (first, last) == (0, clip.num_frames - 1) else _Trim(clip, first, last))
+        i = j + 1
+    return pieces[0] if len(pieces) == 1 else _Splice(pieces, mismatch=True)
 
 
 @func.disallow_variable_format
@@ -188,7 +353,78 @@ def split(clip: vs.VideoNode, /) -> List[vs.VideoNode]:
 
     :return:      List of planes from the input `clip`.
     """
-    return [clip] if clip.format.num_planes == 1 else cast(List[vs.VideoNode], clip.std.SplitPlanes())
+    return [clip] if clip.format.num_planes == 1 else cast(List[vs.VideoNode], _SplitPlanes(clip))
+
+
+class _DepthStep(NamedTuple):
+    source: vs.VideoNode
+    range_in: Optional[types.Range]
+    range: Optional[types.Range]
+    lossless: bool
+
+
+# Conversion history of the clips returned by depth(), so that chained conversions can be fused.
+_depth_history: 'weakref.WeakKeyDictionary[vs.VideoNode, _DepthStep]' = weakref.WeakKeyDictionary()
+
+
+def _get_depth_step(clip: vs.VideoNode) -> Optional[_DepthStep]:
+    try:
+        return _depth_history.get(clip)
+    except TypeError:
+        # VideoNodes aren't weak-referenceable in this version of VapourSynth.
+        return None
+
+
+def _set_depth_step(clip: vs.VideoNode, step: _DepthStep) -> None:
+    try:
+        _depth_history[clip] = step
+    except TypeError:
+        pass
+
+
+def _is_lossless(in_bits: int,
+                 out_bits: int,
+                 in_range: Optional[types.Range],
+                 out_range: Optional[types.Range],
+                 in_sample_type: vs.SampleType,
+                 out_sample_type: vs.SampleType,
+                 ) -> bool:
+    """
+    Determines whether every input value is exactly representable after the given conversion.
+
+    This is the case for integer upsampling that doesn't need dithering (limited range, or 8 -> 16 bit full range),
+    and for conversions to single precision float from half precision float or integers of up to 24 bits.
+    """
+    if in_range != out_range:
+        return False
+    if out_sample_type == vs.FLOAT:
+        return out_bits == 32 and (in_sample_type == vs.FLOAT or in_bits <= 24)
+    return in_sample_type == vs.INTEGER and out_bits >= in_bits \
+        and not _should_dither(in_bits, out_bits, in_range, out_range, in_sample_type, out_sample_type)
+
+
+def _fuses_exactly(chained: Any, direct: Any,
+                   out_bits: int,
+                   out_sample_type: vs.SampleType,
+                   out_range: Optional[types.Range],
+                   dither_type: Optional[types.Dither],
+                   ) -> bool:
+    """
+    Determines whether converting the output of a lossless conversion gives the same result
+    as converting its source directly. `chained` and `direct` are ``(bits, sample_type, range_in)`` of the
+    intermediate and the source clip.
+
+    Since the intermediate values are exact, the results only differ if the dithering does.
+    Rounding and error diffusion leave values that are exactly representable in the output untouched,
+    so error diffusion in place of no dithering is fine, but ordered and random dithering are not.
+    """
+    def resolved_dither(in_bits: int, in_sample_type: vs.SampleType, in_range: Optional[types.Range]) -> types.Dither:
+        should_dither = _should_dither(in_bits, out_bits, in_range, out_range, in_sample_type, out_sample_type)
+        return func.fallback(dither_type, types.Dither.ERROR_DIFFUSION if should_dither else types.Dither.NONE)
+
+    chained_dither, direct_dither = resolved_dither(*chained), resolved_dither(*direct)
+    return chained_dither in (types.Dither.NONE, types.Dither.ERROR_DIFFUSION) \
+        and direct_dither in (chained_dither, types.Dither.NONE)
 
 
 def _should_dither(in_bits: int,
@@ -0,0 +1,562 @@
+"""
+Builder for ``std.Expr`` expressions.
+"""
+from __future__ import annotations
+
+__all__ = ['clamp', 'expr', 'make_lut', 'maximum', 'minimum', 'scaled', 'var', 'where']
+
+import math
+import operator
+import weakref
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import vapoursynth as vs
+
+from . import func, info, types
+
+_LEAVES = ('var', 'const', 'scaled')
+_TOKENS = {
+    'add': '+', 'sub': '-', 'mul': '*', 'div': '/', 'pow': 'pow', 'max': 'max', 'min': 'min',
+    'lt': '<', 'gt': '>', 'le': '<=', 'ge': '>=', 'eq': '=',
+    'and': 'and', 'or': 'or', 'xor': 'xor', 'not': 'not',
+    'abs': 'abs', 'sqrt': 'sqrt', 'exp': 'exp', 'log': 'log',
+    'where': '?',
+}
+
+_Expr = func.function('std', 'Expr')
+_Lut = func.function('std', 'Lut')
+_Lut2 = func.function('std', 'Lut2')
+
+# Lut2 tables of larger inputs take too long to build and upload.
+_MAX_LUT2_BITS = 20
+
+
+class Operand:
+    """A node of an expression.
+
+    Operands support the arithmetic operators ``+ - * / ** abs()``, the comparisons ``< > <= >= == !=``,
+    which evaluate to ``1`` or ``0``, and ``& | ^ ~`` as logical and, or, xor, and not.
+    They can't be used as Python booleans, use :func:`where` instead of ``if``.
+    """
+    __slots__ = ('op', 'args', 'value')
+
+    def __init__(self, op: str, args: Tuple['Operand', ...] = (), value: Any = None) -> None:
+        self.op = op
+        self.args = args
+        self.value = value
+
+    def __repr__(self) -> str:
+        if self.op == 'var':
+            return types.EXPR_VARS[self.value]
+        if self.op in ('const', 'scaled'):
+            return f'{self.op}({self.value!r})'
+        return f'{self.op}({", ".join(map(repr, self.args))})'
+
+    def __bool__(self) -> bool:
+        raise TypeError('Operands have no truth value, use where() instead.')
+
+    def _binary(self, op: str, other: Any, reflected: bool = False) -> 'Operand':
+        other = _operand(other)
+        return Operand(op, (other, self) if reflected else (self, other))
+
+    def __add__(self, other: Any) -> 'Operand': return self._binary('add', other)
+    def __radd__(self, other: Any) -> 'Operand': return self._binary('add', other, True)
+    def __sub__(self, other: Any) -> 'Operand': return self._binary('sub', other)
+    def __rsub__(self, other: Any) -> 'Operand': return self._binary('sub', other, True)
+    def __mul__(self, other: Any) -> 'Operand': return self._binary('mul', other)
+    def __rmul__(self, other: Any) -> 'Operand': return self._binary('mul', other, True)
+    def __truediv__(self, other: Any) -> 'Operand': return self._binary('div', other)
+    def __rtruediv__(self, other: Any) -> 'Operand': return self._binary('div', other, True)
+    def __pow__(self, other: Any) -> 'Operand': return self._binary('pow', other)
+    def __rpow__(self, other: Any) -> 'Operand': return self._binary('pow', other, True)
+    def __lt__(self, other: Any) -> 'Operand': return self._binary('lt', other)
+    def __gt__(self, other: Any) -> 'Operand': return self._binary('gt', other)
+    def __le__(self, other: Any) -> 'Operand': return self._binary('le', other)
+    def __ge__(self, other: Any) -> 'Operand': return self._binary('ge', other)
+    def __eq__(self, other: Any) -> 'Operand': return self._binary('eq', other)  # type: ignore[override]
+    def __ne__(self, other: Any) -> 'Operand': return ~self._binary('eq', other)  # type: ignore[override]
+    def __and__(self, other: Any) -> 'Operand': return self._binary('and', other)
+    def __rand__(self, other: Any) -> 'Operand': return self._binary('and', other, True)
+    def __or__(self, other: Any) -> 'Operand': return self._binary('or', other)
+    def __ror__(self, other: Any) -> 'Operand': return self._binary('or', other, True)
+    def __xor__(self, other: Any) -> 'Operand': return self._binary('xor', other)
+    def __rxor__(self, other: Any) -> 'Operand': return self._binary('xor', other, True)
+    def __invert__(self) -> 'Operand': return Operand('not', (self,))
+    def __neg__(self) -> 'Operand': return self._binary('mul', -1)
+    def __pos__(self) -> 'Operand': return self
+    def __abs__(self) -> 'Operand': return Operand('abs', (self,))
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def sqrt(self) -> 'Operand':
+        """Square root."""
+        return Operand('sqrt', (self,))
+
+    def exp(self) -> 'Operand':
+        """Exponential function."""
+        return Operand('exp', (self,))
+
+    def log(self) -> 'Operand':
+        """Natural logarithm."""
+        return Operand('log', (self,))
+
+
+def _operand(value: Any) -> Operand:
+    if isinstance(value, Operand):
+        return value
+    if isinstance(value, (int, float)):
+        return Operand('const', value=value)
+    raise TypeError(f'Unsupported operand {value!r}.')
+
+
+def _is_operand(*values: Any) -> bool:
+    return any(isinstance(v, Operand) for v in values)
+
+
+def var(name: Union[int, str]) -> Operand:
+    """Returns the operand representing an input clip of :func:`expr`.
+
+    >>> var('y')
+    y
+    >>> var(1)
+    y
+
+    :param name:  Letter of the clip (see :data:`EXPR_VARS`) or its index.
+
+    :return:      Operand for the clip.
+    """
+    index = types.EXPR_VARS.index(name) if isinstance(name, str) else name
+    if not 0 <= index < len(types.EXPR_VARS):
+        raise ValueError(f'var: there is no clip variable {name!r}.')
+    return Operand('var', value=index)
+
+
+def scaled(value: float,
+           depth: int = 8,
+           *,
+           range_in: Union[int, types.Range] = types.Range.LIMITED,
+           range: Optional[Union[int, types.Range]] = None,
+           scale_offsets: bool = False,
+           ) -> Operand:
+    """Returns a constant that's scaled to the bit depth of the first input clip with :func:`scale_value`
+    when the expression is compiled, so that thresholds follow the bit depth of the input.
+    Values in chroma planes of YUV clips are scaled as chroma.
+
+    >>> expr(clip, lambda x: where(x > scaled(235), scaled(235), x))
+
+    :param value:          Value at the given bit depth.
+    :param depth:          Bit depth of `value`. Use ``32`` for float.
+    :param range_in:       Pixel range of `value`. See :func:`scale_value`.
+    :param range:          Pixel range of the scaled value. See :func:`scale_value`.
+    :param scale_offsets:  Whether to apply YUV offsets. See :func:`scale_value`.
+
+    :return:               Operand for the scaled value.
+    """
+    return Operand('scaled', value=(value, depth, range_in, range, scale_offsets))
+
+
+def where(condition: Any, if_true: Any, if_false: Any) -> Any:
+    """Selects `if_true` where `condition` is positive and `if_false` otherwise.
+
+    Works on operands, and on NumPy arrays (using ``numpy.where``) for use in :func:`make_lut`.
+    """
+    if not _is_operand(condition, if_true, if_false):
+        return func._require_numpy(where).where(condition > 0, if_true, if_false)
+    return Operand('where', (_operand(condition), _operand(if_true), _operand(if_false)))
+
+
+def minimum(a: Any, b: Any) -> Any:
+    """Element-wise minimum of operands or NumPy arrays."""
+    if not _is_operand(a, b):
+        return func._require_numpy(minimum).minimum(a, b)
+    return Operand('min', (_operand(a), _operand(b)))
+
+
+def maximum(a: Any, b: Any) -> Any:
+    """Element-wise maximum of operands or NumPy arrays."""
+    if not _is_operand(a, b):
+        return func._require_numpy(maximum).maximum(a, b)
+    return Operand('max', (_operand(a), _operand(b)))
+
+
+def clamp(value: Any, low: Any, high: Any) -> Any:
+    """Clamps operands or NumPy arrays to the range from `low` to `high`."""
+    return minimum(maximum(value, low), high)
+
+
+def _fold(op: str, values: List[float]) -> Optional[float]:
+    """Evaluates an operation on constants like std.Expr does, or returns ``None`` if it can't be folded."""
+    try:
+        if op in ('lt', 'gt', 'le', 'ge', 'eq'):
+            return float(getattr(operator, op)(*values))
+        if op in ('and', 'or', 'xor'):
+            a, b = (v > 0 for v in values)
+            return float(a and b if op == 'and' else a or b if op == 'or' else a != b)
+        if op == 'not':
+            return float(values[0] <= 0)
+        if op == 'where':
+            return values[1] if values[0] > 0 else values[2]
+        if op in ('max', 'min'):
+            return float((max if op == 'max' else min)(values))
+        if op == 'abs':
+            return abs(values[0])
+        if op in ('sqrt', 'exp', 'log'):
+            return getattr(math, op)(values[0])
+        result = {'add': operator.add, 'sub': operator.sub, 'mul': operator.mul,
+                  'div': operator.truediv, 'pow': operator.pow}[op](*values)
+    except (ArithmeticError, ValueError):
+        return None
+    if isinstance(result, complex) or not math.isfinite(result):
+        return None
+    return result
+
+
+def _is_const(node: Operand, value: float) -> bool:
+    return node.op == 'const' and node.value == value
+
+
+class _Compiler:
+    """Canonicalizes an expression into a DAG, folding constants and merging identical subexpressions."""
+
+    def __init__(self, bits: int, chroma: bool) -> None:
+        self.bits = bits
+        self.chroma = chroma
+        self._table: Dict[Any, Operand] = {}
+        self._memo: Dict[int, Operand] = {}
+
+    def _intern(self, op: str, args: Tuple[Operand, ...] = (), value: Any = None) -> Operand:
+        key = (op, value, tuple(map(id, args)))
+        if key not in self._table:
+            self._table[key] = Operand(op, args, value)
+        return self._table[key]
+
+    def canonical(self, node: Operand) -> Operand:
+        try:
+            return self._memo[id(node)]
+        except KeyError:
+            pass
+
+        if node.op == 'var':
+            result = self._intern('var', value=node.value)
+        elif node.op == 'const':
+            result = self._intern('const', value=float(node.value))
+        elif node.op == 'scaled':
+            value, depth, range_in, range, scale_offsets = node.value
+            result = self._intern('const', value=float(info.scale_value(
+                value, depth, self.bits, range_in, range, scale_offsets=scale_offsets, chroma=self.chroma
+            )))
+        else:
+            args = tuple(self.canonical(arg) for arg in node.args)
+            result = self._simplify(node.op, args)
+
+        # Keep `node` alive, so that its id can't be reused while the memo exists.
+        self._memo[id(node)] = result
+        self._table[('memo', id(node))] = node
+        return result
+
+    def _simplify(self, op: str, args: Tuple[Operand, ...]) -> Operand:
+        if all(arg.op == 'const' for arg in args):
+            folded = _fold(op, [arg.value for arg in args])
+            if folded is not None:
+                return self._intern('const', value=float(folded))
+
+        if op == 'where' and args[0].op == 'const':
+            return args[1] if args[0].value > 0 else args[2]
+        if op in ('add', 'sub') and _is_const(args[1], 0) or op in ('mul', 'div', 'pow') and _is_const(args[1], 1):
+            return args[0]
+        if op == 'add' and _is_const(args[0], 0) or op == 'mul' and _is_const(args[0], 1):
+            return args[1]
+
+        return self._intern(op, args)
+
+
+def _format_number(value: float) -> str:
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(value)
+
+
+def _emit(root: Operand) -> str:
+    """
+    Emits the RPN string of a canonical expression.
+
+    Subexpressions that are used more than once are computed first and kept at the bottom of the stack.
+    Every use but the last one copies them with ``dupN``.
+    The last use moves them to the top with ``swap1 swap2 ... swapN`` (preserving the order of everything else),
+    so that no values are left on the stack in the end.
+    """
+    uses: Dict[int, int] = {id(root): 1}
+    postorder: List[Operand] = []
+
+    def count(node: Operand) -> None:
+        for arg in node.args:
+            uses[id(arg)] = uses.get(id(arg), 0) + 1
+            if uses[id(arg)] == 1:
+                count(arg)
+        postorder.append(node)
+
+    count(root)
+
+    tokens: List[str] = []
+    # Every entry is either a shared node that's still needed, or None for temporary values.
+    stack: List[Optional[Operand]] = []
+    remaining: Dict[int, int] = {}
+
+    def use(node: Operand) -> None:
+        if id(node) in remaining:
+            index = next(i for i, entry in enumerate(stack) if entry is node)
+            depth = len(stack) - 1 - index
+            remaining[id(node)] -= 1
+            if remaining[id(node)]:
+                tokens.append('dup' if depth == 0 else f'dup{depth}')
+                stack.append(None)
+            else:
+                del remaining[id(node)]
+                for i in range(1, depth + 1):
+                    tokens.append('swap' if i == 1 else f'swap{i}')
+                del stack[index]
+                stack.append(None)
+        elif node.op == 'var':
+            tokens.append(types.EXPR_VARS[node.value])
+            stack.append(None)
+        elif node.op == 'const':
+            tokens.append(_format_number(node.value))
+            stack.append(None)
+        else:
+            compute(node)
+
+    def compute(node: Operand) -> None:
+        for arg in node.args:
+            use(arg)
+        tokens.append(_TOKENS[node.op])
+        del stack[len(stack) - len(node.args):]
+        stack.append(None)
+
+    for node in postorder:
+        if uses[id(node)] > 1 and node.op not in _LEAVES:
+            compute(node)
+            stack[-1] = node
+            remaining[id(node)] = uses[id(node)]
+
+    use(root)
+    return ' '.join(tokens)
+
+
+def _compile(expression: Operand, bits: int = 8, chroma: bool = False) -> str:
+    """Compiles an expression into an RPN string for std.Expr."""
+    return _emit(_Compiler(bits, chroma).canonical(_operand(expression)))
+
+
+class _ExprStep(NamedTuple):
+    clips: Tuple[vs.VideoNode, ...]
+    planes: Tuple[Operand, ...]
+    exact: bool
+
+
+# Inputs and expressions of the clips returned by expr(), so that consecutive expressions can be fused.
+_expr_history: 'weakref.WeakKeyDictionary[vs.VideoNode, _ExprStep]' = weakref.WeakKeyDictionary()
+
+
+def _get_expr_step(clip: vs.VideoNode) -> Optional[_ExprStep]:
+    try:
+        return _expr_history.get(clip)
+    except TypeError:
+        # VideoNodes aren't weak-referenceable in this version of VapourSynth.
+        return None
+
+
+def _substitute(node: Operand, mapping: Dict[int, Operand], memo: Dict[int, Operand]) -> Operand:
+    if id(node) not in memo:
+        if node.op == 'var':
+            memo[id(node)] = mapping[node.value]
+        elif node.op in _LEAVES:
+            memo[id(node)] = node
+        else:
+            memo[id(node)] = Operand(node.op, tuple(_substitute(arg, mapping, memo) for arg in node.args), node.value)
+    return memo[id(node)]
+
+
+def expr(clips: Union[vs.VideoNode, Sequence[vs.VideoNode]],
+         expression: Union[Operand, float, Callable[..., Any], Sequence[Optional[Union[Operand, float]]]],
+         /,
+         planes: Optional[Union[int, Sequence[int]]] = None,
+         format: Optional[Union[int, vs.PresetVideoFormat, vs.VideoFormat]] = None,
+         *,
+         fuse: Optional[bool] = None,
+         ) -> vs.VideoNode:
+    """Evaluates an expression built with Python operators per pixel, using a single ``std.Expr``.
+
+    Operands for the input clips are passed to `expression` if it's callable, or can be created with :func:`var`.
+    Constants are folded and identical subexpressions are computed only once.
+    Use :func:`scaled` for thresholds that should follow the bit depth of the input.
+
+    When an input clip was itself returned by this function, its expression is inlined instead of evaluating
+    both, as long as that's exact (i.e. the input has 32 bit float format), so chains of element-wise operations
+    result in one pass over the frame.
+
+    >>> average = expr([a, b], lambda x, y: (x + y) / 2)
+    >>> luma_mask = expr(src, lambda x: where(x > scaled(128), scaled(235), scaled(16)), planes=0)
+
+    Common subexpressions use ``dupN`` and ``swapN``, which require a recent version of VapourSynth.
+
+    :param clips:       Input clip(s). At most 26.
+    :param expression:  An operand or number, a function that takes one operand per clip and returns one,
+                        or a sequence with one of them per plane, where ``None`` copies the plane of the first clip.
+    :param planes:      Planes to process if `expression` isn't a sequence. Other planes are copied from the first clip.
+                        Defaults to all planes.
+    :param format:      Output format. Defaults to the format of the first clip.
+    :param fuse:        Whether to inline the expressions of input clips returned by this function.
+                        ``None`` (default) only inlines them if that's exact, ``True`` always inlines them,
+                        skipping the rounding and clamping of integer intermediate clips, ``False`` never does.
+
+    :return:            Clip with the expression applied.
+    """
+    clips = [clips] if isinstance(clips, vs.VideoNode) else list(clips)
+    if not 1 <= len(clips) <= len(types.EXPR_VARS):
+        raise ValueError(f'expr: between 1 and {len(types.EXPR_VARS)} clips are required.')
+    if any(clip.format is None for clip in clips):
+        raise ValueError("expr: 'Variable-format clips not supported.'")
+
+    reference = clips[0].format
+    if callable(expression):
+        expression = expression(*(var(i) for i in range(len(clips))))
+
+    processed: List[bool]
+    trees: List[Operand]
+    if isinstance(expression, (list, tuple)):
+        if planes is not None:
+            raise ValueError('expr: planes can only be passed with a single expression.')
+        if len(expression) != reference.num_planes:
+            raise ValueError(f'expr: expected one expression per plane ({reference.num_planes}).')
+        processed = [e is not None for e in expression]
+        trees = [var(0) if e is None else _operand(e) for e in expression]
+    else:
+        planes = range(reference.num_planes) if planes is None else [planes] if isinstance(planes, int) else planes
+        processed = [p in planes for p in range(reference.num_planes)]
+        trees = [_operand(expression) if p else var(0) for p in processed]
+
+    # Inline the expressions of input clips, mapping their inputs and the remaining clips to new variables.
+    final_clips: List[vs.VideoNode] = []
+
+    def variable(clip: vs.VideoNode) -> Operand:
+        for i, c in enumerate(final_clips):
+            if c is clip:
+                return var(i)
+        final_clips.append(clip)
+        return var(len(final_clips) - 1)
+
+    mappings: List[Dict[int, Operand]] = [{} for _ in trees]
+    for i, clip in enumerate(clips):
+        step = None if fuse is False else _get_expr_step(clip)
+        if step is not None and (fuse or step.exact) \
+                and len(final_clips) + len(step.clips) + len(clips) - i - 1 <= len(types.EXPR_VARS):
+            inputs = {j: variable(c) for j, c in enumerate(step.clips)}
+            for mapping, tree in zip(mappings, step.planes):
+                mapping[i] = _substitute(tree, inputs, {})
+        else:
+            operand = variable(clip)
+            for mapping in mappings:
+                mapping[i] = operand
+
+    chroma = reference.color_family == vs.YUV
+    bits = 32 if reference.sample_type == vs.FLOAT else reference.bits_per_sample
+    resolved = [
+        _Compiler(bits, chroma and p > 0).canonical(_substitute(tree, mapping, {}))
+        for p, (tree, mapping) in enumerate(zip(trees, mappings))
+    ]
+    rpn = [
+        '' if not is_processed and tree.op == 'var' and tree.value == 0 else _emit(tree)
+        for is_processed, tree in zip(processed, resolved)
+    ]
+
+    out_format = vs.core.get_video_format(reference.id if format is None else format)
+    result = _Expr(final_clips, rpn, format=out_format.id)
+
+    try:
+        _expr_history[result] = _ExprStep(
+            tuple(final_clips), tuple(resolved),
+            out_format.sample_type == vs.FLOAT and out_format.bits_per_sample == 32
+        )
+    except TypeError:
+        pass
+    return result
+
+
+# Tables built by make_lut(), by function and by the format ids of the input clips.
+# They're stored as arrays of the output's sample size rather than lists,
+# which would take about 36 bytes per entry, so up to 36 MB for a table of Lut2.
+_lut_cache: 'weakref.WeakKeyDictionary[Callable[..., Any], Dict[Tuple[int, ...], Any]]' = \
+    weakref.WeakKeyDictionary()
+
+
+def _build_lut(clips: List[vs.VideoNode], fn: Callable[..., Any]) -> Any:
+    np = func._require_numpy(make_lut)
+    lowest = int(info.get_lowest_value(clips[0]))
+    peak = int(info.get_peak_value(clips[0]))
+
+    # For two clips, rows are indexed by y and columns by x, so that the flattened table is indexed by y << bits_x | x.
+    inputs = [np.arange(lowest, int(info.get_peak_value(clip)) + 1, dtype=np.float64) for clip in clips]
+    if len(inputs) == 2:
+        inputs = [inputs[0][np.newaxis, :], inputs[1][:, np.newaxis]]
+    shape = np.broadcast(*inputs).shape
+
+    table = np.broadcast_to(np.asarray(fn(*inputs), dtype=np.float64), shape)
+    # Round like std.Expr does for integer output.
+    return np.clip(np.floor(table + 0.5), lowest, peak).astype(np.uint8 if peak < 256 else np.uint16).ravel()
+
+
+def make_lut(clips: Union[vs.VideoNode, Sequence[vs.VideoNode]],
+             fn: Callable[..., Any],
+             /,
+             planes: Optional[Union[int, Sequence[int]]] = None,
+             ) -> vs.VideoNode:
+    """Applies a function of the pixel values of one or two clips through a lookup table.
+
+    `fn` is called once with NumPy arrays of every possible value of every clip,
+    broadcast against each other for two clips, so the table is computed in a single vectorized call.
+    Use :func:`where`, :func:`minimum`, :func:`maximum`, and :func:`clamp` instead of ``if``, ``min``, and ``max``.
+
+    ``std.Lut`` is used for one integer clip, ``std.Lut2`` for two integer clips with at most 20 bits combined.
+    Otherwise, e.g. for float clips, `fn` is called with operands instead and evaluated by :func:`expr`,
+    so it should only use operations supported by both.
+    The output has the format of the first clip.
+
+    Tables are cached by function and formats, so reusing the same function object for multiple clips
+    only computes them once.
+
+    Requires NumPy for integer clips.
+
+    >>> def gamma(x):
+    ...     return (x / 1023) ** 0.8 * 1023
+    >>> brighter = make_lut(src_10bit, gamma)
+
+    :param clips:   One or two input clips.
+    :param fn:      Function that takes one argument per clip and returns the new value.
+    :param planes:  Planes to process. Other planes are copied from the first clip. Defaults to all planes.
+
+    :return:        Clip with the function applied.
+    """
+    clips = [clips] if isinstance(clips, vs.VideoNode) else list(clips)
+    if not 1 <= len(clips) <= 2:
+        raise ValueError('make_lut: one or two clips are required.')
+    if any(clip.format is None for clip in clips):
+        raise ValueError("make_lut: 'Variable-format clips not supported.'")
+
+    if any(clip.format.sample_type == vs.FLOAT for clip in clips) \
+            or sum(info.get_depth(clip) for clip in clips) > (16 if len(clips) == 1 else _MAX_LUT2_BITS):
+        return expr(clips, fn, planes)
+
+    key = tuple(clip.format.id for clip in clips)
+    try:
+        tables = _lut_cache.setdefault(fn, {})
+    except TypeError:
+        # The function isn't weak-referenceable.
+        tables = {}
+    if key not in tables:
+        tables[key] = _build_lut(clips, fn)
+    lut = tables[key].tolist()
+
+    planes = list(range(clips[0].format.num_planes)) if planes is None else planes
+    if len(clips) == 1:
+        return _Lut(clips[0], planes=planes, lut=lut)
+    return _Lut2(clips[0], clips[1], planes=planes, lut=lut)
@@ -0,0 +1,339 @@
+"""
+Functions that work with individual frames.
+"""
+__all__ = ['aget_frame', 'aiter_frames', 'array_to_frame', 'frame_to_array', 'iter_frames']
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from time import perf_counter
+from typing import Any, AsyncIterator, Deque, Iterable, Iterator, List, Optional, Sequence, Union
+
+import vapoursynth as vs
+
+from . import func, info
+
+
+def _plane_dtype(np: Any, fmt: vs.VideoFormat) -> Any:
+    if fmt.sample_type == vs.FLOAT:
+        return np.dtype(f'float{fmt.bytes_per_sample * 8}')
+    return np.dtype(f'uint{fmt.bytes_per_sample * 8}')
+
+
+def _plane_view(np: Any, frame: vs.VideoFrame, planeno: int) -> Any:
+    width, height = info.get_plane_size(frame, planeno)
+    dtype = _plane_dtype(np, frame.format)
+
+    # Planes implement the buffer protocol including their stride, so this never copies.
+    array = np.asarray(frame[planeno])
+    if array.dtype != dtype:
+        array = array.view(dtype)
+    if array.shape != (height, width):
+        raise ValueError(f'frame_to_array: unexpected shape {array.shape} of plane {planeno}.')
+    return array
+
+
+def frame_to_array(frame: vs.VideoFrame, /, plane: Optional[int] = None) -> Union[Any, List[Any]]:
+    """Returns the pixel data of a frame as NumPy arrays without copying it.
+
+    The arrays are views of the frame's memory with shape ``(height, width)`` of the respective plane
+    and a dtype matching the format's sample type and bit depth (e.g. ``uint16`` for 10 bit integer, ``float32`` for 32 bit float).
+    They are read-only, unless the frame is writable (i.e. a copy made with ``frame.copy()``).
+
+    Requires NumPy.
+
+    >>> frame = vs.core.std.BlankClip(format=vs.YUV420P10).get_frame(0)
+    >>> y = frame_to_array(frame, 0)
+    >>> y.shape, y.dtype
+    ((480, 640), dtype('uint16'))
+    >>> [p.shape for p in frame_to_array(frame)]
+    [(480, 640), (240, 320), (240, 320)]
+
+    :param frame:  Input frame.
+    :param plane:  Index of the plane to return. Returns a list of all planes if ``None``.
+
+    :return:       Array view of the requested plane, or a list of views of all planes.
+    """
+    np = func._require_numpy(frame_to_array)
+
+    if plane is None:
+        return [_plane_view(np, frame, p) for p in range(frame.format.num_planes)]
+    if not 0 <= plane < frame.format.num_planes:
+        raise ValueError(f'frame_to_array: plane {plane} does not exist.')
+    return _plane_view(np, frame, plane)
+
+
+def array_to_frame(array: Union[Any, Sequence[Any]], template: vs.VideoFrame, /) -> vs.VideoFrame:
+    """Writes pixel data from NumPy arrays into a frame.
+
+    If `template` is writable, the data is written into it directly.
+    Otherwise it's written into a copy of `template`, which also provides the frame properties.
+
+    Requires NumPy.
+
+    >>> frame = src.get_frame(0).copy()
+    >>> y = frame_to_array(frame, 0)
+    >>> y //= 2                            # modifies frame in-place, no need for array_to_frame
+    >>> out = array_to_frame([y, u, v], src.get_frame(1))
+
+    :param array:     A single 2D array for single-plane formats,
+                      otherwise a sequence of 2D arrays (or a 3D array for formats without subsampling) with one per plane.
+                      Arrays must have the plane's shape and a dtype that can be cast to the format's sample type.
+    :param template:  Frame that provides format, size, and properties.
+
+    :return:          Frame containing the data of `array`.
+    """
+    np = func._require_numpy(array_to_frame)
+
+    frame = template if not getattr(template, 'readonly', True) else template.copy()
+    planes = frame_to_array(frame)
+
+    arrays = [array] if isinstance(array, np.ndarray) and array.ndim == 2 else list(array)
+    if len(arrays) != len(planes):
+        raise ValueError(f'array_to_frame: expected {len(planes)} planes, got {len(arrays)}.')
+
+    for planeno, (dst, src) in enumerate(zip(planes, arrays)):
+        if dst is src:
+            continue
+        if np.shape(src) != dst.shape:
+            raise ValueError(f'array_to_frame: plane {planeno} must have shape {dst.shape}, got {np.shape(src)}.')
+        np.copyto(dst, src)
+
+    return frame
+
+
+class FrameIterator:
+    """Iterator over rendered frames that keeps a bounded number of requests in flight.
+
+    Returned by :func:`iter_frames`.
+    Closing it (explicitly, by leaving a ``with`` block, or by exhausting it) waits for the requests still
+    in flight, so no frames are rendered in the background once it's done.
+    It's also closed when it's garbage collected, e.g. after breaking out of a ``for`` loop over it.
+
+    :ivar frames_done:  Number of frames yielded so far.
+    """
+
+    def __init__(self, clip: vs.VideoNode, frames: Iterable[int], prefetch: int) -> None:
+        if prefetch < 1:
+            raise ValueError('iter_frames: prefetch must be at least 1.')
+        self.clip = clip
+        self.prefetch = prefetch
+        self.frames_done = 0
+        self._frames: Optional[Iterator[int]] = iter(frames)
+        self._pending: Deque[Future] = deque()
+        self._started: Optional[float] = None
+        self._stopped: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the first frame was requested."""
+        if self._started is None:
+            return 0.
+        return (self._stopped or perf_counter()) - self._started
+
+    @property
+    def fps(self) -> float:
+        """Average number of frames yielded per second."""
+        elapsed = self.elapsed
+        return self.frames_done / elapsed if elapsed else 0.
+
+    def _fill(self) -> None:
+        if self._frames is None:
+            return
+        while len(self._pending) < self.prefetch:
+            n = next(self._frames, None)
+            if n is None:
+                self._frames = None
+                return
+            self._pending.append(self.clip.get_frame_async(n))
+
+    def __iter__(self) -> 'FrameIterator':
+        return self
+
+    def __next__(self) -> vs.VideoFrame:
+        if self._started is None:
+            self._started = perf_counter()
+        self._fill()
+        if not self._pending:
+            self.close()
+            raise StopIteration
+
+        try:
+            frame = self._pending.popleft().result()
+        except BaseException:
+            self.close()
+            raise
+        # Keep the pipeline busy while the consumer processes this frame.
+        self._fill()
+        self.frames_done += 1
+        return frame
+
+    def close(self) -> None:
+        """Stops requesting frames and waits for the ones still in flight."""
+        self._frames = None
+        while self._pending:
+            # VapourSynth can't abort requests and completing a cancelled future raises in its callback,
+            # so wait for the result instead.
+            self._pending.popleft().exception()
+        if self._started is not None and self._stopped is None:
+            self._stopped = perf_counter()
+
+    def __enter__(self) -> 'FrameIterator':
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        # Not set if __init__ raised.
+        if getattr(self, '_pending', None):
+            self.close()
+
+
+def iter_frames(clip: vs.VideoNode,
+                start: int = 0,
+                end: Optional[int] = None,
+                *,
+                prefetch: Optional[int] = None,
+                ) -> FrameIterator:
+    """Iterates over the rendered frames of a clip in order,
+    keeping up to `prefetch` frame requests in flight to make use of VapourSynth's thread pool.
+
+    At most `prefetch` frames are rendered ahead of the consumer, so memory usage stays bounded.
+    The returned iterator also reports throughput with its ``frames_done``, ``elapsed``, and ``fps`` attributes.
+
+    >>> with iter_frames(src, prefetch=8) as frames:
+    ...     for frame in frames:
+    ...         process(frame)
+    >>> print(f'{frames.fps:.2f} fps')
+
+    :param clip:      Input clip.
+    :param start:     First frame to render.
+    :param end:       Frame to stop at (exclusive). Defaults to the end of the clip.
+    :param prefetch:  Maximum number of frames requested ahead of the consumer.
+                      Defaults to the number of threads of the core.
+
+    :return:          Iterator over the frames ``start`` to ``end - 1``.
+    """
+    end = func.fallback(end, clip.num_frames)
+    if not 0 <= start <= end <= clip.num_frames:
+        raise ValueError(f'iter_frames: frame range ({start}, {end}) is out of bounds.')
+    return FrameIterator(clip, range(start, end), func.fallback(prefetch, vs.core.num_threads))
+
+
+def _set_result(result: 'asyncio.Future[vs.VideoFrame]', future: Future, semaphore: Optional[asyncio.Semaphore]) -> None:
+    if semaphore is not None:
+        semaphore.release()
+    if result.cancelled():
+        return
+    exception = future.exception()
+    if exception is not None:
+        result.set_exception(exception)
+    else:
+        result.set_result(future.result())
+
+
+def _request_frame(clip: vs.VideoNode, n: int, semaphore: Optional[asyncio.Semaphore]) -> 'asyncio.Future[vs.VideoFrame]':
+    """Requests a frame and returns a future of the running loop that completes with it.
+
+    `semaphore` must already be acquired and is released once the frame is rendered.
+    """
+    loop = asyncio.get_running_loop()
+    result = loop.create_future()
+
+    def done(future: Future) -> None:
+        # Called from one of VapourSynth's threads.
+        try:
+            loop.call_soon_threadsafe(_set_result, result, future, semaphore)
+        except RuntimeError:
+            # The loop was closed while the frame was rendering.
+            pass
+
+    # asyncio.wrap_future() would cancel the request together with the awaiting task,
+    # but VapourSynth can't abort requests and completing a cancelled future raises in its callback,
+    # so the request keeps going and its result is discarded instead.
+    try:
+        request = clip.get_frame_async(n)
+    except BaseException:
+        if semaphore is not None:
+            semaphore.release()
+        raise
+    request.add_done_callback(done)
+    return result
+
+
+async def aget_frame(clip: vs.VideoNode, n: int, /, *, semaphore: Optional[asyncio.Semaphore] = None) -> vs.VideoFrame:
+    """Renders a frame without blocking the running event loop.
+
+    The frame is requested with ``get_frame_async`` and its completion is passed to the loop,
+    so no thread is needed per request.
+    Cancelling the awaiting task doesn't stop VapourSynth from rendering the frame, but it's discarded.
+
+    >>> frame = await aget_frame(src, 100)
+
+    :param clip:       Input clip.
+    :param n:          Number of the frame.
+    :param semaphore:  Limits the number of frames rendered at once. Share it between requests,
+                       e.g. of all clients of a service, to bound their total memory and CPU usage.
+                       It's held until the frame is rendered, even if the request is cancelled before.
+
+    :return:           The rendered frame.
+    """
+    if not 0 <= n < clip.num_frames:
+        raise ValueError(f'aget_frame: frame {n} is out of bounds.')
+    if semaphore is not None:
+        await semaphore.acquire()
+    return await _request_frame(clip, n, semaphore)
+
+
+async def aiter_frames(clip: vs.VideoNode,
+                       start: int = 0,
+                       end: Optional[int] = None,
+                       *,
+                       prefetch: Optional[int] = None,
+                       semaphore: Optional[asyncio.Semaphore] = None,
+                       ) -> AsyncIterator[vs.VideoFrame]:
+    """Asynchronous version of :func:`iter_frames` that doesn't block the running event loop.
+
+    Breaking out of the loop, or cancelling the task running it, discards the frames still in flight.
+
+    >>> async for frame in aiter_frames(src, prefetch=8):
+    ...     await send(frame)
+
+    :param clip:       Input clip.
+    :param start:      First frame to render.
+    :param end:        Frame to stop at (exclusive). Defaults to the end of the clip.
+    :param prefetch:   Maximum number of frames requested ahead of the consumer.
+                       Defaults to the number of threads of the core.
+    :param semaphore:  Limits the number of frames rendered at once, see :func:`aget_frame`.
+
+    :return:           Asynchronous iterator over the frames ``start`` to ``end - 1``.
+    """
+    end = func.fallback(end, clip.num_frames)
+    if not 0 <= start <= end <= clip.num_frames:
+        raise ValueError(f'aiter_frames: frame range ({start}, {end}) is out of bounds.')
+    prefetch = func.fallback(prefetch, vs.core.num_threads)
+    if prefetch < 1:
+        raise ValueError('aiter_frames: prefetch must be at least 1.')
+
+    pending: Deque['asyncio.Future[vs.VideoFrame]'] = deque()
+    frames = iter(range(start, end))
+
+    async def fill() -> None:
+        for n in frames:
+            if semaphore is not None:
+                await semaphore.acquire()
+            pending.append(_request_frame(clip, n, semaphore))
+            if len(pending) >= prefetch:
+                return
+
+    try:
+        await fill()
+        while pending:
+            result = pending.popleft()
+            # Keep the pipeline busy while the consumer processes this frame.
+            await fill()
+            yield await result
+    finally:
+        for result in pending:
+            result.cancel()
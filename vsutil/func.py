@@ -4,7 +4,7 @@ Decorators and non-VapourSynth-related functions.
 """
 __all__ = [
     # decorators
-    'disallow_variable_format', 'disallow_variable_resolution',
+    'disallow_variable_format', 'disallow_variable_resolution', 'set_trusted_mode',
     # misc non-vapoursynth related
     'fallback', 'iterate',
     # misc vapoursynth related
@@ -12,37 +12,137 @@ __all__ = [
 ]
 
 import inspect
+import itertools
+import re
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
 from functools import partial, wraps
-from typing import Union, Any, TypeVar, Callable, cast, overload, Optional
+from typing import Union, Any, Dict, Hashable, List, TypeVar, Callable, Set, Tuple, cast, overload, Optional
 
-import vapoursynth as vs
+from ._vapoursynth import is_loaded as _vs_loaded, vs
 
 F = TypeVar('F', bound=Callable)
 T = TypeVar('T')
 R = TypeVar('R')
 
 
+# Annotations made up of only these names can never describe a VideoNode.
+# Parameters annotated with them are skipped by the decorators below.
+_NON_CLIP_NAMES = frozenset({
+    'None', 'NoneType', 'Optional', 'Union', 'typing', 'class', 'enum', 'builtins',
+    'bool', 'int', 'float', 'complex', 'str', 'bytes',
+    'vs', 'vapoursynth', 'SampleType', 'ColorFamily', 'PresetFormat', 'PresetVideoFormat',
+    'vsutil', 'types', 'Range', 'Dither',
+})
+
+_trusted = False
+
+
+def set_trusted_mode(enabled: bool = True) -> bool:
+    """Globally disables the input checks of :func:`disallow_variable_format`
+    and :func:`disallow_variable_resolution`.
+
+    Meant for production renders of scripts that are known to be correct,
+    where the checks are nothing but per-call overhead.
+
+    >>> set_trusted_mode()
+    False
+    >>> set_trusted_mode(False)
+    True
+
+    :param enabled:  Whether to skip the checks.
+
+    :return:         The previous setting.
+    """
+    global _trusted
+    previous, _trusted = _trusted, bool(enabled)
+    return previous
+
+
+def _can_hold_clip(param: inspect.Parameter) -> bool:
+    annotation = param.annotation
+    if annotation is inspect.Parameter.empty:
+        return True
+    text = annotation if isinstance(annotation, str) else repr(annotation)
+    return not set(re.findall(r'[A-Za-z_]\w*', text)) <= _NON_CLIP_NAMES
+
+
 def _check_variable(
     function: F, vname: str, only_first: bool, check_func: Callable[[vs.VideoNode], bool]
 ) -> Any:
+    # Resolved on the first call, as the wrapper is usually created before VapourSynth is loaded,
+    # and kept in the closure so that checks don't look it up on the module every time.
+    video_node: Optional[type] = None
+
     def _check(x: Any) -> bool:
-        return isinstance(x, vs.VideoNode) and check_func(x)
+        nonlocal video_node
+        if video_node is None:
+            video_node = vs.VideoNode
+        return isinstance(x, video_node) and check_func(x)
+
+    error = f"{function.__name__}: 'Variable-{vname} clips not supported.'"
+
+    if only_first:
+        @wraps(function)
+        def _first_wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _trusted and args and _check(args[0]):
+                raise ValueError(error)
+            return function(*args, **kwargs)
+
+        return cast(F, _first_wrapper)
+
+    try:
+        parameters = list(inspect.signature(function).parameters.values())
+    except (TypeError, ValueError):
+        parameters = None
+
+    # Defaults cannot change after the function has been defined, so they only need to be checked once.
+    # Without VapourSynth loaded, no default can be a clip, and checking would load it.
+    default_error = None
+    for param in parameters if parameters and _vs_loaded() else []:
+        if param.default is not inspect.Parameter.empty and _check(param.default):
+            default_error = f"{function.__name__}: 'Variable-{vname} clip not allowed in default argument `{param.name}`.'"
+            break
+
+    if parameters is None or any(
+        p.kind in (p.VAR_POSITIONAL, p.VAR_KEYWORD) and _can_hold_clip(p) for p in parameters
+    ):
+        # Can't tell where clips will end up, so check every argument.
+        @wraps(function)
+        def _generic_wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _trusted:
+                for obj in [*args, *kwargs.values()]:
+                    if _check(obj):
+                        raise ValueError(error)
+                if default_error:
+                    raise ValueError(default_error)
+            return function(*args, **kwargs)
+
+        return cast(F, _generic_wrapper)
+
+    positions = tuple(
+        i for i, p in enumerate(parameters)
+        if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) and _can_hold_clip(p)
+    )
+    keywords = tuple(
+        p.name for p in parameters
+        if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY) and _can_hold_clip(p)
+    )
 
     @wraps(function)
     def _wrapper(*args: Any, **kwargs: Any) -> Any:
-        for obj in args[:1] if only_first else [*args, *kwargs.values()]:
-            if _check(obj):
-                raise ValueError(
-                    f"{function.__name__}: 'Variable-{vname} clips not supported.'"
-                )
-
-        if not only_first:
-            for name, param in inspect.signature(function).parameters.items():
-                if param.default is not inspect.Parameter.empty and _check(param.default):
-                    raise ValueError(
-                        f"{function.__name__}: 'Variable-{vname} clip not allowed in default argument `{name}`.'"
-                    )
-
+        if not _trusted:
+            nargs = len(args)
+            for i in positions:
+                if i < nargs and _check(args[i]):
+                    raise ValueError(error)
+            if kwargs:
+                for name in keywords:
+                    if name in kwargs and _check(kwargs[name]):
+                        raise ValueError(error)
+            if default_error:
+                raise ValueError(default_error)
         return function(*args, **kwargs)
 
     return cast(F, _wrapper)
@@ -146,6 +246,159 @@ def iterate(base: T, function: Callable[[Union[T, R]], R], count: int) -> Union[
     return v
 
 
+def _require_numpy(function: Callable) -> Any:
+    """Imports numpy, which is an optional dependency, on behalf of `function`."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(f'{function.__name__}: numpy is required for this function.') from None
+    return numpy
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'currsize'])
+
+# Resolved plugin functions of every VapourSynth environment that is still alive, keyed by a token of the environment.
+# The environment isn't used as the key directly as the cached functions keep its core alive,
+# tokens are never reused, so a new environment can't be served functions of a dead core.
+_resolved: Dict[int, Dict[Tuple[str, str], vs.Function]] = {}
+_resolved_stats = [0, 0]
+_environment_tokens: 'weakref.WeakKeyDictionary[Any, int]' = weakref.WeakKeyDictionary()
+_next_token = itertools.count()
+
+
+def _forget_environment(token: int) -> None:
+    _resolved.pop(token, None)
+    _interner.forget_environment(token)
+
+
+def _environment_token() -> Optional[int]:
+    """Returns the token of the current environment, or ``None`` if it can't be tracked in this version of VapourSynth."""
+    try:
+        # The data of the environment, which owns the core. Environment objects themselves are only short-lived handles.
+        environment = vs.get_current_environment().env()
+    except (AttributeError, TypeError):
+        return None
+    if environment is None:
+        return None
+
+    try:
+        return _environment_tokens[environment]
+    except KeyError:
+        token = _environment_tokens[environment] = next(_next_token)
+        # Drop the cached functions when the environment is destroyed, so its core can be freed.
+        weakref.finalize(environment, _forget_environment, token)
+        return token
+    except TypeError:
+        return None
+
+
+def _resolve(plugin: str, name: str) -> vs.Function:
+    token = _environment_token()
+    if token is None:
+        # Caching the function would keep the core alive forever.
+        _resolved_stats[1] += 1
+        return getattr(getattr(vs.core.core, plugin), name)
+
+    functions = _resolved.setdefault(token, {})
+    try:
+        resolved = functions[plugin, name]
+    except KeyError:
+        # Only look up the core when the function isn't cached yet.
+        _resolved_stats[1] += 1
+        resolved = functions[plugin, name] = getattr(getattr(vs.core.core, plugin), name)
+    else:
+        _resolved_stats[0] += 1
+    return resolved
+
+
+InternInfo = namedtuple('InternInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _NodeInterner:
+    """Size-bounded LRU table of filter invocations, weakly keyed by their input nodes."""
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.enabled = False
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._table: OrderedDict[Hashable, Any] = OrderedDict()
+        self._by_node: Dict[int, Tuple[weakref.ref, Set[Hashable]]] = {}
+        # Reentrant as the weakref callbacks may run inside a locked section when it triggers garbage collection.
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _freeze(value: Any, nodes: List[vs.VideoNode]) -> Hashable:
+        if isinstance(value, vs.VideoNode):
+            nodes.append(value)
+            return (vs.VideoNode, id(value))
+        if isinstance(value, (list, tuple)):
+            return (type(value), tuple(_NodeInterner._freeze(v, nodes) for v in value))
+        hash(value)
+        # Include the type so that e.g. ``1``, ``1.0``, and ``True`` don't share an entry.
+        return (type(value), value)
+
+    def call(self, resolved: Callable[..., Any], key_prefix: Hashable, args: Any, kwargs: Any) -> Any:
+        nodes: List[vs.VideoNode] = []
+        try:
+            key = (key_prefix,
+                   self._freeze(args, nodes),
+                   tuple(sorted((k, self._freeze(v, nodes)) for k, v in kwargs.items())))
+        except TypeError:
+            # Unhashable arguments like dicts, can't be interned.
+            return resolved(*args, **kwargs)
+
+        with self._lock:
+            if key in self._table:
+                self._table.move_to_end(key)
+                self.hits += 1
+                result = self._table[key]
+                return list(result) if isinstance(result, tuple) else result
+
+        result = resolved(*args, **kwargs)
+
+        with self._lock:
+            try:
+                for node in nodes:
+                    entry = self._by_node.get(id(node))
+                    if entry is None:
+                        entry = self._by_node[id(node)] = (weakref.ref(node, partial(self._drop_node, id(node))), set())
+                    entry[1].add(key)
+            except TypeError:
+                # VideoNodes aren't weak-referenceable in this version of VapourSynth.
+                return result
+
+            self.misses += 1
+            self._table[key] = tuple(result) if isinstance(result, list) else result
+            while len(self._table) > self.maxsize:
+                self._table.popitem(last=False)
+        return result
+
+    def _drop_node(self, node_id: int, _: weakref.ref) -> None:
+        with self._lock:
+            _, keys = self._by_node.pop(node_id, (None, set()))
+            for key in keys:
+                self._table.pop(key, None)
+
+    def forget_environment(self, token: int) -> None:
+        with self._lock:
+            for key in [k for k in self._table if k[0][0] == token]:
+                del self._table[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._table.clear()
+            self._by_node.clear()
+            self.hits = self.misses = 0
+
+
+_interner = _NodeInterner()
+
+
+# Called with plugin, function name, arguments, and result of every call of a `function`.
+# Used by `recipe.record()`.
+_call_hooks: List[Callable[[str, str, Tuple[Any, ...], Dict[str, Any], Any], None]] = []
+
+
 # This function is actually implemented as a class.
 # This makes sure that,
 # when it is used as the value of a class-variable,
@@ -165,15 +418,30 @@ class function:
     The result of function is safe to use within a class-definition.
     It behaves like a static-method in this case.
 
+    The resolved plugin function is cached per core, so repeated calls don't have to look it up again.
+    Loading plugins can't invalidate the cache as VapourSynth doesn't allow replacing existing namespaces,
+    and functions that failed to resolve are never cached.
+
+    With interning enabled (see :meth:`set_interning`), calling an alias twice with the same input nodes
+    and argument values returns the node that was built the first time instead of creating a duplicate
+    node with its own frame cache.
+
+    >>> ShufflePlanes = function("std", "ShufflePlanes", intern=True)
+    >>> ShufflePlanes(src, 0, vs.GRAY) is ShufflePlanes(src, 0, vs.GRAY)
+    True
+
     :param plugin:  The name of the plugin that provides the function.
     :param name:    The name of the function to alias.
+    :param intern:  Whether to intern the nodes created by this alias.
+                    Defaults to the global setting of :meth:`set_interning`.
 
     :return: A wrapper function around the given plugin function.
     """
 
-    def __init__(self, plugin: str, name: str):
+    def __init__(self, plugin: str, name: str, *, intern: Optional[bool] = None):
         self.plugin_name = plugin
         self.name = name
+        self.intern = intern
 
     @property
     def plugin(self) -> vs.Plugin:
@@ -185,7 +453,7 @@ class function:
     def resolved(self) -> vs.Function:
         """Returns the instance of function 
         """
-        return getattr(self.plugin, self.name)
+        return _resolve(self.plugin_name, self.name)
 
     @property
     def signature(self) -> str:
@@ -199,6 +467,59 @@ class function:
         """
         return self.resolved.return_signature
 
-    def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        return self.resolved(*args, **kwargs)
+    @staticmethod
+    def cache_info() -> CacheInfo:
+        """Returns hits, misses, and the number of cached plugin functions across all live cores.
+        """
+        return CacheInfo(*_resolved_stats, sum(map(len, _resolved.values())))
+
+    @staticmethod
+    def cache_clear() -> None:
+        """Drops all cached plugin functions and resets the statistics.
+        """
+        _resolved.clear()
+        _resolved_stats[:] = [0, 0]
+
+    @staticmethod
+    def set_interning(enabled: bool = True, *, maxsize: Optional[int] = None) -> bool:
+        """Globally enables or disables interning of the nodes created by all aliases
+        that don't explicitly set `intern`, including the ones used by :func:`plane`,
+        :func:`get_y`, :func:`split`, :func:`join`, and :func:`depth`.
 
+        Interned nodes are only deduplicated while all of their input nodes are alive.
+
+        :param enabled:  Whether to intern nodes.
+        :param maxsize:  Maximum number of interned nodes. The least recently used ones are evicted first.
+
+        :return:         The previous setting.
+        """
+        previous, _interner.enabled = _interner.enabled, bool(enabled)
+        if maxsize is not None:
+            if maxsize < 1:
+                raise ValueError('set_interning: maxsize must be positive.')
+            _interner.maxsize = maxsize
+        return previous
+
+    @staticmethod
+    def intern_info() -> InternInfo:
+        """Returns how many nodes were deduplicated (hits), how many were built (misses),
+        and the maximum and current size of the interning table.
+        """
+        return InternInfo(_interner.hits, _interner.misses, _interner.maxsize, len(_interner._table))
+
+    @staticmethod
+    def intern_clear() -> None:
+        """Drops all interned nodes and resets the statistics.
+        """
+        _interner.clear()
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        resolved = _resolve(self.plugin_name, self.name)
+        token = _environment_token() if self.intern or (self.intern is None and _interner.enabled) else None
+        if token is not None:
+            result = _interner.call(resolved, (token, self.plugin_name, self.name), args, kwargs)
+        else:
+            result = resolved(*args, **kwargs)
+        for hook in _call_hooks:
+            hook(self.plugin_name, self.name, args, kwargs, result)
+        return result
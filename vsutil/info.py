@@ -1,22 +1,113 @@
 """
 Functions that give information about clips or mathematical helpers.
 """
-__all__ = ['get_depth', 'get_plane_size', 'get_subsampling', 'get_w', 'is_image', 'scale_value', 'get_lowest_value', 'get_neutral_value', 'get_peak_value']
+from __future__ import annotations
 
+__all__ = ['FormatInfo', 'find_duplicates', 'get_depth', 'get_format_info', 'get_plane_size', 'get_props', 'get_subsampling', 'get_w', 'is_image', 'scale_value', 'get_lowest_value', 'get_neutral_value', 'get_peak_value']
+
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from mimetypes import types_map
 from os import path
-from typing import Optional, Tuple, TypeVar, Union
-
-import vapoursynth as vs
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, TypeVar, Union
 
 from . import func, types
+from ._vapoursynth import vs
 
-core = vs.core
+_Bilinear = func.function('resize', 'Bilinear')
 
 R = TypeVar('R')
 T = TypeVar('T')
 
 
+_SUBSAMPLINGS = {(1, 1): '420', (1, 0): '422', (0, 0): '444', (2, 2): '410', (2, 0): '411', (0, 1): '440'}
+
+
+class FormatInfo:
+    """Properties of a video format that are often needed together, computed once per format.
+
+    `lowest`, `neutral`, and `peak` are tuples of the values for luma and chroma planes,
+    see :func:`get_lowest_value`, :func:`get_neutral_value`, and :func:`get_peak_value`.
+    `subsampling` is the string returned by :func:`get_subsampling`, or ``None`` if the format isn't YUV.
+
+    Use :func:`get_format_info` to get instances.
+    """
+    __slots__ = ('id', 'name', 'color_family', 'sample_type', 'bits_per_sample', 'bytes_per_sample', 'num_planes',
+                 'subsampling_w', 'subsampling_h', 'subsampling', 'lowest', 'neutral', 'peak')
+
+    def __init__(self, fmt: vs.VideoFormat) -> None:
+        self.id: int = fmt.id
+        self.name: str = fmt.name
+        self.color_family: vs.ColorFamily = fmt.color_family
+        self.sample_type: vs.SampleType = fmt.sample_type
+        self.bits_per_sample: int = fmt.bits_per_sample
+        self.bytes_per_sample: int = fmt.bytes_per_sample
+        self.num_planes: int = fmt.num_planes
+        self.subsampling_w: int = fmt.subsampling_w
+        self.subsampling_h: int = fmt.subsampling_h
+        self.subsampling: Optional[str] = None
+        if fmt.color_family == vs.YUV:
+            self.subsampling = _SUBSAMPLINGS.get((fmt.subsampling_w, fmt.subsampling_h), '')
+
+        if fmt.sample_type == vs.FLOAT:
+            self.lowest: Tuple[float, float] = (0., -0.5)
+            self.neutral: Tuple[float, float] = (0.5, 0.)
+            self.peak: Tuple[float, float] = (1., 0.5)
+        else:
+            self.lowest = (0., 0.)
+            self.neutral = (float(1 << (fmt.bits_per_sample - 1)),) * 2
+            self.peak = ((1 << fmt.bits_per_sample) - 1.,) * 2
+
+    def __repr__(self) -> str:
+        return f'<FormatInfo {self.name}>'
+
+    def plane_size(self, width: int, height: int, planeno: int) -> Tuple[int, int]:
+        """Returns the dimensions of a plane of a frame with the given dimensions."""
+        if planeno == 0:
+            return width, height
+        return width >> self.subsampling_w, height >> self.subsampling_h
+
+
+_format_infos: Dict[int, FormatInfo] = {}
+
+
+def get_format_info(fmt: Union[int, vs.VideoFormat, vs.VideoNode, vs.VideoFrame], /) -> FormatInfo:
+    """Returns the :class:`FormatInfo` of a format, clip, or frame.
+
+    >>> get_format_info(vs.YUV420P10).peak
+    (1023.0, 1023.0)
+
+    :param fmt:  Format, format id, clip, or frame.
+
+    :return:     Cached information about the format.
+    """
+    if isinstance(fmt, (vs.VideoNode, vs.VideoFrame)):
+        if fmt.format is None:
+            raise ValueError("get_format_info: 'Variable-format clips not supported.'")
+        fmt = fmt.format
+    format_id = int(fmt if isinstance(fmt, int) else fmt.id)
+
+    try:
+        return _format_infos[format_id]
+    except KeyError:
+        pass
+    format_info = _format_infos[format_id] = FormatInfo(vs.core.get_video_format(format_id))
+    return format_info
+
+
+def _clip_format_info(clip: vs.VideoNode, function: Callable[..., Any]) -> FormatInfo:
+    """Like :func:`get_format_info`, with the error :func:`func.disallow_variable_format` would raise."""
+    fmt = clip.format
+    if fmt is None:
+        raise ValueError(f"{function.__name__}: 'Variable-format clips not supported.'")
+    try:
+        return _format_infos[fmt.id]
+    except KeyError:
+        return get_format_info(fmt)
+
+
 @func.disallow_variable_format
 def get_depth(clip: vs.VideoNode, /) -> int:
     """Returns the bit depth of a VideoNode as an integer.
@@ -53,14 +144,132 @@ def get_plane_size(frame: Union[vs.VideoFrame, vs.VideoNode], /, planeno: int) -
         if frame.format is None:
             raise ValueError('Cannot calculate plane size of variable format clip. Pass a frame instead.')
 
-    width, height = frame.width, frame.height
-    if planeno != 0:
-        width >>= frame.format.subsampling_w
-        height >>= frame.format.subsampling_h
-    return width, height
+    return get_format_info(frame.format).plane_size(frame.width, frame.height, planeno)
+
+
+_missing = object()
+
+
+def get_props(clip: vs.VideoNode,
+              keys: Sequence[str],
+              /,
+              frames: Optional[Iterable[int]] = None,
+              *,
+              fill: Any = float('nan'),
+              prefetch: Optional[int] = None,
+              ) -> Dict[str, Any]:
+    """Reads the given frame properties of many frames into one NumPy array per property.
+
+    Frames are rendered concurrently, but only up to `prefetch` at a time, so memory usage stays flat
+    even for very long clips.
+
+    Columns of integer properties get dtype ``int64`` and columns of numeric properties ``float64``
+    (this includes integer properties with missing values when `fill` is a float).
+    Anything else, like strings or arrays, ends up in an ``object`` array.
+
+    Requires NumPy.
+
+    >>> stats = get_props(core.std.PlaneStats(src), ['PlaneStatsAverage', '_SceneChangePrev'], range(0, 1000))
+    >>> stats['PlaneStatsAverage'].mean()
+    0.4432
+
+    :param clip:      Input clip.
+    :param keys:      Names of the frame properties to read.
+    :param frames:    Frame numbers to read the properties of. Defaults to the whole clip.
+    :param fill:      Value used for frames that don't have a property.
+    :param prefetch:  Maximum number of frames rendered at once. Defaults to the number of threads of the core.
+
+    :return:          Dictionary mapping every key to an array with one value per requested frame.
+    """
+    np = func._require_numpy(get_props)
+
+    frames = range(clip.num_frames) if frames is None else frames
+    columns: Dict[str, List[Any]] = {key: [] for key in keys}
+
+    # Imported here, as frames depends on this module and on VapourSynth.
+    from .frames import FrameIterator
+
+    for frame in FrameIterator(clip, frames, func.fallback(prefetch, vs.core.num_threads)):
+        props = frame.props
+        for key, column in columns.items():
+            column.append(props.get(key, _missing))
+
+    return {key: _to_column(np, column, fill) for key, column in columns.items()}
+
+
+def _to_column(np: Any, values: List[Any], fill: Any) -> Any:
+    values = [fill if v is _missing else v for v in values]
+    if all(isinstance(v, int) for v in values):
+        return np.array(values, dtype=np.int64)
+    if all(isinstance(v, (int, float)) for v in values):
+        return np.array(values, dtype=np.float64)
+    # Assign element-wise, so that array properties don't turn into additional dimensions.
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _hash_frame(frame: vs.VideoFrame) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for planeno in range(frame.format.num_planes):
+        view = memoryview(frame[planeno])
+        # hashlib releases the GIL for large buffers, so frames are hashed in parallel.
+        digest.update(view if view.c_contiguous else view.tobytes())
+    return digest.digest()
+
+
+def find_duplicates(clip: vs.VideoNode,
+                    /,
+                    *,
+                    luma_width: Optional[int] = None,
+                    prefetch: Optional[int] = None,
+                    ) -> List[int]:
+    """Finds frames that are identical to an earlier frame by hashing their pixel data.
+
+    Frames are rendered concurrently and hashed in parallel in a thread pool.
+    Frame properties are ignored.
+
+    >>> find_duplicates(src)
+    [0, 0, 0, 3, 4, 4, 6]
+
+    :param clip:        Input clip.
+    :param luma_width:  Only compare the luma plane, downscaled to this width if it's wider.
+                        This is faster, but frames that only differ slightly or in chroma count as duplicates.
+                        By default, all planes are compared at full resolution, so only exact duplicates are found.
+    :param prefetch:    Maximum number of frames rendered at once. Defaults to the number of threads of the core.
+
+    :return:            For every frame, the number of the first frame with the same content
+                        (i.e. its own number for frames that aren't duplicates).
+    """
+    # Imported here, as both depend on this module.
+    from .clips import plane
+    from .frames import FrameIterator
+
+    if luma_width is not None:
+        clip = plane(clip, 0)
+        if clip.width > luma_width:
+            clip = _Bilinear(clip, luma_width, max(1, round(clip.height * luma_width / clip.width)))
+
+    prefetch = func.fallback(prefetch, vs.core.num_threads)
+    first_frames: Dict[bytes, int] = {}
+    sources: List[int] = []
+    with ThreadPoolExecutor(prefetch) as pool:
+        pending: Deque[Any] = deque()
+
+        def collect() -> None:
+            n = len(sources)
+            sources.append(first_frames.setdefault(pending.popleft().result(), n))
+
+        for frame in FrameIterator(clip, range(clip.num_frames), prefetch):
+            pending.append(pool.submit(_hash_frame, frame))
+            # Bounds the number of rendered frames waiting to be hashed.
+            if len(pending) > prefetch:
+                collect()
+        while pending:
+            collect()
+    return sources
 
 
-@func.disallow_variable_format
 def get_subsampling(clip: vs.VideoNode, /) -> Union[None, str]:
     """Returns the subsampling of a VideoNode in human-readable format.
     Returns ``None`` for formats without subsampling.
@@ -76,22 +285,10 @@ def get_subsampling(clip: vs.VideoNode, /) -> Union[None, str]:
 
     :return:      Subsampling of the input `clip` as a string (i.e. ``'420'``) or ``None``.
     """
-    if clip.format.color_family != vs.YUV:
-        return None
-    if clip.format.subsampling_w == 1 and clip.format.subsampling_h == 1:
-        return '420'
-    elif clip.format.subsampling_w == 1 and clip.format.subsampling_h == 0:
-        return '422'
-    elif clip.format.subsampling_w == 0 and clip.format.subsampling_h == 0:
-        return '444'
-    elif clip.format.subsampling_w == 2 and clip.format.subsampling_h == 2:
-        return '410'
-    elif clip.format.subsampling_w == 2 and clip.format.subsampling_h == 0:
-        return '411'
-    elif clip.format.subsampling_w == 0 and clip.format.subsampling_h == 1:
-        return '440'
-    else:
+    subsampling = _clip_format_info(clip, get_subsampling).subsampling
+    if subsampling == '':
         raise ValueError('Unknown subsampling.')
+    return subsampling
 
 
 def get_w(height: int, aspect_ratio: float = 16 / 9, *, only_even: Optional[bool] = None, mod: Optional[int] = None) -> int:
@@ -135,35 +332,22 @@ def is_image(filename: str, /) -> bool:
     return types_map.get(path.splitext(filename)[-1], '').startswith('image/')
 
 
-def scale_value(value: Union[int, float],
-                input_depth: int,
-                output_depth: int,
-                range_in: Union[int, types.Range] = 0,
-                range: Optional[Union[int, types.Range]] = None,
-                scale_offsets: bool = False,
-                chroma: bool = False,
-                ) -> Union[int, float]:
-    """Scales a given numeric value between bit depths, sample types, and/or ranges.
-
-    >>> scale_value(16, 8, 32, range_in=Range.LIMITED)
-    0.0730593607305936
-    >>> scale_value(16, 8, 32, range_in=Range.LIMITED, scale_offsets=True)
-    0.0
-    >>> scale_value(16, 8, 32, range_in=Range.LIMITED, scale_offsets=True, chroma=True)
-    -0.5
+class _ScaleParams(NamedTuple):
+    identity: bool
+    pre_offset: Optional[int]
+    ratio: float
+    post_offset: Optional[int]
 
-    :param value:          Numeric value to be scaled.
-    :param input_depth:    Bit depth of the `value` parameter. Use ``32`` for float sample type.
-    :param output_depth:   Bit depth to scale the input `value` to.
-    :param range_in:       Pixel range of the input `value`. No clamping is performed. See :class:`Range`.
-    :param range:          Pixel range of the output `value`. No clamping is performed. See :class:`Range`.
-    :param scale_offsets:  Whether or not to apply YUV offsets to float chroma and/or TV range integer values.
-        (When scaling a TV range value of ``16`` to float, setting this to ``True`` will return ``0.0``
-        rather than ``0.073059...``)
-    :param chroma:        Whether or not to treat values as chroma instead of luma.
 
-    :return:              Scaled numeric value.
-    """
+@lru_cache(maxsize=256)
+def _scale_params(input_depth: int,
+                  output_depth: int,
+                  range_in: Union[int, types.Range],
+                  range: Optional[Union[int, types.Range]],
+                  scale_offsets: bool,
+                  chroma: bool,
+                  ) -> _ScaleParams:
+    """Resolves the arguments of :func:`scale_value` into the operations it performs."""
     range_in = types.resolve_enum(types.Range, range_in, 'range_in', scale_value)
     range = types.resolve_enum(types.Range, range, 'range', scale_value)
     range = func.fallback(range, range_in)
@@ -174,41 +358,97 @@ def scale_value(value: Union[int, float],
     if output_depth == 32:
         range = 1
 
-    def peak_pixel_value(bits: int, range_: Union[int, types.Range], chroma_: bool) -> int:
-        """
-        _
-        """
+    if input_depth == output_depth and range_in == range:
+        return _ScaleParams(True, None, 1., None)
+
+    def peak_pixel_value(bits: int, range_: Union[int, types.Range]) -> int:
         if bits == 32:
             return 1
         if range_:
             return (1 << bits) - 1
-        return (224 if chroma_ else 219) << (bits - 8)
-
-    input_peak = peak_pixel_value(input_depth, range_in, chroma)
-
-    output_peak = peak_pixel_value(output_depth, range, chroma)
-
-    if input_depth == output_depth and range_in == range:
-        return value
+        return (224 if chroma else 219) << (bits - 8)
 
+    pre_offset = post_offset = None
     if scale_offsets:
         if output_depth == 32 and chroma:
-            value -= 128 << (input_depth - 8)
+            pre_offset = 128 << (input_depth - 8)
         elif range and not range_in:
-            value -= 16 << (input_depth - 8)
+            pre_offset = 16 << (input_depth - 8)
 
-    value *= output_peak / input_peak
-
-    if scale_offsets:
         if input_depth == 32 and chroma:
-            value += 128 << (output_depth - 8)
+            post_offset = 128 << (output_depth - 8)
         elif range_in and not range:
-            value += 16 << (output_depth - 8)
+            post_offset = 16 << (output_depth - 8)
+
+    return _ScaleParams(False, pre_offset, peak_pixel_value(output_depth, range) / peak_pixel_value(input_depth, range_in),
+                        post_offset)
+
 
+def _scale(value: Any, params: _ScaleParams) -> Any:
+    if params.identity:
+        return value
+    # Not augmented assignments, which would modify arrays in place.
+    if params.pre_offset is not None:
+        value = value - params.pre_offset
+    value = value * params.ratio
+    if params.post_offset is not None:
+        value = value + params.post_offset
     return value
 
 
-@func.disallow_variable_format
+def scale_value(value: Union[int, float, Sequence[Union[int, float]], Any],
+                input_depth: int,
+                output_depth: int,
+                range_in: Union[int, types.Range] = 0,
+                range: Optional[Union[int, types.Range]] = None,
+                scale_offsets: bool = False,
+                chroma: bool = False,
+                ) -> Union[int, float, Sequence[Union[int, float]], Any]:
+    """Scales a given numeric value between bit depths, sample types, and/or ranges.
+
+    >>> scale_value(16, 8, 32, range_in=Range.LIMITED)
+    0.0730593607305936
+    >>> scale_value(16, 8, 32, range_in=Range.LIMITED, scale_offsets=True)
+    0.0
+    >>> scale_value(16, 8, 32, range_in=Range.LIMITED, scale_offsets=True, chroma=True)
+    -0.5
+    >>> scale_value([16, 235], 8, 10)
+    [64.0, 940.0]
+
+    NumPy arrays are scaled in one vectorized operation, and lists and tuples element-wise,
+    with the same results as scaling every value on its own.
+    Float arrays and scalars keep their dtype, while integer ones are scaled like Python ints and return float64.
+
+    :param value:          Numeric value to be scaled, or a list, tuple, or NumPy array of them.
+    :param input_depth:    Bit depth of the `value` parameter. Use ``32`` for float sample type.
+    :param output_depth:   Bit depth to scale the input `value` to.
+    :param range_in:       Pixel range of the input `value`. No clamping is performed. See :class:`Range`.
+    :param range:          Pixel range of the output `value`. No clamping is performed. See :class:`Range`.
+    :param scale_offsets:  Whether or not to apply YUV offsets to float chroma and/or TV range integer values.
+        (When scaling a TV range value of ``16`` to float, setting this to ``True`` will return ``0.0``
+        rather than ``0.073059...``)
+    :param chroma:        Whether or not to treat values as chroma instead of luma.
+
+    :return:              Scaled numeric value, or a value of the same type as `value` with the scaled values.
+    """
+    params = _scale_params(input_depth, output_depth, range_in, range, scale_offsets, chroma)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_scale(v, params) for v in value)
+    if hasattr(value, '__array__') and not params.identity:
+        np = func._require_numpy(scale_value)
+        array = np.asarray(value)
+        if array.dtype.kind == 'f':
+            # Floats keep their dtype. Scalars are scaled as they are, like Python floats.
+            if array.ndim:
+                value = array
+        elif array.ndim:
+            # Integer arrays would wrap around when the offset is subtracted, while Python ints don't.
+            value = array.astype(np.float64)
+        else:
+            value = array.item()
+    return _scale(value, params)
+
+
 def get_lowest_value(clip: vs.VideoNode, chroma: bool = False) -> float:
     """Returns the lowest possible value for the combination
     of the plane type and bit depth/type of the clip as float.
@@ -218,12 +458,9 @@ def get_lowest_value(clip: vs.VideoNode, chroma: bool = False) -> float:
 
     :return:      Lowest possible value.
     """
-    is_float = clip.format.sample_type == vs.FLOAT
-
-    return -0.5 if chroma and is_float else 0.
+    return _clip_format_info(clip, get_lowest_value).lowest[bool(chroma)]
 
 
-@func.disallow_variable_format
 def get_neutral_value(clip: vs.VideoNode, chroma: bool = False) -> float:
     """Returns the neutral value for the combination
     of the plane type and bit depth/type of the clip as float.
@@ -233,12 +470,9 @@ def get_neutral_value(clip: vs.VideoNode, chroma: bool = False) -> float:
 
     :return:      Neutral value.
     """
-    is_float = clip.format.sample_type == vs.FLOAT
+    return _clip_format_info(clip, get_neutral_value).neutral[bool(chroma)]
 
-    return (0. if chroma else 0.5) if is_float else float(1 << (get_depth(clip) - 1))
 
-
-@func.disallow_variable_format
 def get_peak_value(clip: vs.VideoNode, chroma: bool = False) -> float:
     """Returns the highest possible value for the combination
     of the plane type and bit depth/type of the clip as float.
@@ -248,6 +482,4 @@ def get_peak_value(clip: vs.VideoNode, chroma: bool = False) -> float:
 
     :return:      Highest possible value.
     """
-    is_float = clip.format.sample_type == vs.FLOAT
-
-    return (0.5 if chroma else 1.) if is_float else (1 << get_depth(clip)) - 1.
+    return _clip_format_info(clip, get_peak_value).peak[bool(chroma)]
@@ -0,0 +1,186 @@
+"""
+Recording of filter graphs as serializable recipes.
+"""
+__all__ = ['Recipe', 'record']
+
+import hashlib
+import json
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import vapoursynth as vs
+
+from . import func
+
+_VERSION = 1
+
+
+class Recipe:
+    """A filter graph as a list of plugin calls, which can be serialized and built again in other processes.
+
+    Recipes are created by :func:`record`. They are plain data (see :meth:`to_json`), so they can be pickled,
+    and equal recipes have the same :attr:`digest`, so it can be used to key caches of rendered frames.
+
+    Calling a recipe builds it, so recipes without inputs can be passed to :func:`render_chunked` as the source.
+    """
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        if data.get('version') != _VERSION:
+            raise ValueError(f'Recipe: unsupported version {data.get("version")!r}.')
+        self.data = data
+
+    @property
+    def inputs(self) -> int:
+        """Number of clips that weren't created while recording and must be passed to :meth:`build`."""
+        return self.data['inputs']
+
+    def to_json(self) -> str:
+        """Returns the recipe as canonical JSON, which is identical for equal recipes."""
+        return json.dumps(self.data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, text: str) -> 'Recipe':
+        """Loads a recipe returned by :meth:`to_json`."""
+        return cls(json.loads(text))
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 hash of the canonical JSON as hexadecimal string."""
+        return hashlib.sha256(self.to_json().encode()).hexdigest()
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Recipe) and self.to_json() == other.to_json()
+
+    def __hash__(self) -> int:
+        return hash(self.to_json())
+
+    def __repr__(self) -> str:
+        return f'<Recipe {self.digest[:12]}: {len(self.data["steps"])} steps, {self.inputs} inputs>'
+
+    def build(self, *inputs: vs.VideoNode) -> Union[vs.VideoNode, List[vs.VideoNode]]:
+        """Builds the graph with the current core.
+
+        :param inputs:  Clips for the inputs of the recipe, in order.
+
+        :return:        The recorded clip, or a list of them if more than one was recorded.
+        """
+        if len(inputs) != self.inputs:
+            raise ValueError(f'Recipe.build: expected {self.inputs} input clips, got {len(inputs)}.')
+
+        results: List[Any] = []
+
+        def decode(value: Any) -> Any:
+            if isinstance(value, list):
+                return [decode(v) for v in value]
+            if isinstance(value, dict):
+                if 'input' in value:
+                    return inputs[value['input']]
+                if 'bytes' in value:
+                    return bytes.fromhex(value['bytes'])
+                result = results[value['step']]
+                return result if value.get('output') is None else result[value['output']]
+            return value
+
+        for step in self.data['steps']:
+            function = getattr(getattr(vs.core, step['plugin']), step['name'])
+            results.append(function(*decode(step['args']), **{k: decode(v) for k, v in step['kwargs'].items()}))
+
+        outputs = decode(self.data['outputs'])
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def __call__(self) -> Union[vs.VideoNode, List[vs.VideoNode]]:
+        return self.build()
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self._calls: List[Tuple[str, str, Tuple[Any, ...], Dict[str, Any]]] = []
+        # Call and output index of every node returned by a recorded call.
+        self._producers: Dict[int, Tuple[int, Optional[int]]] = {}
+        # Keeps recorded nodes alive, so that their ids aren't reused.
+        self._nodes: List[Any] = []
+
+    def __call__(self, plugin: str, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], result: Any) -> None:
+        index = len(self._calls)
+        self._calls.append((plugin, name, args, kwargs))
+        self._nodes.append(result)
+        if isinstance(result, (list, tuple)):
+            for i, node in enumerate(result):
+                self._producers.setdefault(id(node), (index, i))
+        else:
+            self._producers.setdefault(id(result), (index, None))
+
+    def recipe(self, *clips: vs.VideoNode) -> Recipe:
+        """Returns the recipe of the given clips, which only contains the calls they depend on.
+
+        Clips that weren't returned by a recorded call become inputs of the recipe.
+        """
+        if not clips:
+            raise ValueError('recipe: at least one clip is required.')
+
+        steps: List[Dict[str, Any]] = []
+        step_ids: Dict[int, int] = {}
+        inputs: Dict[int, int] = {}
+        keep_alive: List[Any] = []
+
+        def reference(node: vs.VideoNode) -> Dict[str, Any]:
+            producer = self._producers.get(id(node))
+            if producer is None:
+                if id(node) not in inputs:
+                    inputs[id(node)] = len(inputs)
+                    keep_alive.append(node)
+                return {'input': inputs[id(node)]}
+            call, output = producer
+            if call not in step_ids:
+                plugin, name, args, kwargs = self._calls[call]
+                encoded_args = [encode(v, plugin, name) for v in args]
+                encoded_kwargs = {k: encode(v, plugin, name) for k, v in sorted(kwargs.items()) if v is not None}
+                step_ids[call] = len(steps)
+                steps.append({'plugin': plugin, 'name': name, 'args': encoded_args, 'kwargs': encoded_kwargs})
+            return {'step': step_ids[call], 'output': output}
+
+        def encode(value: Any, plugin: str, name: str) -> Any:
+            if isinstance(value, vs.VideoNode):
+                return reference(value)
+            if isinstance(value, Enum):
+                value = value.value
+            if isinstance(value, vs.VideoFormat):
+                return value.id
+            if value is None or isinstance(value, (bool, int, float, str)):
+                return value
+            if isinstance(value, (bytes, bytearray)):
+                return {'bytes': bytes(value).hex()}
+            if isinstance(value, (list, tuple)):
+                return [encode(v, plugin, name) for v in value]
+            raise ValueError(f'recipe: argument {value!r} of {plugin}.{name} can not be recorded.')
+
+        outputs = [reference(clip) for clip in clips]
+        return Recipe({'version': _VERSION, 'inputs': len(inputs), 'steps': steps, 'outputs': outputs})
+
+
+@contextmanager
+def record() -> Iterator[_Recorder]:
+    """Records the calls made through :class:`function`, including those of the helpers of this package,
+    so that the resulting graph can be turned into a :class:`Recipe`.
+
+    Only calls made through :class:`function` are recorded. Clips created otherwise, e.g. by source filters
+    called through ``core``, become inputs of the recipe that have to be passed to :meth:`Recipe.build`.
+    Calls with arguments that can't be serialized, like Python functions, can't be part of a recipe.
+
+    >>> with record() as recorder:
+    ...     src = function('lsmas', 'LWLibavSource')('episode01.mkv')
+    ...     filtered = depth(get_y(src), 16)
+    >>> recipe = recorder.recipe(filtered)
+    >>> recipe.digest
+    '5f0e3a...'
+    >>> same_graph = Recipe.from_json(recipe.to_json()).build()
+
+    :return:  Context manager whose value has a ``recipe(*clips)`` method that returns the recipe of the given clips.
+    """
+    recorder = _Recorder()
+    func._call_hooks.append(recorder)
+    try:
+        yield recorder
+    finally:
+        func._call_hooks.remove(recorder)
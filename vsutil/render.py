@@ -0,0 +1,705 @@
+"""
+Functions that render clips.
+"""
+__all__ = ['bench', 'find_cut_points', 'render_chunked', 'write_raw', 'write_y4m']
+
+import ctypes
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import tempfile
+import warnings
+from collections import deque
+from contextlib import contextmanager, suppress
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import vapoursynth as vs
+
+from . import clips, frames as _frames, func, info
+
+_Bilinear = func.function('resize', 'Bilinear')
+_PlaneStats = func.function('std', 'PlaneStats')
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+
+def _peak_rss() -> Optional[int]:
+    """Returns the peak resident set size of this process in bytes, if it's available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    """Linearly interpolated percentile of sorted values."""
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _render_timed(clip: vs.VideoNode, frames: range, prefetch: int) -> Tuple[float, List[float]]:
+    """Renders the frames with up to `prefetch` requests in flight.
+
+    :return:  Total time and the time between requesting and receiving every frame, in seconds.
+    """
+    latencies: List[float] = []
+    pending: Deque[Tuple[int, float, Future]] = deque()
+    done: Dict[int, float] = {}
+
+    def request(n: int) -> None:
+        future = clip.get_frame_async(n)
+        future.add_done_callback(lambda f, n=n: done.__setitem__(n, perf_counter()))
+        pending.append((n, perf_counter(), future))
+
+    requests = iter(frames)
+    start = perf_counter()
+    for n in requests:
+        request(n)
+        if len(pending) >= prefetch:
+            break
+    while pending:
+        n, requested, future = pending.popleft()
+        future.result()
+        latencies.append(done.pop(n, perf_counter()) - requested)
+        following = next(requests, None)
+        if following is not None:
+            request(following)
+    return perf_counter() - start, latencies
+
+
+def bench(clip: Union[vs.VideoNode, Callable[[], vs.VideoNode]],
+          frames: Optional[int] = None,
+          warmup: int = 0,
+          threads: Optional[Sequence[int]] = None,
+          *,
+          output: Optional[str] = None,
+          ) -> Dict[str, Any]:
+    """Renders a clip with different numbers of threads and reports throughput, latency, and memory usage.
+
+    For every entry of `threads`, ``core.num_threads`` is set accordingly and `frames` frames are rendered
+    with as many requests in flight as there are threads. The setting is restored afterwards.
+    `warmup` frames are rendered beforehand, but not measured, and the measured frames follow them.
+
+    VapourSynth can't clear the frame caches of a clip, so every run must render frames that weren't rendered before,
+    otherwise later runs are faster due to cached frames of the clip's dependencies.
+    If `clip` is a function returning a clip, it's called before every run to build a new graph with empty caches,
+    and every run renders the same frames, starting at frame ``0``.
+    If it's a clip, the runs render consecutive ranges of it, so it must be long enough for
+    ``(warmup + frames) * len(threads)`` frames. Filters that request neighbouring frames
+    might still find a few of them cached at the start of a run.
+
+    The result only contains strings, numbers, lists, and dictionaries, so it can be written to JSON as is:
+
+    .. code-block:: python
+
+        {
+            'clip': {'width': 1920, 'height': 1080, 'format': 'YUV420P8', 'num_frames': 1000},
+            'frames': 200,
+            'warmup': 10,
+            'runs': [
+                {
+                    'threads': 1, 'fps': 52.1,
+                    'latency_ms': {'mean': 19.2, 'p50': 19.0, 'p95': 21.3, 'p99': 24.8},
+                    'peak_rss_bytes': 312344576,
+                    # Speedup over the first run divided by the increase in threads.
+                    'efficiency': 1.0,
+                },
+                ...
+            ],
+        }
+
+    ``peak_rss_bytes`` is the peak memory usage of the process so far, or ``None`` where it's not available (Windows).
+
+    >>> result = bench(lambda: denoise(core.lsmas.LWLibavSource('in.mkv')), frames=200, warmup=10, threads=[1, 2, 4, 8])
+    >>> [run['efficiency'] for run in result['runs']]
+    [1.0, 0.98, 0.93, 0.71]
+
+    :param clip:     Clip to render, or function returning the clip.
+    :param frames:   Number of frames to measure. Defaults to all frames after the warmup
+                     or, for a clip, to the frames left for each run.
+    :param warmup:   Number of frames to render before measuring.
+    :param threads:  Thread counts to measure. Defaults to the current setting of the core.
+    :param output:   Path of a file to also write the results to as JSON.
+
+    :return:         Dictionary with the results.
+    """
+    core = vs.core
+    threads = list(threads) if threads else [core.num_threads]
+    if any(t < 1 for t in threads):
+        raise ValueError('bench: thread counts must be at least 1.')
+
+    factory = None if isinstance(clip, vs.VideoNode) else clip
+    node = clip if factory is None else factory()
+    # Number of frames available to each run.
+    length = node.num_frames if factory is not None else node.num_frames // len(threads)
+    if not 0 <= warmup <= length:
+        raise ValueError(f'bench: warmup must be between 0 and the number of frames of a run ({length}).')
+    frames = func.fallback(frames, length - warmup)
+    if not 1 <= frames <= length - warmup:
+        raise ValueError(f'bench: there are only {length - warmup} frames after the warmup of a run.')
+
+    previous_threads = core.num_threads
+    runs: List[Dict[str, Any]] = []
+    try:
+        for run, count in enumerate(threads):
+            if factory is None:
+                start = run * (warmup + frames)
+            else:
+                start = 0
+                if run:
+                    node = factory()
+            core.num_threads = count
+            if warmup:
+                _render_timed(node, range(start, start + warmup), count)
+
+            elapsed, latencies = _render_timed(node, range(start + warmup, start + warmup + frames), count)
+            latencies.sort()
+            fps = frames / elapsed
+            runs.append({
+                'threads': count,
+                'fps': fps,
+                'latency_ms': {
+                    'mean': sum(latencies) / len(latencies) * 1e3,
+                    'p50': _percentile(latencies, 50) * 1e3,
+                    'p95': _percentile(latencies, 95) * 1e3,
+                    'p99': _percentile(latencies, 99) * 1e3,
+                },
+                'peak_rss_bytes': _peak_rss(),
+                'efficiency': fps / runs[0]['fps'] / (count / runs[0]['threads']) if runs else 1.,
+            })
+    finally:
+        core.num_threads = previous_threads
+
+    result = {
+        'clip': {
+            'width': node.width,
+            'height': node.height,
+            'format': node.format.name if node.format else None,
+            'num_frames': node.num_frames,
+        },
+        'frames': frames,
+        'warmup': warmup,
+        'runs': runs,
+    }
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    return result
+
+
+# Chroma subsamplings of the C tag. 4:1:0 and 4:4:0 have no tag that common readers accept.
+_Y4M_SUBSAMPLINGS = {'420', '422', '444', '411'}
+
+
+def _y4m_header(clip: vs.VideoNode) -> bytes:
+    """Returns the YUV4MPEG2 stream header of a clip."""
+    fmt = clip.format
+    if fmt is None or clip.width == 0:
+        raise ValueError('Y4M requires a constant format and size.')
+    if fmt.sample_type != vs.INTEGER or fmt.color_family not in (vs.GRAY, vs.YUV):
+        raise ValueError(f'Y4M does not support {fmt.name}.')
+
+    bits = info.get_depth(clip)
+    if fmt.color_family == vs.GRAY:
+        colorspace = 'mono' if bits == 8 else f'mono{bits}'
+    else:
+        subsampling = info.get_subsampling(clip)
+        if subsampling not in _Y4M_SUBSAMPLINGS:
+            raise ValueError(f'Y4M does not support the subsampling of {fmt.name}, '
+                             f'only {", ".join(sorted(_Y4M_SUBSAMPLINGS))}.')
+        colorspace = subsampling if bits == 8 else f'{subsampling}p{bits}'
+
+    return (f'YUV4MPEG2 W{clip.width} H{clip.height} F{clip.fps.numerator}:{clip.fps.denominator} '
+            f'Ip A0:0 C{colorspace}\n').encode()
+
+
+def _plane_buffers(frame: vs.VideoFrame) -> List[memoryview]:
+    """Returns byte views of the pixel data of a frame without padding, one per plane or per row of padded planes.
+
+    The views point into the frame's memory, so the frame must be kept alive while they're used.
+    """
+    buffers = []
+    for planeno in range(frame.format.num_planes):
+        view = memoryview(frame[planeno])
+        if view.c_contiguous:
+            buffers.append(view.cast('B'))
+            continue
+        # Rows of padded planes are written one by one instead of copying the plane with tobytes().
+        stride = frame.get_stride(planeno)
+        height, width = view.shape
+        row_size = width * view.itemsize
+        data = memoryview((ctypes.c_ubyte * (stride * (height - 1) + row_size))
+                          .from_address(frame.get_read_ptr(planeno).value)).cast('B')
+        buffers.extend(data[y * stride:y * stride + row_size] for y in range(height))
+    return buffers
+
+
+def _write_frame(file: BinaryIO, frame: vs.VideoFrame) -> None:
+    """Writes the planes of a frame without padding."""
+    file.writelines(_plane_buffers(frame))
+
+
+def _frame_size(clip: vs.VideoNode) -> int:
+    return sum(
+        width * height * clip.format.bytes_per_sample
+        for width, height in (info.get_plane_size(clip, p) for p in range(clip.format.num_planes))
+    )
+
+
+_Source = Union[str, Callable[[], vs.VideoNode]]
+
+# State of worker processes of render_chunked().
+_worker_clips: Dict[Any, vs.VideoNode] = {}
+_worker_progress: Any = None
+
+
+def _init_worker(progress: Any, threads: int) -> None:
+    global _worker_progress
+    _worker_progress = progress
+    vs.core.num_threads = threads
+
+
+def _load_clip(source: _Source, output: int) -> vs.VideoNode:
+    """Builds the graph once per worker process."""
+    key = (source, output)
+    if key not in _worker_clips:
+        if callable(source):
+            _worker_clips[key] = source()
+        else:
+            runpy.run_path(source, run_name='__vapoursynth__')
+            node = vs.get_output(output)
+            # API 4 returns a tuple of clip and alpha.
+            _worker_clips[key] = node[0] if isinstance(node, tuple) else node
+    return _worker_clips[key]
+
+
+def _describe_clip(source: _Source, output: int) -> Tuple[int, int, bytes]:
+    clip = _load_clip(source, output)
+    if clip.format is None or clip.width == 0:
+        raise ValueError('render_chunked: Variable-format and variable-resolution clips not supported.')
+    try:
+        header = _y4m_header(clip)
+    except ValueError:
+        header = b''
+    return clip.num_frames, _frame_size(clip), header
+
+
+def _render_chunk(source: _Source, output: int, start: int, end: int, path: str) -> None:
+    rendered = 0
+    try:
+        # The file is created first, as it tells render_chunked() that the chunk was started
+        # if the process crashes, even while loading the clip.
+        with open(path, 'wb') as file:
+            clip = _load_clip(source, output)
+            for frame in _frames.iter_frames(clip, start, end):
+                _write_frame(file, frame)
+                rendered += 1
+                with _worker_progress.get_lock():
+                    _worker_progress.value += 1
+    except BaseException:
+        # The chunk will be rendered again, so don't count its frames twice.
+        with _worker_progress.get_lock():
+            _worker_progress.value -= rendered
+        # Nor count it as started if it's still waiting when a worker crashes.
+        with suppress(OSError):
+            os.unlink(path)
+        raise
+
+
+def render_chunked(source: _Source,
+                   sink: Union[str, BinaryIO, Callable[[int, bytes], Any]],
+                   /,
+                   chunks: Optional[int] = None,
+                   workers: Optional[int] = None,
+                   *,
+                   boundaries: Optional[Sequence[int]] = None,
+                   y4m: Optional[bool] = None,
+                   output: int = 0,
+                   retries: int = 2,
+                   threads: Optional[int] = None,
+                   progress: Optional[Callable[[int, int], Any]] = None,
+                   tmpdir: Optional[str] = None,
+                   ) -> None:
+    """Renders a clip in multiple processes, each rendering contiguous ranges of frames, and writes the frames in order.
+
+    This scales beyond a single VapourSynth process, which is often limited by Python-bound filters
+    or single-threaded source filters.
+    Every worker process builds the graph itself, once, so `source` must be the path of a VapourSynth script
+    or a picklable function that returns the clip, i.e. one defined at the top level of a module.
+    Processes are started with the ``spawn`` method, so scripts calling this need an ``if __name__ == '__main__'`` guard.
+
+    Chunks are written to temporary files and passed to `sink` in order as soon as all preceding chunks are done.
+    Chunks that fail, including by their worker crashing, are rendered again up to `retries` times.
+    When a worker crashes, only the chunks that were already being rendered count as failed.
+
+    >>> render_chunked('episode01.vpy', 'episode01.y4m', chunks=64, workers=16,
+    ...                progress=lambda done, total: print(f'{done}/{total}', end='\\r'))
+
+    :param source:      Path of a VapourSynth script, or a function that returns the clip.
+    :param sink:        Path of the output file, a binary file object, or a function that's called with
+                        the frame number and the frame's planes without padding.
+    :param chunks:      Number of chunks of (nearly) equal size. Defaults to four times the number of workers.
+    :param workers:     Number of worker processes. Defaults to the number of CPUs.
+    :param boundaries:  Frame numbers at which chunks start, e.g. scene changes. Overrides `chunks`.
+    :param y4m:         Whether to write a YUV4MPEG2 stream instead of raw frames to files.
+                        Defaults to ``True`` for paths ending in ``.y4m``. Can't be used with a function as `sink`.
+    :param output:      Output index of the script.
+    :param retries:     How often a chunk is rendered again after failing.
+    :param threads:     Threads of the VapourSynth core of every worker. Defaults to the number of CPUs per worker.
+    :param progress:    Called with the number of rendered and total frames about twice per second.
+    :param tmpdir:      Directory for the temporary chunk files. Defaults to the system's temporary directory.
+    """
+    cpus = os.cpu_count() or 1
+    workers = func.fallback(workers, cpus)
+    if workers < 1:
+        raise ValueError('render_chunked: workers must be at least 1.')
+    if chunks is not None and chunks < 1:
+        raise ValueError('render_chunked: chunks must be at least 1.')
+    threads = func.fallback(threads, max(1, cpus // workers))
+    if y4m is None:
+        y4m = isinstance(sink, str) and sink.lower().endswith('.y4m')
+    elif y4m and not isinstance(sink, str) and not hasattr(sink, 'write'):
+        raise ValueError('render_chunked: y4m requires a path or a file as sink.')
+
+    context = multiprocessing.get_context('spawn')
+    counter = context.Value('q', 0)
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(counter, threads))
+
+    pool = new_pool()
+    try:
+        num_frames, frame_size, header = pool.submit(_describe_clip, source, output).result()
+        if y4m and not header:
+            raise ValueError('render_chunked: the clip can not be written as Y4M.')
+
+        if boundaries is None:
+            count = min(num_frames, func.fallback(chunks, workers * 4))
+            boundaries = [num_frames * i // count for i in range(count)]
+        starts = sorted(set(boundaries) | {0})
+        if starts[-1] >= num_frames or starts[0] < 0:
+            raise ValueError('render_chunked: chunk boundaries must be frame numbers of the clip.')
+        ranges = list(zip(starts, starts[1:] + [num_frames]))
+
+        with tempfile.TemporaryDirectory(prefix='vsutil-chunks-', dir=tmpdir) as directory:
+            paths = [os.path.join(directory, f'{i:06d}.raw') for i in range(len(ranges))]
+            attempts = [0] * len(ranges)
+            # Number of times a pool broke.
+            broken = 0
+            # Chunk index and pool of every pending chunk.
+            futures: Dict[Future, Tuple[int, ProcessPoolExecutor]] = {}
+
+            def submit(i: int) -> None:
+                futures[pool.submit(_render_chunk, source, output, *ranges[i], paths[i])] = (i, pool)
+
+            for i in range(len(ranges)):
+                submit(i)
+
+            with _open_sink(sink) as write:
+                if y4m:
+                    write(-1, header)
+                merged = 0
+                done = set()
+                while merged < len(ranges):
+                    finished, _ = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        i, used_pool = futures.pop(future)
+                        error = future.exception()
+                        if error is None:
+                            done.add(i)
+                            continue
+                        if isinstance(error, BrokenProcessPool):
+                            if used_pool is pool:
+                                # A worker died. Every chunk pending in this pool fails as well
+                                # and is resubmitted to the new one.
+                                pool.shutdown(wait=False)
+                                pool = new_pool()
+                                broken += 1
+                            # Only chunks that were started can have crashed the worker,
+                            # the ones still waiting in the queue don't count as failed.
+                            if os.path.exists(paths[i]):
+                                os.unlink(paths[i])
+                                attempts[i] += 1
+                            # Pools that break before any chunk starts, e.g. because workers crash on startup,
+                            # must not be recreated forever.
+                            if attempts[i] > retries or broken > sum(attempts) + retries:
+                                raise error
+                        else:
+                            attempts[i] += 1
+                            if attempts[i] > retries:
+                                raise error
+                        submit(i)
+
+                    while merged in done:
+                        start, end = ranges[merged]
+                        with open(paths[merged], 'rb') as file:
+                            for n in range(start, end):
+                                data = file.read(frame_size)
+                                write(n, b'FRAME\n' + data if y4m else data)
+                        os.unlink(paths[merged])
+                        merged += 1
+
+                    if progress is not None:
+                        # Frames of chunks whose worker crashed are counted twice, so cap it.
+                        progress(min(counter.value, num_frames), num_frames)
+    finally:
+        if sys.version_info >= (3, 9):
+            pool.shutdown(wait=True, cancel_futures=True)
+        else:
+            pool.shutdown(wait=True)
+
+
+@contextmanager
+def _open_sink(sink: Union[str, BinaryIO, Callable[[int, bytes], Any]]) -> Iterator[Callable[[int, bytes], Any]]:
+    """Turns a path, a binary file, or a callback into a function that takes a frame number and data.
+    Headers are passed with frame number ``-1`` and not passed to callbacks."""
+    if isinstance(sink, str):
+        with open(sink, 'wb') as file:
+            yield lambda n, data: file.write(data)
+    elif hasattr(sink, 'write'):
+        yield lambda n, data: sink.write(data)  # type: ignore[union-attr]
+    else:
+        yield lambda n, data: None if n < 0 else sink(n, data)  # type: ignore[operator]
+
+
+def _scene_diffs(clip: vs.VideoNode, width: int, prefetch: Optional[int]) -> Any:
+    """Returns the mean absolute difference of the downscaled luma of every frame to the previous one."""
+    y = clips.get_y(clip)
+    if y.width > width:
+        y = _Bilinear(y, width, max(2, round(y.height * width / y.width / 2) * 2))
+    previous = y[0] + y[:-1] if y.num_frames > 1 else y
+    diffs = info.get_props(_PlaneStats(y, previous), ['PlaneStatsDiff'], prefetch=prefetch)['PlaneStatsDiff']
+    diffs[0] = 0.
+    return diffs
+
+
+def find_cut_points(clip: vs.VideoNode,
+                    target_chunk_len: int,
+                    /,
+                    *,
+                    tolerance: float = 0.5,
+                    threshold: float = 0.1,
+                    width: int = 320,
+                    source_path: Optional[str] = None,
+                    prefetch: Optional[int] = None,
+                    ) -> List[int]:
+    """Splits a clip into chunks of about `target_chunk_len` frames at scene changes, e.g. for :func:`render_chunked`.
+
+    Scene changes are detected by the mean absolute difference between the luma of consecutive frames,
+    downscaled to `width` to make this fast, which is compared to `threshold`.
+    Every chunk ends at the scene change closest to the target length within the tolerance.
+    If there is none, the chunk ends where consecutive frames differ the most.
+
+    The differences can be saved to an index file next to the source, ``<source_path>.cuts.npz``,
+    so that later runs skip the analysis, even with different chunk lengths.
+    If the index can't be written, e.g. because the directory is read-only, a warning is issued.
+    The index stores the size and modification time of the source and `width`,
+    and the clip is analysed again if any of them or the number of frames differ.
+
+    Requires NumPy.
+
+    >>> boundaries = find_cut_points(src, 2000, source_path='episode01.mkv')
+    >>> render_chunked(factory, 'episode01.y4m', boundaries=boundaries)
+
+    :param clip:              Input clip.
+    :param target_chunk_len:  Preferred number of frames per chunk.
+    :param tolerance:         How much chunks may deviate from the preferred length, as a fraction of it.
+    :param threshold:         Difference between consecutive frames (between 0 and 1) that counts as a scene change.
+    :param width:             Width that the luma is downscaled to before comparing frames.
+    :param source_path:       Path of the source file. The index is read from and written next to it.
+    :param prefetch:          Maximum number of frames rendered at once. Defaults to the number of threads of the core.
+
+    :return:                  Sorted first frames of all chunks, starting with ``0``.
+    """
+    np = func._require_numpy(find_cut_points)
+    if target_chunk_len < 1:
+        raise ValueError('find_cut_points: target_chunk_len must be at least 1.')
+    if not 0 <= tolerance < 1:
+        raise ValueError('find_cut_points: tolerance must be between 0 and 1.')
+
+    index_path = None if source_path is None else f'{source_path}.cuts.npz'
+    diffs = None
+    if source_path is not None:
+        try:
+            stat = os.stat(source_path)
+            key = np.array([stat.st_mtime_ns, stat.st_size, width], np.int64)
+        except FileNotFoundError:
+            key = np.array([-1, -1, width], np.int64)
+        try:
+            with np.load(index_path) as index:
+                if np.array_equal(index['key'], key) and index['diffs'].shape == (clip.num_frames,):
+                    diffs = index['diffs']
+        except (OSError, ValueError, KeyError):
+            # Missing or not an index of this version.
+            pass
+    if diffs is None:
+        diffs = _scene_diffs(clip, width, prefetch)
+        if index_path is not None:
+            tmp = None
+            try:
+                # np.savez would append .npz to the temporary name, so write through a file object.
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(index_path)), delete=False) as f:
+                    tmp = f.name
+                    np.savez(f, diffs=diffs, key=key)
+                os.replace(tmp, index_path)
+            except OSError as e:
+                # E.g. the directory of the source is read-only, which only costs the analysis next time.
+                warnings.warn(f'find_cut_points: the index could not be written to {index_path}: {e}')
+                if tmp is not None:
+                    with suppress(OSError):
+                        os.unlink(tmp)
+
+    shortest = max(1, int(target_chunk_len * (1 - tolerance)))
+    longest = max(shortest, int(target_chunk_len * (1 + tolerance)))
+
+    boundaries = [0]
+    while clip.num_frames - boundaries[-1] > longest:
+        start = boundaries[-1]
+        # Don't leave a last chunk that's too short if that can be avoided.
+        end = min(start + longest, clip.num_frames - shortest)
+        window = np.arange(start + shortest, max(end, start + shortest) + 1)
+        window_diffs = diffs[window]
+        scene_changes = window[window_diffs >= threshold]
+        if scene_changes.size:
+            cut = scene_changes[np.argmin(np.abs(scene_changes - (start + target_chunk_len)))]
+        else:
+            cut = window[np.argmax(window_diffs)]
+        boundaries.append(int(cut))
+    return boundaries
+
+
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, OSError, ValueError):  # Windows
+    _IOV_MAX = -1
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
+
+
+def _writev(fd: int, buffers: List[memoryview]) -> None:
+    """Writes all buffers to a file descriptor with as few system calls as possible."""
+    start = 0
+    while start < len(buffers):
+        written = os.writev(fd, buffers[start:start + _IOV_MAX])
+        # Skip the buffers that were written completely and continue after the last byte written of the next one.
+        while start < len(buffers) and written >= buffers[start].nbytes:
+            written -= buffers[start].nbytes
+            start += 1
+        if written:
+            buffers[start] = buffers[start][written:]
+
+
+@contextmanager
+def _buffers_writer(file: BinaryIO) -> Iterator[Callable[[List[memoryview]], Any]]:
+    """Provides a function that writes a list of buffers to a file, with vectored I/O if possible."""
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError):
+        fd = None
+    if fd is None or not hasattr(os, 'writev'):
+        yield file.writelines
+        return
+
+    # Everything in between is written to the file descriptor directly, bypassing the file object's buffer.
+    file.flush()
+    try:
+        yield partial(_writev, fd)
+    finally:
+        if file.seekable():
+            # Buffered files cache their position, so make them look it up again.
+            file.seek(0, os.SEEK_CUR)
+
+
+def _write_clip(clip: vs.VideoNode,
+                file: Union[str, BinaryIO],
+                header: bytes,
+                frame_header: bytes,
+                prefetch: Optional[int],
+                progress: Optional[Callable[[int, int, float], Any]]) -> None:
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            _write_clip(clip, f, header, frame_header, prefetch, progress)
+        return
+
+    if hasattr(file, 'buffer'):
+        # Text streams like sys.stdout write to their binary buffer, after the text written so far.
+        file.flush()
+        file = file.buffer  # type: ignore[attr-defined]
+
+    with _buffers_writer(file) as write, _frames.iter_frames(clip, prefetch=prefetch) as frames:
+        if header:
+            write([memoryview(header)])
+        for frame in frames:
+            buffers = _plane_buffers(frame)
+            if frame_header:
+                buffers.insert(0, memoryview(frame_header))
+            write(buffers)
+            if progress is not None:
+                progress(frames.frames_done, clip.num_frames, frames.fps)
+
+
+@func.disallow_variable_format
+@func.disallow_variable_resolution
+def write_y4m(clip: vs.VideoNode,
+              file: Union[str, BinaryIO],
+              /,
+              *,
+              prefetch: Optional[int] = None,
+              progress: Optional[Callable[[int, int, float], Any]] = None,
+              ) -> None:
+    """Writes a clip as a YUV4MPEG2 stream, e.g. to pipe it into an encoder.
+
+    Frames are requested ahead like :func:`iter_frames` does, and the planes of each frame are written
+    with a single vectored write straight from the frame's memory, rather than being copied into one bytes object.
+    Padding at the end of rows is skipped.
+
+    Only constant format GRAY and YUV clips with integer samples and 4:2:0, 4:2:2, 4:4:4, or 4:1:1 subsampling
+    are supported.
+
+    >>> write_y4m(clip, sys.stdout, progress=lambda done, total, fps: print(f'{done}/{total} {fps:.2f} fps',
+    ...                                                                     end='\\r', file=sys.stderr))
+
+    :param clip:      Clip to write.
+    :param file:      Path or binary file. Text streams like ``sys.stdout`` are written to through their buffer.
+    :param prefetch:  Maximum number of frames requested ahead, see :func:`iter_frames`.
+    :param progress:  Called with the number of written and total frames and the average fps after every frame.
+    """
+    try:
+        header = _y4m_header(clip)
+    except ValueError as e:
+        raise ValueError(f'write_y4m: {e}') from None
+    _write_clip(clip, file, header, b'FRAME\n', prefetch, progress)
+
+
+@func.disallow_variable_format
+@func.disallow_variable_resolution
+def write_raw(clip: vs.VideoNode,
+              file: Union[str, BinaryIO],
+              /,
+              *,
+              prefetch: Optional[int] = None,
+              progress: Optional[Callable[[int, int, float], Any]] = None,
+              ) -> None:
+    """Writes the planes of every frame of a clip one after another without any headers or padding,
+    like :func:`write_y4m`, but for any format.
+
+    :param clip:      Clip to write.
+    :param file:      Path or binary file. Text streams like ``sys.stdout`` are written to through their buffer.
+    :param prefetch:  Maximum number of frames requested ahead, see :func:`iter_frames`.
+    :param progress:  Called with the number of written and total frames and the average fps after every frame.
+    """
+    _write_clip(clip, file, b'', b'', prefetch, progress)
@@ -0,0 +1,287 @@
+"""
+Shared memory ring buffer that hands rendered frames to other processes without copying them through a pipe.
+"""
+from __future__ import annotations
+
+__all__ = ['FrameRing']
+
+import multiprocessing
+import struct
+import sys
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import func, info
+from ._vapoursynth import vs
+
+_MAGIC = b'VSURING\0'
+_VERSION = 2
+# magic, version, number of slots, slot size, number of planes, number of frames,
+# number of frames written before the end of the stream (-1 until then)
+_HEADER = struct.Struct('<8s4Iqq')
+_END_OFFSET = _HEADER.size - 8
+# width, height, offset within the slot, numpy dtype string
+_PLANE = struct.Struct('<3I4s')
+_ALIGNMENT = 64
+
+
+def _align(value: int, alignment: int) -> int:
+    return -(-value // alignment) * alignment
+
+
+class FrameRing:
+    """Ring of frame slots in shared memory, written by a producer and read by a consumer process.
+
+    The producer creates the ring for a clip, passes it to the consumer as an argument of a
+    :class:`multiprocessing.Process` (or a pool's initializer), and then writes frames with :meth:`feed` or :meth:`put`.
+    The consumer reads them with :meth:`get` or by iterating over the ring,
+    getting NumPy views of the shared memory rather than copies.
+    The consumer doesn't need VapourSynth.
+
+    A semaphore counts the free slots and another the filled ones,
+    so the producer waits when the consumer falls behind and vice versa.
+    The end of the stream doesn't take a slot, so the producer never waits for a consumer that's gone to finish.
+    There must be only one producer and one consumer.
+
+    The memory starts with a header describing the layout of a slot (number of slots, slot size, and every plane's
+    size, offset, and dtype) and where the stream ends,
+    followed by the frame number stored in each slot, followed by the slots.
+
+    Requires NumPy.
+
+    >>> def encode(ring):
+    ...     for n, (y, u, v) in ring:
+    ...         encoder.write(y, u, v)
+    >>> with FrameRing(clip, slots=8) as ring:
+    ...     consumer = multiprocessing.Process(target=encode, args=(ring,))
+    ...     consumer.start()
+    ...     ring.feed()
+    ...     consumer.join()
+
+    :param clip:   Clip whose frames are passed through the ring.
+    :param slots:  Number of frames the ring can hold.
+
+    :ivar name:        Name of the shared memory block.
+    :ivar num_frames:  Number of frames of the clip.
+    :ivar planes:      Width, height, and dtype of every plane.
+    """
+
+    def __init__(self, clip: vs.VideoNode, /, slots: int = 4) -> None:
+        if slots < 1:
+            raise ValueError('FrameRing: slots must be at least 1.')
+        format_info = info._clip_format_info(clip, FrameRing)
+        if clip.width == 0 or clip.height == 0:
+            raise ValueError('FrameRing: Variable-resolution clips not supported.')
+        np = func._require_numpy(FrameRing)
+
+        from .frames import _plane_dtype
+        dtype = _plane_dtype(np, clip.format)
+
+        planes = []
+        slot_size = 0
+        for planeno in range(format_info.num_planes):
+            width, height = info.get_plane_size(clip, planeno)
+            planes.append((width, height, slot_size, dtype.str))
+            slot_size = _align(slot_size + width * height * dtype.itemsize, _ALIGNMENT)
+
+        header_size = _HEADER.size + _PLANE.size * len(planes)
+        frames_offset = _align(header_size, 8)
+        data_offset = _align(frames_offset + 8 * slots, _ALIGNMENT)
+
+        self.clip: Optional[vs.VideoNode] = clip
+        self._shm = SharedMemory(create=True, size=data_offset + slot_size * slots)
+        _HEADER.pack_into(self._shm.buf, 0, _MAGIC, _VERSION, slots, slot_size, len(planes), clip.num_frames, -1)
+        for planeno, plane in enumerate(planes):
+            _PLANE.pack_into(self._shm.buf, _HEADER.size + _PLANE.size * planeno,
+                             plane[0], plane[1], plane[2], plane[3].encode())
+
+        self._owner = True
+        # Semaphores of the fork context can't be passed to spawned processes, the others work with every start method.
+        context = multiprocessing.get_context('spawn')
+        self._free = context.Semaphore(slots)
+        self._filled = context.Semaphore(0)
+        try:
+            self._attach()
+        except BaseException:
+            self.close()
+            raise
+
+    def _attach(self) -> None:
+        """Reads the layout from the header of the shared memory."""
+        np = func._require_numpy(FrameRing)
+        buf = self._shm.buf
+
+        magic, version, slots, slot_size, num_planes, num_frames, _ = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f'FrameRing: {self._shm.name} is not a frame ring of this version.')
+        self.name = self._shm.name
+        self.num_frames: int = num_frames
+        self.planes: List[Tuple[int, int, Any]] = []
+        self._offsets: List[int] = []
+        for planeno in range(num_planes):
+            width, height, offset, dtype = _PLANE.unpack_from(buf, _HEADER.size + _PLANE.size * planeno)
+            self.planes.append((width, height, np.dtype(dtype.rstrip(b'\0').decode())))
+            self._offsets.append(offset)
+
+        frames_offset = _align(_HEADER.size + _PLANE.size * num_planes, 8)
+        self._slots = slots
+        self._slot_size = slot_size
+        self._data_offset = _align(frames_offset + 8 * slots, _ALIGNMENT)
+        self._slot_frames = np.ndarray((slots,), np.int64, buf, frames_offset)
+        self._end = np.ndarray((1,), np.int64, buf, _END_OFFSET)
+        # Position of the next slot to write or read and the number of frames written or read so far;
+        # the producer and the consumer each keep their own.
+        self._position = 0
+        self._count = 0
+        self._reading = False
+        self._views: Optional[List[Any]] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Semaphores can only be pickled while spawning a process, which is the only supported way to share a ring.
+        return {'name': self.name, 'free': self._free, 'filled': self._filled}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.clip = None
+        # Only the creator may free the memory, but the resource tracker would free it
+        # when this process exits if it was registered by attaching.
+        if sys.version_info >= (3, 13):
+            self._shm = SharedMemory(state['name'], track=False)
+        else:
+            self._shm = SharedMemory(state['name'])
+            resource_tracker.unregister(self._shm._name, 'shared_memory')  # type: ignore[attr-defined]
+        self._owner = False
+        self._free = state['free']
+        self._filled = state['filled']
+        self._attach()
+
+    def _slot_views(self, slot: int) -> List[Any]:
+        np = func._require_numpy(FrameRing)
+        base = self._data_offset + slot * self._slot_size
+        return [np.ndarray((height, width), dtype, self._shm.buf, base + offset)
+                for (width, height, dtype), offset in zip(self.planes, self._offsets)]
+
+    def _acquire(self, semaphore: Any, timeout: Optional[float], function: str) -> None:
+        if not semaphore.acquire(timeout=timeout):
+            raise TimeoutError(f'FrameRing.{function}: no slot became available within {timeout} seconds.')
+
+    # Producer
+
+    def put(self, frame: vs.VideoFrame, n: int, /, *, timeout: Optional[float] = None) -> None:
+        """Copies a frame into the next slot, waiting until the consumer has freed one.
+
+        :param frame:    Frame with the ring's format and size.
+        :param n:        Frame number passed on to the consumer.
+        :param timeout:  Seconds to wait for a free slot before raising :class:`TimeoutError`. Waits forever by default.
+        """
+        np = func._require_numpy(FrameRing)
+        from .frames import frame_to_array
+
+        if n < 0:
+            raise ValueError('FrameRing.put: n must not be negative.')
+        self._acquire(self._free, timeout, 'put')
+        slot = self._position
+        try:
+            for dst, src in zip(self._slot_views(slot), frame_to_array(frame)):
+                np.copyto(dst, src)
+            self._slot_frames[slot] = n
+        except BaseException:
+            self._free.release()
+            raise
+        self._position = (slot + 1) % self._slots
+        self._count += 1
+        self._filled.release()
+
+    def finish(self) -> None:
+        """Signals the end of the stream to the consumer once it has read the frames written so far.
+
+        Unlike :meth:`put`, this doesn't wait for a free slot, so it returns right away even if the consumer is gone.
+        """
+        self._end[0] = self._count
+        self._filled.release()
+
+    def feed(self, start: int = 0, end: Optional[int] = None, *, prefetch: Optional[int] = None) -> None:
+        """Renders the clip the ring was created for and writes its frames into the ring,
+        followed by the end of the stream, even if rendering fails.
+
+        :param start:     First frame to render.
+        :param end:       Frame to stop at (exclusive). Defaults to the end of the clip.
+        :param prefetch:  Maximum number of frames requested ahead, see :func:`iter_frames`.
+        """
+        if self.clip is None:
+            raise ValueError('FrameRing.feed: frames can only be fed by the process that created the ring.')
+        from .frames import iter_frames
+
+        try:
+            with iter_frames(self.clip, start, end, prefetch=prefetch) as frames:
+                for n, frame in enumerate(frames, start):
+                    self.put(frame, n)
+        finally:
+            self.finish()
+
+    # Consumer
+
+    def _release(self) -> None:
+        if self._reading:
+            self._views = None
+            self._position = (self._position + 1) % self._slots
+            self._reading = False
+            self._free.release()
+
+    def get(self, *, timeout: Optional[float] = None) -> Optional[Tuple[int, List[Any]]]:
+        """Returns the next frame written by the producer, waiting until there is one.
+
+        The arrays are read-only views of the slot and are only valid until the next call of :meth:`get`
+        or :meth:`close`, which hand the slot back to the producer. Copy them to keep them longer.
+
+        :param timeout:  Seconds to wait for a frame before raising :class:`TimeoutError`. Waits forever by default.
+
+        :return:         Frame number and arrays of its planes, or ``None`` at the end of the stream.
+        """
+        self._release()
+        self._acquire(self._filled, timeout, 'get')
+        if self._count == self._end[0]:
+            # Hand the signal back, so further calls return None as well.
+            self._filled.release()
+            return None
+
+        n = int(self._slot_frames[self._position])
+        self._count += 1
+        self._reading = True
+        self._views = self._slot_views(self._position)
+        for view in self._views:
+            view.flags.writeable = False
+        return n, self._views
+
+    def __iter__(self) -> Iterator[Tuple[int, List[Any]]]:
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self) -> None:
+        """Releases the slot being read, detaches from the shared memory, and frees it if this process created it.
+
+        Arrays returned by :meth:`get` must not be used afterwards.
+        """
+        if getattr(self, '_slot_frames', None) is not None:
+            self._release()
+        self._slot_frames = self._end = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Arrays are still referenced elsewhere, the memory is unmapped once they're gone.
+            pass
+        if self._owner:
+            self._owner = False
+            if sys.version_info < (3, 13):
+                # Consumers share the resource tracker of this process and unregistered the memory when attaching.
+                resource_tracker.register(self._shm._name, 'shared_memory')  # type: ignore[attr-defined]
+            self._shm.unlink()
+
+    def __enter__(self) -> FrameRing:
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()